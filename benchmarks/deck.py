@@ -0,0 +1,214 @@
+"""Micro-benchmarks for the deck and washer data structures
+
+Usage::
+
+   python -m benchmarks.deck [--sizes 1e3 1e4 1e5 1e6] [--out bench.json]
+
+Each benchmark reports operations per second at every deck size, and the
+results are written as JSON (tagged with the current commit) so that runs
+can be compared before and after a change with ``--compare old.json``.
+"""
+from __future__ import annotations
+from typing import Callable, Optional
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import argparse
+import gc
+import json
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+
+import discord.utils
+
+from utils.flotsam import Deck, age_minutes, due_count
+from utils.memory import Settings
+
+@dataclass
+class FakeMessage:
+   """Stand-in for `discord.Message` with only what `Deck` reads
+   """
+   id: int
+
+def snowflakes(n: int, *, minutes: float=60 * 24) -> list[int]:
+   """n increasing message IDs spread over the last few minutes
+   """
+   now = datetime.now(timezone.utc)
+   start = now - timedelta(minutes=minutes)
+   step = timedelta(minutes=minutes) / max(1, n)
+   return [discord.utils.time_snowflake(start + i * step) + (i & 0xfff) for i in range(n)]
+
+def filled(ids: list[int]) -> Deck:
+   deck = Deck()
+   for id in ids: deck.append_new(FakeMessage(id))
+   return deck
+
+def timed(setup: Callable[[], object], run: Callable[[object], int], *, repeat: int=3) -> float:
+   """Best ops/sec over a few repeats, where `run` returns the number of ops it did
+   """
+   best = 0.0
+   for _ in range(repeat):
+      state = setup()
+      gc.collect()
+      gc.disable()
+      try:
+         start = time.perf_counter()
+         ops = run(state)
+         elapsed = time.perf_counter() - start
+      finally:
+         gc.enable()
+      if elapsed > 0: best = max(best, ops / elapsed)
+   return best
+
+def bench_append_new(ids: list[int]) -> float:
+   def run(_) -> int:
+      deck = Deck()
+      for id in ids: deck.append_new(FakeMessage(id))
+      return len(ids)
+   return timed(lambda: None, run)
+
+def bench_append_old(ids: list[int]) -> float:
+   def run(_) -> int:
+      deck = Deck()
+      for id in reversed(ids): deck.append_old(FakeMessage(id))
+      return len(ids)
+   return timed(lambda: None, run)
+
+def bench_remove(ids: list[int]) -> float:
+   order = ids[:]
+   random.Random(0).shuffle(order)
+   def run(deck) -> int:
+      for id in order: deck.remove(id)
+      return len(order)
+   return timed(lambda: filled(ids), run)
+
+def bench_pop_oldest(ids: list[int]) -> float:
+   def run(deck) -> int:
+      for _ in range(len(ids)): deck.pop_oldest()
+      return len(ids)
+   return timed(lambda: filled(ids), run)
+
+def bench_bulk_delete(ids: list[int]) -> float:
+   """Same loop as `Swashbot.on_raw_bulk_message_delete`, in batches of 100
+   """
+   order = ids[:]
+   random.Random(1).shuffle(order)
+   batches = [order[i:i + 100] for i in range(0, len(order), 100)]
+   def run(deck) -> int:
+      for batch in batches:
+         for id in batch:
+            try:
+               deck.remove(id)
+            except KeyError:
+               pass
+      return len(order)
+   return timed(lambda: filled(ids), run)
+
+def inf_or(i: int) -> float:
+   return float("inf") if i % 2 else i * 10
+
+def bench_settings(ids: list[int]) -> float:
+   """The per-channel checks the watcher does, against a full deck
+   """
+   settings = [Settings(0, inf_or(i), 60 * (i % 7)) for i in range(64)]
+   deck = filled(ids)
+   rounds = 10_000
+   def run(_) -> int:
+      for i in range(rounds):
+         s = settings[i & 63]
+         if s and len(deck) > s.at_most: pass
+         if len(deck) > s.at_least and age_minutes(deck) >= s.minutes: pass
+      return rounds
+   return timed(lambda: None, run)
+
+def bench_age_scan(ids: list[int]) -> float:
+   """`due_count` over a deck where half the messages are due
+   """
+   settings = Settings(0, float("inf"), 60 * 12)
+   deck = filled(ids)
+   def run(_) -> int:
+      due_count(deck, settings)
+      return len(ids)
+   return timed(lambda: None, run)
+
+def bytes_per_message(ids: list[int]) -> float:
+   gc.collect()
+   tracemalloc.start()
+   before, _ = tracemalloc.get_traced_memory()
+   deck = filled(ids)
+   after, _ = tracemalloc.get_traced_memory()
+   tracemalloc.stop()
+   del deck
+   return (after - before) / max(1, len(ids))
+
+benchmarks = {
+   "append_new": bench_append_new,
+   "append_old": bench_append_old,
+   "remove": bench_remove,
+   "pop_oldest": bench_pop_oldest,
+   "bulk_delete": bench_bulk_delete,
+   "settings_eval": bench_settings,
+   "age_scan": bench_age_scan,
+}
+
+def current_commit() -> Optional[str]:
+   try:
+      return subprocess.run(
+         ["git", "rev-parse", "--short", "HEAD"],
+         capture_output=True, text=True, check=True,
+      ).stdout.strip()
+   except (OSError, subprocess.CalledProcessError):
+      return None
+
+def compare(old: dict, new: dict) -> None:
+   previous = {(r["name"], r["size"]): r for r in old["results"]}
+   for result in new["results"]:
+      before = previous.get((result["name"], result["size"]))
+      if before is None or not before["ops_per_sec"]: continue
+      change = result["ops_per_sec"] / before["ops_per_sec"] - 1
+      print(f"{result['name']:>14} n={result['size']:<9} {change:+7.1%}")
+
+def main() -> None:
+   parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+   parser.add_argument("--sizes", nargs="+", type=float, default=[1e3, 1e4, 1e5, 1e6],
+      help="deck sizes to benchmark (up to 1e7 if you have the memory)")
+   parser.add_argument("--only", nargs="+", choices=list(benchmarks), help="only run these benchmarks")
+   parser.add_argument("--out", type=Path, default=Path("bench.json"), help="JSON results file")
+   parser.add_argument("--compare", type=Path, help="earlier JSON results file to compare against")
+   args = parser.parse_args()
+
+   results = []
+   for size in map(int, args.sizes):
+      ids = snowflakes(size)
+      per_message = bytes_per_message(ids)
+      print(f"n={size}: {per_message:.1f} bytes per tracked message")
+      for name, bench in benchmarks.items():
+         if args.only and name not in args.only: continue
+         ops = bench(ids)
+         print(f"{name:>14} n={size:<9} {ops:>14,.0f} ops/s")
+         results.append({
+            "name": name,
+            "size": size,
+            "ops_per_sec": ops,
+            "bytes_per_message": per_message,
+         })
+
+   report = {
+      "commit": current_commit(),
+      "timestamp": datetime.now(timezone.utc).isoformat(),
+      "python": platform.python_version(),
+      "machine": platform.machine(),
+      "results": results,
+   }
+   args.out.write_text(json.dumps(report, indent=2))
+   print(f"Wrote {args.out}")
+
+   if args.compare:
+      compare(json.loads(args.compare.read_text()), report)
+
+if __name__ == "__main__":
+   main()
@@ -0,0 +1,474 @@
+"""Local stand-in for the parts of Discord's gateway and REST API Swashbot uses
+
+Serves one gateway websocket and the REST routes for channel fetches,
+history pagination, single and bulk deletes, pins, reactions and replies,
+with per-route rate-limit buckets and headers in the style of Discord's.
+Everything is kept in memory, and nothing leaves the machine.
+
+Point discord.py at it with `FakeDiscord.patch`, then log in with any token.
+"""
+from __future__ import annotations
+from typing import Any, Optional
+
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+import asyncio
+import itertools
+import json
+import time
+
+from aiohttp import web, WSMsgType
+import discord.http
+
+_discord_epoch = 1420070400000
+_bulk_delete_max_age = 14 * 24 * 60 * 60 * 1000 # milliseconds
+
+# (requests, per seconds) for each route, roughly what Discord hands out
+default_rate_limits: dict[str, tuple[int, float]] = {
+   "GET /channels/{channel_id}": (5, 1),
+   "GET /channels/{channel_id}/messages": (5, 1),
+   "GET /channels/{channel_id}/messages/{message_id}": (5, 1),
+   "DELETE /channels/{channel_id}/messages/{message_id}": (5, 1),
+   "POST /channels/{channel_id}/messages/bulk-delete": (1, 1),
+   "POST /channels/{channel_id}/messages": (5, 5),
+   "PUT /channels/{channel_id}/messages/{message_id}/reactions/{emoji}/@me": (1, 0.25),
+}
+
+def snowflake_at(ms: int, increment: int=0) -> int:
+   return ((ms - _discord_epoch) << 22) | (increment & 0xfff)
+
+def snowflake_ms(id: int) -> int:
+   return (id >> 22) + _discord_epoch
+
+def _json(data: Any, *, status: int=200, headers: Optional[dict]=None) -> web.Response:
+   # discord.py only decodes JSON when the content type is exactly application/json
+   return web.Response(body=json.dumps(data).encode(), status=status, headers=headers, content_type="application/json")
+
+def iso(ms: int) -> str:
+   return datetime.fromtimestamp(ms / 1000, timezone.utc).isoformat()
+
+@dataclass
+class Bucket:
+   limit: int
+   per: float
+   remaining: int = 0
+   reset: float = 0.0
+
+   def take(self, now: float) -> Optional[float]:
+      """Use up a request, or return how long to wait if there's none left
+      """
+      if now >= self.reset:
+         self.remaining = self.limit
+         self.reset = now + self.per
+      if self.remaining <= 0:
+         return self.reset - now
+      self.remaining -= 1
+      return None
+
+@dataclass
+class FakeChannel:
+   id: int
+   guild: int
+   name: str
+   ids: list[int] = field(default_factory=list) # sorted, may include deleted IDs
+   messages: dict[int, dict] = field(default_factory=dict)
+
+   def payload(self) -> dict:
+      return {
+         "id": str(self.id),
+         "guild_id": str(self.guild),
+         "type": 0,
+         "name": self.name,
+         "position": 0,
+         "permission_overwrites": [],
+         "nsfw": False,
+         "parent_id": None,
+         "rate_limit_per_user": 0,
+         "topic": None,
+         "last_message_id": str(self.ids[-1]) if self.ids else None,
+      }
+
+@dataclass
+class FakeGuild:
+   id: int
+   name: str
+   channels: list[int] = field(default_factory=list)
+
+class FakeDiscord:
+   """In-memory Discord
+
+   Args:
+      rate_limits: Per-route (requests, per seconds), see `default_rate_limits`
+
+   Attributes:
+      calls: Number of REST calls per route
+      limited: Number of 429 responses per route
+      deleted: Maps deleted message IDs to when they were deleted (epoch ms)
+   """
+   def __init__(self, *, rate_limits: Optional[dict[str, tuple[int, float]]]=None) -> None:
+      self.rate_limits = default_rate_limits if rate_limits is None else rate_limits
+      self.buckets: dict[tuple[str, str], Bucket] = {}
+      self.calls: Counter[str] = Counter()
+      self.limited: Counter[str] = Counter()
+      self.deleted: dict[int, int] = {}
+
+      self.guilds: dict[int, FakeGuild] = {}
+      self.channels: dict[int, FakeChannel] = {}
+      self.sockets: list[tuple[web.WebSocketResponse, int, int]] = [] # (socket, shard, shard count)
+      self.sequence = itertools.count(1)
+      self.increment = itertools.count()
+
+      self.bot = {
+         "id": str(self.next_id()),
+         "username": "swashbot",
+         "discriminator": "0",
+         "global_name": None,
+         "avatar": None,
+         "bot": True,
+      }
+      self.author = {
+         "id": str(self.next_id()),
+         "username": "beachgoer",
+         "discriminator": "0",
+         "global_name": None,
+         "avatar": None,
+      }
+
+      self.app = web.Application()
+      self.app.add_routes([
+         web.get("/gateway", self.gateway),
+         web.get("/api/v10/gateway/bot", self.get_gateway_bot),
+         web.get("/api/v10/users/@me", self.get_me),
+         web.get("/api/v10/oauth2/applications/@me", self.get_application),
+         web.get("/api/v10/channels/{channel_id}", self.get_channel),
+         web.post("/api/v10/channels/{channel_id}/typing", self.no_content),
+         web.get("/api/v10/channels/{channel_id}/messages", self.get_messages),
+         web.post("/api/v10/channels/{channel_id}/messages", self.post_message),
+         web.post("/api/v10/channels/{channel_id}/messages/bulk-delete", self.bulk_delete),
+         web.get("/api/v10/channels/{channel_id}/messages/pins", self.get_pins),
+         web.put("/api/v10/channels/{channel_id}/messages/pins/{message_id}", self.pin),
+         web.get("/api/v10/channels/{channel_id}/messages/{message_id}", self.get_message),
+         web.delete("/api/v10/channels/{channel_id}/messages/{message_id}", self.delete_message),
+         web.put("/api/v10/channels/{channel_id}/messages/{message_id}/reactions/{emoji}/@me", self.no_content),
+         web.delete("/api/v10/channels/{channel_id}/messages/{message_id}/reactions/{emoji}/{user}", self.no_content),
+      ])
+      self.app.middlewares.append(self.rate_limit)
+      self.runner: Optional[web.AppRunner] = None
+      self.url = ""
+
+   # setup
+
+   def next_id(self, ms: Optional[int]=None) -> int:
+      ms = int(time.time() * 1000) if ms is None else ms
+      return snowflake_at(ms, next(self.increment))
+
+   def add_guild(self, name: str, channels: int) -> FakeGuild:
+      guild = FakeGuild(self.next_id(), name)
+      self.guilds[guild.id] = guild
+      for i in range(channels):
+         channel = FakeChannel(self.next_id(), guild.id, f"{name}-{i}")
+         self.channels[channel.id] = channel
+         guild.channels.append(channel.id)
+      return guild
+
+   async def start(self, host: str="127.0.0.1", port: int=0) -> str:
+      """Start serving, and return the base URL
+      """
+      self.runner = web.AppRunner(self.app)
+      await self.runner.setup()
+      site = web.TCPSite(self.runner, host, port)
+      await site.start()
+      sockets = site._server.sockets # type: ignore
+      port = sockets[0].getsockname()[1]
+      self.url = f"http://{host}:{port}"
+      return self.url
+
+   async def stop(self) -> None:
+      for socket, _, _ in list(self.sockets): await socket.close()
+      if self.runner is not None: await self.runner.cleanup()
+
+   def patch(self) -> None:
+      """Point discord.py's REST client at this server
+      """
+      discord.http.Route.BASE = f"{self.url}/api/v10"
+
+   # messages
+
+   def create_message(self, channel: int, *, ms: Optional[int]=None, pinned: bool=False,
+      content: str="hello", author: Optional[dict]=None,
+   ) -> dict:
+      """Post a message (possibly back-dated), and dispatch it if ``ms`` is now
+      """
+      fake_channel = self.channels[channel]
+      id = self.next_id(ms)
+      message = {
+         "id": str(id),
+         "channel_id": str(channel),
+         "guild_id": str(fake_channel.guild),
+         "author": author or self.author,
+         "content": content,
+         "timestamp": iso(snowflake_ms(id)),
+         "edited_timestamp": None,
+         "tts": False,
+         "mention_everyone": False,
+         "mentions": [],
+         "mention_roles": [],
+         "attachments": [],
+         "embeds": [],
+         "pinned": pinned,
+         "type": 0,
+         "flags": 0,
+      }
+      if fake_channel.ids and id < fake_channel.ids[-1]:
+         fake_channel.ids.insert(bisect_left(fake_channel.ids, id), id)
+      else:
+         fake_channel.ids.append(id)
+      fake_channel.messages[id] = message
+      if ms is None:
+         self.dispatch(fake_channel.guild, "MESSAGE_CREATE", message)
+      return message
+
+   def remove_message(self, channel: FakeChannel, id: int) -> bool:
+      if channel.messages.pop(id, None) is None: return False
+      self.deleted[id] = int(time.time() * 1000)
+      return True
+
+   # gateway
+
+   def dispatch(self, guild: int, event: str, data: dict) -> None:
+      for socket, shard, shards in self.sockets:
+         if (guild >> 22) % shards != shard: continue
+         payload = {"op": 0, "t": event, "s": next(self.sequence), "d": data}
+         asyncio.create_task(socket.send_str(json.dumps(payload)))
+
+   def guild_payload(self, guild: FakeGuild) -> dict:
+      return {
+         "id": str(guild.id),
+         "name": guild.name,
+         "owner_id": self.bot["id"],
+         "unavailable": False,
+         "large": False,
+         "member_count": 2,
+         "features": [],
+         "roles": [{
+            "id": str(guild.id),
+            "name": "@everyone",
+            "permissions": str(discord.Permissions.all().value),
+            "position": 0,
+            "color": 0,
+            "hoist": False,
+            "managed": False,
+            "mentionable": False,
+         }],
+         "members": [{
+            "user": self.bot,
+            "roles": [],
+            "joined_at": iso(snowflake_ms(guild.id)),
+            "deaf": False,
+            "mute": False,
+            "flags": 0,
+         }],
+         "channels": [self.channels[channel].payload() for channel in guild.channels],
+         "threads": [],
+         "emojis": [],
+         "stickers": [],
+         "voice_states": [],
+         "presences": [],
+         "stage_instances": [],
+         "guild_scheduled_events": [],
+      }
+
+   async def gateway(self, request: web.Request) -> web.WebSocketResponse:
+      socket = web.WebSocketResponse()
+      await socket.prepare(request)
+      await socket.send_json({"op": 10, "d": {"heartbeat_interval": 41250}})
+      entry: Optional[tuple[web.WebSocketResponse, int, int]] = None
+
+      try:
+         async for frame in socket:
+            if frame.type != WSMsgType.TEXT: continue
+            message = json.loads(frame.data)
+            op = message.get("op")
+
+            if op == 1: # heartbeat
+               await socket.send_json({"op": 11})
+
+            elif op == 2: # identify
+               shard, shards = message["d"].get("shard", [0, 1])
+               guilds = [g for g in self.guilds.values() if (g.id >> 22) % shards == shard]
+               await socket.send_json({"op": 0, "t": "READY", "s": next(self.sequence), "d": {
+                  "v": 10,
+                  "user": self.bot,
+                  "guilds": [{"id": str(g.id), "unavailable": True} for g in guilds],
+                  "session_id": f"fake-{shard}",
+                  "resume_gateway_url": self.url.replace("http", "ws") + "/gateway",
+                  "application": {"id": self.bot["id"], "flags": 0},
+                  "shard": [shard, shards],
+               }})
+               for guild in guilds:
+                  await socket.send_json({"op": 0, "t": "GUILD_CREATE", "s": next(self.sequence), "d": self.guild_payload(guild)})
+               entry = (socket, shard, shards)
+               self.sockets.append(entry)
+
+            elif op == 6: # resume, which we don't support
+               await socket.send_json({"op": 9, "d": False})
+      finally:
+         if entry in self.sockets: self.sockets.remove(entry)
+
+      return socket
+
+   # REST
+
+   @web.middleware
+   async def rate_limit(self, request: web.Request, handler) -> web.StreamResponse:
+      if request.path == "/gateway": return await handler(request)
+
+      info = request.match_info
+      route = f"{request.method} {info.route.resource.canonical.removeprefix('/api/v10')}" if info.route.resource else request.path
+      self.calls[route] += 1
+
+      limit = self.rate_limits.get(route)
+      if limit is None: return await handler(request)
+
+      now = time.time()
+      major = info.get("channel_id", "")
+      bucket = self.buckets.setdefault((route, major), Bucket(*limit))
+      wait = bucket.take(now)
+      headers = {
+         "X-RateLimit-Limit": str(bucket.limit),
+         "X-RateLimit-Remaining": str(max(0, bucket.remaining)),
+         "X-RateLimit-Reset": f"{bucket.reset:.3f}",
+         "X-RateLimit-Reset-After": f"{max(0, bucket.reset - now):.3f}",
+         "X-RateLimit-Bucket": f"{abs(hash(route)):x}",
+      }
+
+      if wait is not None:
+         self.limited[route] += 1
+         headers["Retry-After"] = f"{wait:.3f}"
+         headers["X-RateLimit-Scope"] = "user"
+         return _json(
+            {"message": "You are being rate limited.", "retry_after": wait, "global": False},
+            status=429, headers=headers,
+         )
+
+      response = await handler(request)
+      response.headers.update(headers)
+      return response
+
+   def channel_or_404(self, request: web.Request) -> FakeChannel:
+      channel = self.channels.get(int(request.match_info["channel_id"]))
+      if channel is None:
+         raise web.HTTPNotFound(body=json.dumps({"message": "Unknown Channel", "code": 10003}).encode(), content_type="application/json")
+      return channel
+
+   def message_or_404(self, channel: FakeChannel, request: web.Request) -> dict:
+      message = channel.messages.get(int(request.match_info["message_id"]))
+      if message is None:
+         raise web.HTTPNotFound(body=json.dumps({"message": "Unknown Message", "code": 10008}).encode(), content_type="application/json")
+      return message
+
+   async def no_content(self, request: web.Request) -> web.Response:
+      return web.Response(status=204)
+
+   async def get_gateway_bot(self, request: web.Request) -> web.Response:
+      return _json({
+         "url": self.url.replace("http", "ws") + "/gateway",
+         "shards": 1,
+         "session_start_limit": {"total": 1000, "remaining": 1000, "reset_after": 0, "max_concurrency": 1},
+      })
+
+   async def get_me(self, request: web.Request) -> web.Response:
+      return _json(self.bot)
+
+   async def get_application(self, request: web.Request) -> web.Response:
+      return _json({
+         "id": self.bot["id"],
+         "name": self.bot["username"],
+         "description": "",
+         "icon": None,
+         "bot_public": False,
+         "bot_require_code_grant": False,
+         "verify_key": "",
+         "flags": 0,
+         "owner": self.author,
+         "team": None,
+      })
+
+   async def get_channel(self, request: web.Request) -> web.Response:
+      return _json(self.channel_or_404(request).payload())
+
+   async def get_messages(self, request: web.Request) -> web.Response:
+      channel = self.channel_or_404(request)
+      limit = min(100, int(request.query.get("limit", 50)))
+      ids = channel.ids
+      page: list[dict] = []
+
+      if "after" in request.query:
+         i = bisect_right(ids, int(request.query["after"]))
+         while i < len(ids) and len(page) < limit:
+            if ids[i] in channel.messages: page.append(channel.messages[ids[i]])
+            i += 1
+         page.reverse()
+      else:
+         i = bisect_left(ids, int(request.query["before"])) if "before" in request.query else len(ids)
+         while i > 0 and len(page) < limit:
+            i -= 1
+            if ids[i] in channel.messages: page.append(channel.messages[ids[i]])
+
+      return _json(page)
+
+   async def get_message(self, request: web.Request) -> web.Response:
+      channel = self.channel_or_404(request)
+      return _json(self.message_or_404(channel, request))
+
+   async def post_message(self, request: web.Request) -> web.Response:
+      channel = self.channel_or_404(request)
+      body = await request.json()
+      message = self.create_message(channel.id, content=body.get("content") or "", author=self.bot)
+      return _json(message)
+
+   async def delete_message(self, request: web.Request) -> web.Response:
+      channel = self.channel_or_404(request)
+      message = self.message_or_404(channel, request)
+      self.remove_message(channel, int(message["id"]))
+      self.dispatch(channel.guild, "MESSAGE_DELETE", {
+         "id": message["id"], "channel_id": str(channel.id), "guild_id": str(channel.guild),
+      })
+      return web.Response(status=204)
+
+   async def bulk_delete(self, request: web.Request) -> web.Response:
+      channel = self.channel_or_404(request)
+      ids = [int(id) for id in (await request.json()).get("messages", [])]
+      if not 2 <= len(ids) <= 100:
+         return _json({"message": "Invalid Form Body", "code": 50035}, status=400)
+      cutoff = int(time.time() * 1000) - _bulk_delete_max_age
+      if any(snowflake_ms(id) < cutoff for id in ids):
+         return _json({"message": "You can only bulk delete messages that are under 14 days old.", "code": 50034}, status=400)
+
+      deleted = [str(id) for id in ids if self.remove_message(channel, id)]
+      self.dispatch(channel.guild, "MESSAGE_DELETE_BULK", {
+         "ids": deleted, "channel_id": str(channel.id), "guild_id": str(channel.guild),
+      })
+      return web.Response(status=204)
+
+   async def get_pins(self, request: web.Request) -> web.Response:
+      channel = self.channel_or_404(request)
+      pinned = [m for m in channel.messages.values() if m["pinned"]]
+      return _json({
+         "items": [{"pinned_at": m["timestamp"], "message": m} for m in reversed(pinned)],
+         "has_more": False,
+      })
+
+   async def pin(self, request: web.Request) -> web.Response:
+      channel = self.channel_or_404(request)
+      self.message_or_404(channel, request)["pinned"] = True
+      return web.Response(status=204)
+
+   def census(self) -> dict[str, Any]:
+      return {
+         "guilds": len(self.guilds),
+         "channels": len(self.channels),
+         "messages": sum(len(c.messages) for c in self.channels.values()),
+      }
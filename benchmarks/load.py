@@ -0,0 +1,132 @@
+"""End-to-end load test of Swashbot against a local fake Discord
+
+Usage::
+
+   python -m benchmarks.load [--guilds 10] [--channels 10] [--rate 20] [--duration 120] [--out load.json]
+
+Starts `benchmarks.fakecord.FakeDiscord`, configures every fake channel to
+wash messages after ``--minutes``, runs the real `Swashbot` against it, and
+posts messages at ``--rate`` per second across random channels. At the end it
+reports deletion throughput, deletion lag (time from expiry to deletion),
+REST calls and 429s per route. Nothing touches the network.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from benchmarks.fakecord import FakeDiscord, snowflake_ms
+
+def percentile(values: list[float], p: float) -> float:
+   if not values: return float("nan")
+   values = sorted(values)
+   return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+async def run(args: argparse.Namespace) -> dict:
+   fake = FakeDiscord()
+   for i in range(args.guilds):
+      fake.add_guild(f"guild{i}", args.channels)
+   await fake.start()
+   fake.patch()
+
+   # backlog that already exists before the bot starts
+   now_ms = int(time.time() * 1000)
+   for channel in fake.channels:
+      for j in range(args.backlog):
+         fake.create_message(channel, ms=now_ms - args.minutes * 60_000 - (args.backlog - j) * 1000)
+
+   database = Path(tempfile.mkdtemp()) / "load.ltm"
+   os.environ["SWASHBOT_TOKEN"] = "fake"
+   os.environ["SWASHBOT_DATABASE"] = str(database)
+   os.environ.setdefault("SWASHBOT_LOG", "")
+
+   from main import Swashbot
+   from utils.memory import Settings
+   logging.getLogger("discord").setLevel(logging.WARNING)
+   logging.getLogger("swashbot").setLevel(args.log_level)
+
+   bot = Swashbot()
+   settings = Settings(at_least=0, at_most=float("inf"), minutes=args.minutes)
+   for channel in fake.channels.values():
+      bot.memo.save(channel.id, channel.guild, settings)
+
+   runner = asyncio.create_task(bot.start("fake"))
+   start = time.monotonic()
+   while not bot.ready:
+      if runner.done(): runner.result()
+      await asyncio.sleep(0.1)
+   warmup = time.monotonic() - start
+   print(f"Bot ready after {warmup:.1f}s, generating load for {args.duration}s...")
+
+   channels = list(fake.channels)
+   created = 0
+   begin = time.monotonic()
+   interval = 1 / args.rate if args.rate > 0 else None
+   while interval is not None and time.monotonic() - begin < args.duration:
+      fake.create_message(random.choice(channels))
+      created += 1
+      await asyncio.sleep(interval)
+
+   # let the washer catch up on what's expired
+   await asyncio.sleep(args.drain)
+   elapsed = time.monotonic() - begin
+
+   await bot.close()
+   try:
+      await asyncio.wait_for(runner, 10)
+   except (asyncio.TimeoutError, Exception):
+      pass
+   await fake.stop()
+
+   expiry_ms = args.minutes * 60 * 1000
+   lags = [(deleted - snowflake_ms(id) - expiry_ms) / 1000 for id, deleted in fake.deleted.items()]
+   census = fake.census()
+
+   return {
+      "guilds": args.guilds,
+      "channels": len(channels),
+      "rate": args.rate,
+      "minutes": args.minutes,
+      "warmup_seconds": warmup,
+      "created": created + args.backlog * len(channels),
+      "deleted": len(fake.deleted),
+      "remaining": census["messages"],
+      "deletions_per_second": len(fake.deleted) / elapsed if elapsed else 0,
+      "lag_seconds": {
+         "mean": statistics.fmean(lags) if lags else float("nan"),
+         "p50": percentile(lags, 50),
+         "p95": percentile(lags, 95),
+         "p99": percentile(lags, 99),
+         "max": max(lags, default=float("nan")),
+      },
+      "calls": dict(fake.calls),
+      "rate_limited": dict(fake.limited),
+   }
+
+def main() -> None:
+   parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+   parser.add_argument("--guilds", type=int, default=10)
+   parser.add_argument("--channels", type=int, default=10, help="channels per guild")
+   parser.add_argument("--rate", type=float, default=20, help="messages per second across all channels")
+   parser.add_argument("--minutes", type=int, default=1, help="~minutes setting for every channel")
+   parser.add_argument("--backlog", type=int, default=0, help="already-expired messages per channel at startup")
+   parser.add_argument("--duration", type=float, default=120, help="seconds of load")
+   parser.add_argument("--drain", type=float, default=90, help="seconds to keep washing after the load stops")
+   parser.add_argument("--log-level", default="WARNING", help="level for Swashbot's own logger")
+   parser.add_argument("--out", type=Path, help="write the report as JSON here")
+   args = parser.parse_args()
+
+   report = asyncio.run(run(args))
+   print(json.dumps(report, indent=2))
+   if args.out: args.out.write_text(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+   main()
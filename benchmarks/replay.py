@@ -0,0 +1,250 @@
+"""Deterministic replay of a recorded gateway trace against the washer logic
+
+Usage::
+
+   python -m benchmarks.replay swashbot.trace [--shards 1] [--throttle 0.85] [--interval 60] [--out replay.json]
+
+Feeds a trace written by `utils.trace.TraceRecorder` (``SWASHBOT_TRACE``)
+through real `Deck` objects and `due_count`, on a simulated clock, as fast
+as the CPU allows. Each shard washes its channels one request at a time,
+like `WasherCog`: due messages young enough go in bulk deletes of up to 100,
+each costing one API call and ``--bulk-seconds``, and messages past the
+14-day limit are left until the end of each pass and deleted one at a time,
+each costing ``--calls-per-delete`` API calls and ``--throttle`` seconds.
+The output is a timeline of projected deletions, API calls and backlog, for
+picking shard and node counts.
+"""
+from __future__ import annotations
+from typing import Optional
+
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import json
+
+from utils.flotsam import Deck, due_count
+from utils.purge import BULK_DELETE_LIMIT, BULK_DELETE_SECONDS, bulk_delete_cutoff, split_at_cliff
+from utils.memory import Settings
+from utils.trace import (
+   read_trace, TraceRecord,
+   MESSAGE, DELETE, BULK_DELETE, SNAPSHOT, SETTINGS, CHANNEL_GONE, GUILD_GONE,
+)
+
+_pace_seconds = 5 # same as the washer
+
+@dataclass
+class Node:
+   """Stand-in for `utils.flotsam.Message` with only what `Deck` reads
+   """
+   id: int
+
+@dataclass
+class Shard:
+   queue: deque[tuple[int, list[int], bool]] = field(default_factory=deque) # (channel, message IDs, whether it's a bulk delete)
+   busy_until: float = 0.0
+
+@dataclass
+class Bin:
+   start: float
+   deletions: int = 0
+   api_calls: int = 0
+   wasted_calls: int = 0
+   backlog: int = 0
+   events: int = 0
+
+class Simulation:
+   """Washer model driven by trace records
+
+   Args:
+      shards: Number of shards (or nodes) to partition guilds across
+      throttle: Simulated seconds each one-at-a-time deletion takes
+      calls_per_delete: API calls per one-at-a-time deletion (fetch + delete today)
+      bulk_seconds: Simulated seconds each bulk delete takes
+      interval: Seconds per timeline bin
+   """
+   def __init__(self, *, shards: int=1, throttle: float=0.85, calls_per_delete: int=2,
+      bulk_seconds: float=BULK_DELETE_SECONDS, interval: float=60,
+   ) -> None:
+      self.shard_count = shards
+      self.throttle = throttle
+      self.calls_per_delete = calls_per_delete
+      self.bulk_seconds = bulk_seconds
+      self.interval = interval
+
+      self.decks: dict[int, Deck] = {}
+      self.settings: dict[int, Settings] = {}
+      self.guilds: dict[int, int] = {}
+      self.gone: set[int] = set() # deleted by someone else while queued
+      self.shards = [Shard() for _ in range(shards)]
+      self.now = 0.0
+      self.next_tick: Optional[float] = None
+      self.timeline: list[Bin] = []
+
+   def shard_of(self, channel: int) -> Shard:
+      return self.shards[(self.guilds.get(channel, 0) >> 22) % self.shard_count]
+
+   def bin(self) -> Bin:
+      start = self.now - self.now % self.interval
+      if not self.timeline or self.timeline[-1].start != start:
+         if self.timeline: self.timeline[-1].backlog = self.backlog()
+         self.timeline.append(Bin(start))
+      return self.timeline[-1]
+
+   def backlog(self) -> int:
+      now = datetime.fromtimestamp(self.now, timezone.utc)
+      due = sum(
+         due_count(deck, self.settings[channel], now)
+         for channel, deck in self.decks.items()
+         if channel in self.settings
+      )
+      return due + sum(len(ids) for shard in self.shards for _, ids, _ in shard.queue)
+
+   def advance(self, until: float) -> None:
+      """Run deletions and watcher ticks up to a point in simulated time
+      """
+      if self.next_tick is None: self.next_tick = until
+      while True:
+         # the watcher only ticks again once every shard has finished
+         if all(not shard.queue for shard in self.shards) and self.next_tick <= until:
+            self.now = max(self.now, self.next_tick)
+            self.tick()
+            self.next_tick = self.now + _pace_seconds
+            continue
+
+         busy = [shard for shard in self.shards if shard.queue]
+         if not busy: break
+         shard = min(busy, key=lambda s: s.busy_until)
+         when = max(shard.busy_until, self.now)
+         if when > until: break
+         self.now = when
+         self.delete(shard)
+
+      self.now = max(self.now, until)
+
+   def tick(self) -> None:
+      now = datetime.fromtimestamp(self.now, timezone.utc)
+      cutoff = bulk_delete_cutoff(now)
+      due: list[tuple[int, list[int]]] = []
+      for channel, deck in self.decks.items():
+         settings = self.settings.get(channel)
+         if settings is None: continue
+         ids = [deck.pop_oldest() for _ in range(due_count(deck, settings, now))]
+         if ids: due.append((channel, ids))
+
+      # oldest first, and messages too old to bulk delete once every channel's had a turn
+      due.sort(key=lambda pair: pair[1][0])
+      stragglers: list[tuple[int, list[int]]] = []
+      for channel, ids in due:
+         shard = self.shard_of(channel)
+         young, old = split_at_cliff(ids, cutoff)
+         if not shard.queue: shard.busy_until = max(shard.busy_until, self.now)
+         for start in range(0, len(young), BULK_DELETE_LIMIT):
+            shard.queue.append((channel, young[start:start + BULK_DELETE_LIMIT], True))
+         stragglers.extend((channel, [id]) for id in old)
+      for channel, ids in stragglers:
+         shard = self.shard_of(channel)
+         if not shard.queue: shard.busy_until = max(shard.busy_until, self.now)
+         shard.queue.append((channel, ids, False))
+
+   def delete(self, shard: Shard) -> None:
+      channel, ids, bulk = shard.queue.popleft()
+      bin = self.bin()
+      gone = [id for id in ids if id in self.gone]
+      self.gone.difference_update(gone)
+      if bulk:
+         bin.deletions += len(ids) - len(gone)
+         bin.api_calls += 1
+         shard.busy_until = self.now + self.bulk_seconds
+      elif gone:
+         bin.api_calls += 1 # the fetch finds nothing
+         bin.wasted_calls += 1
+         shard.busy_until = self.now + self.throttle
+      else:
+         bin.deletions += 1
+         bin.api_calls += self.calls_per_delete
+         shard.busy_until = self.now + self.throttle
+
+   def remove(self, channel: int, ids: tuple[int, ...]) -> None:
+      deck = self.decks.get(channel)
+      for id in ids:
+         if deck is not None and id in deck.memo:
+            deck.remove(id)
+         else:
+            self.gone.add(id)
+
+   def feed(self, record: TraceRecord) -> None:
+      self.advance(record.time)
+      self.bin().events += 1
+
+      if record.kind == MESSAGE:
+         deck = self.decks.get(record.target)
+         if deck is not None: deck.append_new(Node(record.ids[0]))
+      elif record.kind in (DELETE, BULK_DELETE):
+         self.remove(record.target, record.ids)
+      elif record.kind == SNAPSHOT:
+         deck = Deck()
+         for id in record.ids: deck.append_new(Node(id))
+         self.decks[record.target] = deck
+      elif record.kind == SETTINGS:
+         assert record.settings is not None and record.guild is not None
+         self.settings[record.target] = record.settings
+         self.guilds[record.target] = record.guild
+      elif record.kind == CHANNEL_GONE:
+         self.decks.pop(record.target, None)
+         self.settings.pop(record.target, None)
+      elif record.kind == GUILD_GONE:
+         for channel, guild in list(self.guilds.items()):
+            if guild != record.target: continue
+            self.decks.pop(channel, None)
+            self.settings.pop(channel, None)
+
+   def finish(self, drain: float) -> None:
+      self.advance(self.now + drain)
+      if self.timeline: self.timeline[-1].backlog = self.backlog()
+
+def main() -> None:
+   parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+   parser.add_argument("trace", type=Path)
+   parser.add_argument("--shards", type=int, default=1, help="shards or nodes washing in parallel")
+   parser.add_argument("--throttle", type=float, default=0.85, help="seconds per one-at-a-time deletion")
+   parser.add_argument("--calls-per-delete", type=int, default=2, help="API calls per one-at-a-time deletion")
+   parser.add_argument("--bulk-seconds", type=float, default=BULK_DELETE_SECONDS, help="seconds per bulk delete")
+   parser.add_argument("--interval", type=float, default=60, help="seconds per timeline row")
+   parser.add_argument("--drain", type=float, default=0, help="simulated seconds to keep washing after the trace ends")
+   parser.add_argument("--out", type=Path, help="write the timeline as JSON here")
+   args = parser.parse_args()
+
+   simulation = Simulation(
+      shards=args.shards,
+      throttle=args.throttle,
+      calls_per_delete=args.calls_per_delete,
+      bulk_seconds=args.bulk_seconds,
+      interval=args.interval,
+   )
+   records = 0
+   for record in read_trace(args.trace):
+      simulation.feed(record)
+      records += 1
+   simulation.finish(args.drain)
+
+   timeline = [vars(row) for row in simulation.timeline]
+   print(f"{'time':>20} {'events':>8} {'deleted':>8} {'calls':>8} {'wasted':>7} {'backlog':>8}")
+   for row in timeline:
+      when = datetime.fromtimestamp(row["start"], timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+      print(f"{when:>20} {row['events']:>8} {row['deletions']:>8} {row['api_calls']:>8} {row['wasted_calls']:>7} {row['backlog']:>8}")
+
+   summary = {
+      "records": records,
+      "shards": args.shards,
+      "deletions": sum(row["deletions"] for row in timeline),
+      "api_calls": sum(row["api_calls"] for row in timeline),
+      "peak_backlog": max((row["backlog"] for row in timeline), default=0),
+      "final_backlog": timeline[-1]["backlog"] if timeline else 0,
+   }
+   print(json.dumps(summary, indent=2))
+   if args.out: args.out.write_text(json.dumps({"summary": summary, "timeline": timeline}, indent=2))
+
+if __name__ == "__main__":
+   main()
@@ -0,0 +1,69 @@
+from typing import Optional
+
+import time
+
+from discord.ext import tasks, commands
+
+from main import Swashbot
+
+_backfill_pace_seconds = 2
+_backfill_backoff_seconds = 30 # how long to stay out of the way after any request gets rate limited
+
+class BackfillCog(commands.Cog):
+   """Works through backfills (cleanups of long histories) with whatever capacity routine washing leaves spare
+
+   Backfills only run while nothing is being gathered or washed, and back
+   off for a while whenever a request gets rate limited, so routine washing
+   keeps its latency. Each page's progress is saved, so backfills pick up
+   where they left off after a restart.
+   """
+   def __init__(self, client: Swashbot) -> None:
+      self.client = client
+      self.rate_limited = self.rate_limits()
+      self.resume_at = 0.0
+      self.last_tick: Optional[float] = None
+      self.crawl.start()
+
+   def cog_unload(self) -> None:
+      self.crawl.cancel()
+
+   def rate_limits(self) -> float:
+      return sum(self.client.metrics.http_429s.values.values())
+
+   def spare(self) -> bool:
+      """Whether routine washing can spare the rate limit right now
+      """
+      now = time.monotonic()
+      rate_limited = self.rate_limits()
+      if rate_limited > self.rate_limited:
+         self.rate_limited = rate_limited
+         self.resume_at = now + _backfill_backoff_seconds
+      return self.client.busy_level == 0 and now >= self.resume_at
+
+   @tasks.loop(seconds=_backfill_pace_seconds, reconnect=True)
+   async def crawl(self) -> None:
+      """Move each of our backfills along by a page, while there's spare capacity
+      """
+      if not self.client.ready: return
+
+      now = time.monotonic()
+      elapsed = now - self.last_tick if self.last_tick is not None else 0.0
+      self.last_tick = now
+
+      memo = self.client.memo
+      for channel, backfill in list(memo.backfills.items()):
+         if not self.client.owns(channel): continue
+         if memo.settings.get(channel) != backfill.settings:
+            # the due part of history isn't what it was
+            memo.end_backfill(channel)
+            continue
+         backfill.seconds += elapsed
+
+      for backfill in list(memo.backfills.values()):
+         if not self.client.owns(backfill.channel): continue
+         if not self.spare(): return
+         async with self.client.new_task.span("backfill", channel=backfill.channel) as span:
+            span.set(count=await self.client.backfill(backfill, self.spare))
+
+async def setup(client: Swashbot) -> None:
+   await client.add_cog(BackfillCog(client))
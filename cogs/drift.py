@@ -0,0 +1,112 @@
+from typing import Optional
+
+import random
+
+import discord
+from discord.ext import tasks, commands
+
+from main import Swashbot
+
+_drift_check_minutes = 1
+_drift_channels_per_check = 5
+_drift_window = 100 # messages per sampled window, i.e. one page of history
+
+_permission_to_read = discord.Permissions(
+   view_channel=True,
+   read_message_history=True,
+)
+
+class DriftCog(commands.Cog):
+   """Keeps decks true to their channels by sampling a few pages of history at a time
+
+   Decks drift when gateway events are missed, deletions fail, or messages
+   arrive while a channel is being gathered. Rather than re-gathering whole
+   channels, each check compares a few windows of history with the deck (the
+   newest page, the page from the deck's oldest message, and a page from a
+   random point in between) and repairs just those ranges. A handful of
+   channels are checked each time, round robin, and only while nothing's
+   being gathered or washed.
+   """
+   def __init__(self, client: Swashbot) -> None:
+      self.client = client
+      self.queue: list[int] = []
+      self.drift_watch.start()
+
+   def cog_unload(self) -> None:
+      self.drift_watch.cancel()
+
+   @tasks.loop(minutes=_drift_check_minutes, reconnect=True)
+   async def drift_watch(self) -> None:
+      if not self.client.ready: return
+
+      async with self.client.new_task.span("drift") as task:
+         checked = 0
+         while checked < _drift_channels_per_check and self.client.busy_level == 0:
+            if not self.queue:
+               self.queue = [channel for channel in self.client.decks if self.client.owns(channel)]
+               random.shuffle(self.queue)
+               if not self.queue: break
+            channel = self.queue.pop()
+            if channel not in self.client.decks: continue
+            added, removed = await self.check(channel)
+            checked += 1
+            if added or removed:
+               self.client.log.info(f"{task}: Channel {channel} had drifted, so I added {added} and removed {removed} message(s) in its deck.")
+         task.set(count=checked)
+
+   async def check(self, channel: int) -> tuple[int, int]:
+      """Compare a few windows of a channel's history with its deck, and repair them
+
+      Returns:
+         tuple: (messages added, messages removed)
+      """
+      try:
+         discord_channel = await self.client.try_channel(channel)
+      except discord.NotFound:
+         return 0, 0
+      if not await self.client.check_permissions(discord_channel, _permission_to_read): return 0, 0
+
+      deck = self.client.decks.get(channel)
+      if deck is None: return 0, 0 # released meanwhile
+      windows: list[Optional[int]] = [None] # the newest page
+      if deck.oldest is not None and deck.newest is not None:
+         windows.append(deck.oldest.id - 1)
+         if deck.newest.id - deck.oldest.id > 1: windows.append(random.randint(deck.oldest.id, deck.newest.id - 1))
+
+      added = removed = 0
+      for after in windows:
+         if after is None:
+            messages = [message async for message in discord_channel.history(limit=_drift_window)]
+         else:
+            messages = [message async for message in discord_channel.history(limit=_drift_window,
+               after=discord.Object(after), oldest_first=True,
+            )]
+         self.client.metrics.drift_windows.inc()
+         if not messages: continue
+
+         # the deck may have been re-gathered meanwhile
+         if self.client.decks.get(channel) is not deck: break
+
+         ids = [message.id for message in messages]
+         # nothing newer than the newest message fetched can be judged, since
+         # it may have arrived since; a short newest page covers all history
+         high = max(ids)
+         if after is not None: low = after + 1
+         elif len(messages) < _drift_window: low = 0
+         else: low = min(ids)
+
+         # messages already popped from the deck to be deleted aren't missing from it
+         wanted = [
+            message.id for message in messages
+            if not message.pinned and message.id not in self.client.pending_due and message.id not in self.client.washing
+         ]
+         window_added, window_removed = deck.reconcile(low, high, wanted)
+         added += window_added
+         removed += window_removed
+
+      if added: self.client.metrics.deck_drift.inc(added, kind="missing")
+      if removed: self.client.metrics.deck_drift.inc(removed, kind="extra")
+      return added, removed
+
+async def setup(client: Swashbot) -> None:
+   await client.add_cog(DriftCog(client))
@@ -5,12 +5,11 @@ import asyncio
 
 import discord
 from discord.ext import commands
+from discord import app_commands
 
 from main import Swashbot, SwashbotMessageable
 from utils.memory import Settings
-
-# TODO: there's lots of repeated code in here, hard to navigate
-# Especially the cumbersome emoji reaction logic
+from utils.purge import PurgeFilter, washes_after_cliff, format_deadline
 
 _permissions_to_message = discord.Permissions(
    send_messages=True,
@@ -38,8 +37,27 @@ def _requires_manage_messages(perms: discord.Permissions, the_channel: str) -> O
 
    return f"You don't have the **Manage Messages** permission for {the_channel}"
 
+def _parse_count(value: str) -> Optional[float]:
+   """Parse a command argument that's either a whole number or infinity
+   """
+   if value.lower() in ("inf", "infinity"): return inf
+   if value.isdigit(): return int(value)
+   return None
+
+class WaveFilters(commands.FlagConverter):
+   """Optional filters for `~wave`, e.g. ``~wave 500 author: @someone attachments: yes``
+   """
+   author: Optional[discord.User] = commands.flag(default=None, description="only messages by this user")
+   bots: bool = commands.flag(default=False, description="only messages by bots")
+   attachments: bool = commands.flag(default=False, description="only messages with attachments")
+   before: Optional[str] = commands.flag(default=None, description="only messages before this message ID")
+   after: Optional[str] = commands.flag(default=None, description="only messages after this message ID")
+
 class FrontCog(commands.Cog):
    """Cog that handles the user commands
+
+   Each command answers with as few REST calls as it can (see `respond`),
+   since they share a rate limit budget with the washer.
    """
    def __init__(self, client: Swashbot) -> None:
       self.client = client
@@ -52,13 +70,34 @@ class FrontCog(commands.Cog):
    async def check_flotsam(self, channel: int) -> int:
       # nothing to do
       if channel not in self.client.memo.settings:
-         if channel in self.client.decks:
-            del self.client.decks[channel]
+         self.client.release(channel)
          return 0
 
       # need to re-gather
       return await self.client.gather_flotsam(channel)
 
+   async def respond(self, ctx: commands.Context, *, reaction: Optional[str]=None, reply: Optional[str]=None,
+      embed: Optional[discord.Embed]=None,
+   ) -> None:
+      """Answer a command with a single call
+
+      Slash commands always get a reply, since Discord expects one. Prefix
+      commands get the reply if there is one, and otherwise just the reaction.
+
+      Parameters:
+         ctx: Command context
+         reaction: Emoji to react with
+         reply: Text to reply with
+         embed: Embed to go with the reply
+      """
+      try:
+         if ctx.interaction is None and reply is None and embed is None:
+            if reaction is not None: await ctx.message.add_reaction(reaction)
+         else:
+            await ctx.reply(reply or reaction, embed=embed)
+      except (discord.Forbidden, discord.NotFound):
+         pass
+
    async def check_user_permissions(self,
       ctx: commands.Context,
       channel: Optional[int],
@@ -87,20 +126,43 @@ class FrontCog(commands.Cog):
          discord_channel = await self.client.try_channel(channel)
       guild = discord_channel.guild.id
 
+      # read the guild in if it hasn't been yet, e.g. before every shard is ready
+      self.client.load_guilds([discord_channel.guild])
+
       if not the_channel: the_channel = discord_channel.mention
       perms = discord_channel.permissions_for(ctx.author)
 
       error_msg = check(perms, the_channel)
       if error_msg:
-         async with ctx.typing(): await asyncio.sleep(1)
-         try:
-            await ctx.reply(error_msg)
-         except discord.NotFound:
-            pass
+         await self.respond(ctx, reply=error_msg)
          return None
 
       return guild
 
+   async def update_settings(self, ctx: commands.Context, channel: Optional[int], guild: int, settings: Settings, done: str) -> None:
+      """Save new settings for a channel, re-gather it and say so
+
+      Parameters:
+         ctx: Command context
+         channel: Channel ID from command arg, if provided
+         guild: Guild ID of the channel
+         settings: The new settings
+         done: What to reply with for slash commands
+      """
+      assert isinstance(ctx.channel, SwashbotMessageable)
+      if channel is None: channel = ctx.channel.id
+
+      if settings:
+         if not await self.client.check_permissions(ctx.channel, _permissions_for_settings_commands, inform=ctx.message):
+            return
+
+      self.client.memo.save(channel, guild, settings)
+      # the answer doesn't depend on the gather, so don't wait for it
+      await asyncio.gather(
+         self.check_flotsam(channel),
+         self.respond(ctx, reaction="👌", reply=f"Done! `{done}`" if ctx.interaction else None),
+      )
+
    @commands.hybrid_command(name="sink", description="re-sync messages for the channel")
    async def slash_sink(self, ctx: commands.Context, channel: Optional[int]=None) -> None:
       if not isinstance(ctx.channel, SwashbotMessageable): return
@@ -108,24 +170,12 @@ class FrontCog(commands.Cog):
       if guild is None: return
       if channel is None: channel = ctx.channel.id
 
-      if ctx.message:
-         try:
-            await ctx.message.add_reaction("⏲️")
-         except (discord.Forbidden, discord.NotFound):
-            pass
-
+      await ctx.defer()
       count = await self.check_flotsam(channel)
 
-      if ctx.message:
-         try:
-            if self.client.user is not None:
-               await ctx.message.remove_reaction("⏲️", self.client.user)
-            await ctx.message.add_reaction("👌")
-         except (discord.Forbidden, discord.NotFound):
-            pass
-
-      if ctx.interaction:
-         await ctx.reply(f"Found {count} message" + ("s!" if count != 1 else "!"))
+      await self.respond(ctx, reaction="👌", reply=(
+         f"Found {count} message" + ("s!" if count != 1 else "!")
+      ) if ctx.interaction else None)
 
    @commands.hybrid_command(name="atleast", description="always keep the `m` most recent messages in the channel")
    async def slash_atleast(self, ctx: commands.Context, m: str, channel: Optional[int]=None) -> None:
@@ -133,41 +183,17 @@ class FrontCog(commands.Cog):
       guild = await self.check_user_permissions(ctx, channel, _requires_manage_channel_and_manage_messages)
       if guild is None: return
 
-      try:
-         await ctx.message.add_reaction("👀")
-      except (discord.NotFound, discord.Forbidden):
-         pass
-
-      if channel is None: channel = ctx.channel.id
-      settings = self.client.memo.load(channel)
-
-      if m.lower() in ("inf", "infinity"):
-         at_least = inf
-      elif m.isdigit():
-         at_least = int(m)
-      else:
+      at_least = _parse_count(m)
+      if at_least is None:
+         await self.respond(ctx, reaction="🤔", reply=f"`{m}` isn't a number of messages" if ctx.interaction else None)
          return
+
+      settings = self.client.memo.load(channel if channel is not None else ctx.channel.id, guild)
       # at_least parameter can bump up the at_most parameter
       at_most = max(settings.at_most, at_least)
       settings = settings.replace(at_least=at_least, at_most=at_most)
 
-      if settings:
-         if not await self.client.check_permissions(ctx.channel, _permissions_for_settings_commands, inform=ctx.message):
-            return
-
-      self.client.memo.save(channel, guild, settings)
-      await self.check_flotsam(channel)
-
-      if ctx.message:
-         try:
-            if self.client.user is not None:
-               await ctx.message.remove_reaction("👀", self.client.user)
-            await ctx.message.add_reaction("👌")
-         except discord.NotFound:
-            pass
-
-      if ctx.interaction:
-         await ctx.reply(f"Done! `at_least = {settings.at_least}`")
+      await self.update_settings(ctx, channel, guild, settings, f"at_least = {settings.at_least}")
 
    @commands.hybrid_command(name="atmost", description="deletes the oldest messages in the channel if the channel message count goes over `m`")
    async def slash_atmost(self, ctx: commands.Context, m: str, channel: Optional[int]=None) -> None:
@@ -175,41 +201,17 @@ class FrontCog(commands.Cog):
       guild = await self.check_user_permissions(ctx, channel, _requires_manage_channel_and_manage_messages)
       if guild is None: return
 
-      try:
-         await ctx.message.add_reaction("👀")
-      except (discord.NotFound, discord.Forbidden):
-         pass
-
-      if channel is None: channel = ctx.channel.id
-      settings = self.client.memo.load(channel)
-
-      if m.lower() in ("inf", "infinity"):
-         at_most = inf
-      elif m.isdigit():
-         at_most = int(m)
-      else:
+      at_most = _parse_count(m)
+      if at_most is None:
+         await self.respond(ctx, reaction="🤔", reply=f"`{m}` isn't a number of messages" if ctx.interaction else None)
          return
+
+      settings = self.client.memo.load(channel if channel is not None else ctx.channel.id, guild)
       # at_most parameter can bump down the at_least parameter
       at_least = min(settings.at_least, at_most)
       settings = settings.replace(at_least=at_least, at_most=at_most)
 
-      if settings:
-         if not await self.client.check_permissions(ctx.channel, _permissions_for_settings_commands, inform=ctx.message):
-            return
-
-      self.client.memo.save(channel, guild, settings)
-      await self.check_flotsam(channel)
-
-      if ctx.message:
-         try:
-            if self.client.user is not None:
-               await ctx.message.remove_reaction("👀", self.client.user)
-            await ctx.message.add_reaction("👌")
-         except discord.NotFound:
-            pass
-
-      if ctx.interaction:
-         await ctx.reply(f"Done! `at_most = {settings.at_most}`")
+      await self.update_settings(ctx, channel, guild, settings, f"at_most = {settings.at_most}")
 
    @commands.hybrid_command(name="minutes", description="set messages to wash away each after `t` seconds")
    async def slash_minutes(self, ctx: commands.Context, t: str, channel: Optional[int]=None) -> None:
@@ -217,57 +219,129 @@ class FrontCog(commands.Cog):
       guild = await self.check_user_permissions(ctx, channel, _requires_manage_channel_and_manage_messages)
       if guild is None: return
 
-      try:
-         await ctx.message.add_reaction("👀")
-      except (discord.NotFound, discord.Forbidden):
-         pass
+      minutes = _parse_count(t)
+      if minutes is None:
+         await self.respond(ctx, reaction="🤔", reply=f"`{t}` isn't a number of minutes" if ctx.interaction else None)
+         return
 
-      if channel is None: channel = ctx.channel.id
-      settings = self.client.memo.load(channel)
+      settings = self.client.memo.load(channel if channel is not None else ctx.channel.id, guild)
+      settings = settings.replace(minutes=minutes)
 
-      if t.lower() in ("inf", "infinity"):
-         minutes = inf
-      elif t.isdigit():
-         minutes = int(t)
+      await self.update_settings(ctx, channel, guild, settings, f"minutes = {settings.minutes}")
+
+   @commands.hybrid_command(name="default", description="set defaults for the server or this category, e.g. `default server 10 200 120`")
+   @app_commands.describe(
+      scope="server, category, or channel (to make this channel follow the defaults again)",
+      at_least="like `atleast`, or `off` to clear the default",
+      at_most="like `atmost`",
+      minutes="like `minutes`",
+   )
+   async def slash_default(self, ctx: commands.Context, scope: str, at_least: str="inf", at_most: str="inf", minutes: str="inf") -> None:
+      if not isinstance(ctx.channel, SwashbotMessageable): return
+      if not isinstance(ctx.author, discord.Member): return
+      discord_guild = ctx.channel.guild
+      memo = self.client.memo
+
+      scope = scope.lower()
+      if scope == "channel":
+         guild = await self.check_user_permissions(ctx, None, _requires_manage_channel_and_manage_messages)
+         if guild is None: return
+         changed = [ctx.channel.id] if memo.clear(ctx.channel.id, guild) else []
+         await asyncio.gather(
+            self.client.regather(changed),
+            self.respond(ctx, reaction="👌", reply="Done! This channel follows the defaults again" if ctx.interaction else None),
+         )
+         return
+
+      if scope == "server":
+         target = discord_guild.id
+         perms = ctx.author.guild_permissions
+         the_scope = "this server"
+      elif scope == "category":
+         category = ctx.channel.category
+         if category is None:
+            await self.respond(ctx, reply="This channel isn't in a category")
+            return
+         target = category.id
+         perms = category.permissions_for(ctx.author)
+         the_scope = f"the **{category.name}** category"
       else:
+         await self.respond(ctx, reaction="🤔", reply="Use `server`, `category` or `channel`" if ctx.interaction else None)
          return
-      settings = settings.replace(minutes=minutes)
 
-      if settings:
-         if not await self.client.check_permissions(ctx.channel, _permissions_for_settings_commands, inform=ctx.message):
+      error_msg = _requires_manage_channel_and_manage_messages(perms, the_scope)
+      if error_msg:
+         await self.respond(ctx, reply=error_msg)
+         return
+
+      settings: Optional[Settings] = None
+      if at_least.lower() != "off":
+         values = [_parse_count(value) for value in (at_least, at_most, minutes)]
+         if None in values:
+            await self.respond(ctx, reaction="🤔", reply="Those don't look like numbers" if ctx.interaction else None)
             return
+         least, most, mins = values
+         assert least is not None and most is not None and mins is not None
+         settings = Settings(least, max(least, most), mins)
+
+      await ctx.defer()
+      self.client.place_guild(discord_guild)
+      changed = memo.set_policy(target, discord_guild.id, settings)
+
+      what = "cleared" if settings is None else "set"
+      await asyncio.gather(
+         self.client.regather(changed),
+         self.respond(ctx, reply=f"Done! The default for {the_scope} is {what}, which changed **{len(changed)}** channel(s)."),
+      )
 
-      self.client.memo.save(channel, guild, settings)
-      await self.check_flotsam(channel)
+   @commands.hybrid_command(name="archive", description="keep a record of messages washed away from the channel (`on` or `off`)")
+   async def slash_archive(self, ctx: commands.Context, state: str, channel: Optional[int]=None) -> None:
+      if not isinstance(ctx.channel, SwashbotMessageable): return
+      guild = await self.check_user_permissions(ctx, channel, _requires_manage_channel_and_manage_messages)
+      if guild is None: return
 
-      if ctx.message:
-         try:
-            if self.client.user is not None:
-               await ctx.message.remove_reaction("👀", self.client.user)
-            await ctx.message.add_reaction("👌")
-         except (discord.NotFound, discord.Forbidden):
-            pass
+      archiver = self.client.archiver
+      if archiver is None:
+         await self.respond(ctx, reply="Archiving isn't enabled for me (`SWASHBOT_ARCHIVE`)")
+         return
 
-      if ctx.interaction:
-         await ctx.reply(f"Done! `minutes = {settings.minutes}`")
+      state = state.lower()
+      if state not in ("on", "off"):
+         await self.respond(ctx, reaction="🤔", reply="Use `on` or `off`" if ctx.interaction else None)
+         return
+
+      if channel is None: channel = ctx.channel.id
+      archive = state == "on"
+      was = channel in self.client.memo.archived
+      self.client.memo.set_archive(channel, guild, archive)
+
+      if archive and not was:
+         # contents of messages already in the deck need remembering
+         await asyncio.gather(
+            self.check_flotsam(channel),
+            self.respond(ctx, reaction="👌", reply="Done! Messages washed away from here will be archived" if ctx.interaction else None),
+         )
+      else:
+         if not archive: archiver.forget(channel)
+         await self.respond(ctx, reaction="👌", reply=f"Done! Archiving is {state}" if ctx.interaction else None)
 
    @commands.hybrid_command(name="wave", description="wash away `n` of the most recent messages in the channel")
-   async def slash_wave(self, ctx: commands.Context, n: int=100, channel: Optional[int]=None):
+   async def slash_wave(self, ctx: commands.Context, n: int=100, channel: Optional[int]=None, *, filters: WaveFilters):
 
       if n < 0:
-         if ctx.message:
-            try:
-               await ctx.message.add_reaction("🤔")
-            except (discord.Forbidden, discord.NotFound):
-               pass
+         await self.respond(ctx, reaction="🤔")
          return
 
+      bounds = []
+      for bound in (filters.before, filters.after):
+         if bound is not None and not bound.isdigit():
+            await self.respond(ctx, reaction="🤔", reply=f"`{bound}` isn't a message ID" if ctx.interaction else None)
+            return
+         bounds.append(int(bound) if bound is not None else None)
+      before, after = bounds
+
       if n == 0:
-         if ctx.message:
-            try:
-               await ctx.message.add_reaction("👋")
-            except (discord.Forbidden, discord.NotFound):
-               pass
+         await self.respond(ctx, reaction="👋")
          return
 
       if not isinstance(ctx.channel, SwashbotMessageable): return
@@ -283,28 +357,29 @@ class FrontCog(commands.Cog):
       if not await self.client.check_permissions(discord_channel, _permission_to_delete, inform=ctx.message):
          return
 
-      if ctx.message:
-         try:
-            await ctx.message.add_reaction("⏲️")
-            await ctx.message.add_reaction("🌊")
-         except (discord.Forbidden, discord.NotFound):
-            pass
+      await ctx.defer()
+      purge_filter = PurgeFilter(
+         author=filters.author.id if filters.author is not None else None,
+         bots=filters.bots,
+         attachments=filters.attachments,
+      )
 
-      await self.client.delete_messages(channel, limit=n, beside=ctx.message.id)
+      if ctx.interaction:
+         deleted = await self.client.delete_messages(channel, limit=n, before=before, after=after, filter=purge_filter)
+         await self.respond(ctx, reply=f"Done! Washed away {deleted} message" + ("s" if deleted != 1 else ""))
+         return
 
-      if ctx.message:
+      # the command message goes in the same bulk delete, if it's in the channel being washed
+      in_place = channel == ctx.channel.id
+      await self.client.delete_messages(channel, limit=n, before=before, after=after, filter=purge_filter,
+         include=ctx.message.id if in_place else None,
+      )
+      if not in_place:
          try:
-            if self.client.user is not None:
-               await ctx.message.remove_reaction("⏲️", self.client.user)
-               await ctx.message.remove_reaction("🌊", self.client.user)
-            await ctx.message.add_reaction("👌")
-            await ctx.message.delete(delay=1)
+            await ctx.message.delete()
          except (discord.Forbidden, discord.NotFound):
             pass
 
-      if ctx.interaction:
-         await ctx.reply(f"Done!")
-
    @commands.hybrid_command(name="current", description="get current channel settings")
    async def slash_current(self, ctx: commands.Context, channel: Optional[int]=None):
       if not isinstance(ctx.channel, SwashbotMessageable): return
@@ -312,8 +387,7 @@ class FrontCog(commands.Cog):
       if guild is None: return
 
       if channel is None: channel = ctx.channel.id
-      settings = Settings() if not channel in self.client.memo.settings \
-         else self.client.memo.settings[channel]
+      settings, source = self.client.memo.resolve(channel, guild)
 
       if not await self.client.check_permissions(ctx.channel, _permissions_to_message, inform=ctx.message):
          return
@@ -329,14 +403,60 @@ class FrontCog(commands.Cog):
       ).strip()
 
       status = str(settings)
+      if settings and washes_after_cliff(settings.minutes):
+         status += "\n\n⚠️ Messages are at least 14 days old by then, so I'll have to delete them one at a time, which is slow."
+      risk = self.client.cliff_risks.get(channel)
+      if risk is not None:
+         status += f"\n\n⚠️ I'm behind here: **{risk.young + risk.past}** message(s) are due, and some are close to or past 14 days old."
+
+      title = "Current settings for this channel"
+      if source in ("server", "category"): title += f" (from the {source} default)"
 
       embed = discord.Embed(
-         title="Current settings for this channel",
+         title=title,
          description=status,
          color=self.client.color
       )
+      if channel in self.client.memo.archived:
+         embed.set_footer(text="Messages washed away from here are archived.")
+
+      await self.respond(ctx, reply=content, embed=embed)
+
+   @commands.hybrid_command(name="backfill", description="see how cleanups of long channel histories are going in this server")
+   async def slash_backfill(self, ctx: commands.Context) -> None:
+      if not isinstance(ctx.channel, SwashbotMessageable): return
+      guild = await self.check_user_permissions(ctx, None, _requires_manage_messages)
+      if guild is None: return
+
+      if not await self.client.check_permissions(ctx.channel, _permissions_to_message, inform=ctx.message):
+         return
+
+      backfills = sorted(
+         (backfill for backfill in self.client.memo.backfills.values() if backfill.guild == guild),
+         key=lambda backfill: backfill.progress,
+      )
+      if not backfills:
+         await self.respond(ctx, reply="There are no long histories left to wash away here 🌊")
+         return
+
+      lines = []
+      for backfill in backfills[:20]:
+         eta = backfill.eta
+         lines.append(
+            f"* <#{backfill.channel}>: **{backfill.progress:.0%}** of the way back, "
+            f"**{backfill.deleted}** message(s) washed away, "
+            + (f"about **{format_deadline(eta)}** to go" if eta is not None else "just getting started")
+         )
+      if len(backfills) > 20: lines.append(f"* ...and {len(backfills) - 20} more")
+
+      embed = discord.Embed(
+         title="Washing away long histories",
+         description="\n".join(lines),
+         color=self.client.color
+      )
+      embed.set_footer(text="These only use what's left over from routine washing, so they can take a while.")
 
-      await ctx.reply(content, embed=embed)
+      await self.respond(ctx, embed=embed)
 
 async def setup(client: Swashbot) -> None:
    await client.add_cog(FrontCog(client))
\ No newline at end of file
@@ -0,0 +1,22 @@
+from discord.ext import tasks, commands
+
+from main import Swashbot
+from config import lease_seconds
+
+class LeaseCog(commands.Cog):
+   """Keeps this instance's guild leases alive when sharing a database with other instances
+   """
+   def __init__(self, client: Swashbot) -> None:
+      self.client = client
+      if self.client.leases is not None:
+         self.heartbeat.start()
+
+   def cog_unload(self) -> None:
+      self.heartbeat.cancel()
+
+   @tasks.loop(seconds=lease_seconds / 3, reconnect=True)
+   async def heartbeat(self) -> None:
+      await self.client.rebalance()
+
+async def setup(client: Swashbot) -> None:
+   await client.add_cog(LeaseCog(client))
@@ -0,0 +1,33 @@
+from discord.ext import tasks, commands
+
+from main import Swashbot
+
+_orphan_sweep_minutes = 15
+
+class LifecycleCog(commands.Cog):
+   """Sweeps away per-channel state left behind for channels that aren't ours to wash any more
+
+   State is normally released as soon as a channel is deleted, cleared or
+   handed to another instance, but events get missed, so this makes sure a
+   process that's up for weeks doesn't slowly fill up with it anyway.
+   """
+   def __init__(self, client: Swashbot) -> None:
+      self.client = client
+      self.sweep.start()
+
+   def cog_unload(self) -> None:
+      self.sweep.cancel()
+
+   @tasks.loop(minutes=_orphan_sweep_minutes, reconnect=True)
+   async def sweep(self) -> None:
+      if not self.client.ready: return
+
+      async with self.client.new_task.span("lifecycle.sweep") as task:
+         swept = self.client.sweep_orphans()
+         task.set(count=sum(swept.values()))
+         if any(swept.values()):
+            counts = ", ".join(f"{count} {name}" for name, count in swept.items() if count)
+            self.client.log.warning(f"{task}: Dropped leftover state for channels that aren't ours to wash: {counts}.")
+
+async def setup(client: Swashbot) -> None:
+   await client.add_cog(LifecycleCog(client))
@@ -7,12 +7,27 @@ from discord.ext import commands
 from discord import app_commands
 
 from main import Swashbot
+from utils.flotsam import due_count
+from utils.metrics import percentiles
+from utils.profiler import SamplingProfiler
+from utils.resources import rss_bytes, format_bytes
+
+_profile_max_seconds = 600
 
 class MetaCog(commands.Cog):
    """TODO: replace with a help formatter
    """
    def __init__(self, client: Swashbot) -> None:
       self.client = client
+      self.profiler: Optional[SamplingProfiler] = None
+      self.profile_deadline: Optional[asyncio.Task] = None
+      self.last_profile: Optional[Path] = None
+
+   async def cog_unload(self) -> None:
+      if self.profile_deadline is not None:
+         self.profile_deadline.cancel()
+      if self.profiler is not None and self.profiler.running:
+         await self.finish_profile()
 
    @commands.hybrid_command(name="help", description="share a help leaflet")
    async def slash_help(self, ctx: commands.Context) -> None:
@@ -29,6 +44,14 @@ class MetaCog(commands.Cog):
          f"`{p}current`: Display current settings for this channel\n"
          f"`{p}minutes 120`: Messages wash away after 120 minutes\n"
          f"`{p}wave`: Wash away the last 100 messages\n"
+         f"`{p}backfill`: See how washing away long histories is going\n"
+      )
+
+      help_defaults = (
+         f"`{p}default server 10 200 120`: Settings for every channel in the server\n"
+         f"`{p}default category 0 inf 60`: Settings for every channel in this category\n"
+         f"`{p}default channel`: Make this channel follow the defaults again\n"
+         f"`{p}default server off`: Clear the server's defaults\n"
       )
 
       embed = discord.Embed(
@@ -49,6 +72,12 @@ class MetaCog(commands.Cog):
          inline=False
       )
 
+      embed.add_field(
+         name="Defaults",
+         value=help_defaults.strip(),
+         inline=False
+      )
+
       await ctx.message.reply(embed=embed)
 
    @commands.hybrid_command(name="stats", description="get statistics")
@@ -68,7 +97,46 @@ class MetaCog(commands.Cog):
          f"* in **{len(self.client.memo.channels)}** server(s)",
          f"* **{self.client.messages_deleted}** message(s) deleted",
          f"* at a rate of **{self.client.deletion_rate}**",
+         f"* **{self.client.messages_ingested}** message(s) ingested",
+         f"* at a rate of **{self.client.ingest_rate}**",
+         f"* **{format_bytes(rss_bytes())}** RSS under the **{self.client.profile}** profile",
       ]
+      pool = self.client.deletion_pool
+      if pool is not None:
+         statistics.append(f"* **{len(pool)}** deletion worker(s) with **{pool.pending}** message(s) queued")
+      archiver = self.client.archiver
+      if archiver is not None:
+         statistics.append(
+            f"* **{archiver.written}** message(s) archived from **{len(self.client.memo.archived)}** channel(s), "
+            f"**{archiver.queue.qsize()}** queued, writer fell behind **{archiver.stalls}** time(s)"
+         )
+      backfills = self.client.memo.backfills
+      if backfills:
+         statistics.append(
+            f"* **{len(backfills)}** backfill(s) washing away long histories, "
+            f"**{sum(backfill.deleted for backfill in backfills.values())}** message(s) so far"
+         )
+      if self.client.tides:
+         statistics.append(f"* **{len(self.client.tides)}** time-only channel(s) swept without a deck")
+      metrics = self.client.metrics
+      statistics.extend([
+         f"* deletion lag: **{percentiles(metrics.deletion_lag)}**",
+         f"* gather time: **{percentiles(metrics.gather_seconds)}**",
+         f"* event loop lag: **{percentiles(metrics.loop_lag, 'ms', 1000)}**",
+         f"* **{int(sum(metrics.http_requests.values.values()))}** REST call(s), "
+         f"**{int(sum(metrics.http_429s.values.values()))}** rate limited",
+      ])
+      risks = self.client.cliff_risks
+      if risks:
+         statistics.append(
+            f"* ⚠️ **{len(risks)}** channel(s) near the 14-day bulk delete limit, "
+            f"**{sum(risk.late for risk in risks.values())}** message(s) expected to pass it"
+         )
+      if self.client.startup_seconds is not None and self.client.startup_rss is not None:
+         statistics.append(
+            f"* started in **{self.client.startup_seconds:.1f}s** "
+            f"with **{format_bytes(self.client.startup_rss)}** RSS"
+         )
 
       embed = discord.Embed(
          title=f"Statistics",
@@ -76,6 +144,27 @@ class MetaCog(commands.Cog):
          color=self.client.color
       )
 
+      partitions = self.client.channels_by_shard()
+      latencies = dict(self.client.latencies)
+      shards = []
+      for shard, channels in partitions.items():
+         backlog = sum(
+            due_count(self.client.decks[channel], self.client.memo.settings[channel])
+            for channel in channels
+            if channel in self.client.decks and channel in self.client.memo.settings
+         )
+         latency = latencies.get(shard, float("nan"))
+         shards.append(
+            f"* shard **{shard}**: **{latency*1000:.1f}ms**, "
+            f"**{len(channels)}** channel(s), **{backlog}** message(s) due"
+         )
+
+      embed.add_field(
+         name=f"Shards ({len(shards)} of {self.client.shard_count or 1})",
+         value="\n".join(shards[:20]) + (f"\n* ...and {len(shards) - 20} more" if len(shards) > 20 else ""),
+         inline=False
+      )
+
       await ctx.reply(content, embed=embed)
 
    @commands.hybrid_command(name="backup", description="make a backup of Swashbot's long-term memory (must be bot owner)")
@@ -127,6 +216,105 @@ class MetaCog(commands.Cog):
       except discord.NotFound:
          pass
 
+   @commands.hybrid_command(name="lag", description="show recent event loop stalls (must be bot owner)")
+   async def slash_lag(self, ctx: commands.Context, n: int=1):
+      if not await self.client.is_owner(ctx.author):
+         await ctx.reply("You're not my owner 👀")
+         return
+
+      watchdog = self.client.watchdog
+      stalls = list(watchdog.stalls)
+      if watchdog.threshold <= 0:
+         await ctx.reply("The event loop watchdog is turned off (`SWASHBOT_LAG_THRESHOLD`).")
+         return
+      if not stalls:
+         await ctx.reply(f"No stalls over **{watchdog.threshold}s** so far 🌊")
+         return
+
+      worst = max(stall.lag for stall in stalls)
+      msg = f"**{len(stalls)}** recent stall(s) over **{watchdog.threshold}s**, the worst was **{worst:.2f}s**."
+      for stall in stalls[-max(1, n):]:
+         stack = stall.stack.strip().splitlines()
+         stack = "\n".join(stack[-12:])[-900:]
+         msg += (
+            f"\n{stall.started.strftime('%Y-%m-%d %H:%M:%S')} UTC, **{stall.lag:.2f}s**:\n"
+            f"```py\n{stack}\n```"
+         )
+
+      try:
+         await ctx.reply(msg[:2000])
+      except discord.NotFound:
+         pass
+
+   @commands.hybrid_command(name="profile", description="sample what I'm busy with, e.g. `profile start 5 60` (must be bot owner)")
+   @app_commands.describe(
+      action="start or stop",
+      interval="milliseconds between samples",
+      seconds="stop by itself after this long",
+   )
+   async def slash_profile(self, ctx: commands.Context, action: str="stop", interval: float=5.0, seconds: float=60.0):
+      if not await self.client.is_owner(ctx.author):
+         await ctx.reply("You're not my owner 👀")
+         return
+
+      p = self.client.command_prefix
+      action = action.lower()
+      if action == "start":
+         if self.profiler is not None and self.profiler.running:
+            await ctx.reply(f"I'm already profiling, use `{p}profile stop` first.")
+            return
+         if interval <= 0 or seconds <= 0:
+            await ctx.reply("The interval and time limit need to be positive.")
+            return
+
+         limit = min(seconds, _profile_max_seconds)
+         self.profiler = SamplingProfiler(interval=interval / 1000, limit=limit)
+         self.profiler.start()
+         self.profile_deadline = asyncio.create_task(self.profile_timeout(limit))
+         self.client.log.info(f"Profiling every {interval:g}ms for up to {limit:g}s.")
+         await ctx.reply(f"Profiling every **{interval:g}ms** for up to **{limit:g}s**. Use `{p}profile stop` to finish early.")
+
+      elif action == "stop":
+         if self.profiler is None or self.profile_deadline is None:
+            if self.last_profile is not None:
+               await ctx.reply(f"I'm not profiling right now. The last profile was written to `{self.last_profile.name}`.")
+            else:
+               await ctx.reply(f"I'm not profiling right now, use `{p}profile start` to begin.")
+            return
+         self.profile_deadline.cancel()
+         profiler = self.profiler
+         file = await self.finish_profile()
+
+         msg = (
+            f"Took **{profiler.samples}** sample(s) over **{profiler.elapsed:.1f}s**, "
+            f"written to `{file.name}` (use `{p}tail {file.name}`)."
+         )
+         top = profiler.top()
+         if top:
+            lines = "\n".join(f"{share:6.1%} {leaf}" for leaf, share in top)
+            msg += f"\nBusiest frames:\n```\n{lines}\n```"
+         await ctx.reply(msg[:2000])
+
+      else:
+         await ctx.reply(f"Use `{p}profile start` or `{p}profile stop`.")
+
+   async def profile_timeout(self, limit: float) -> None:
+      await asyncio.sleep(limit + 1)
+      await self.finish_profile()
+
+   async def finish_profile(self) -> Path:
+      """Stop the profiler and write out its samples
+      """
+      profiler = self.profiler
+      assert profiler is not None and profiler.started is not None
+      self.profiler = None
+      self.profile_deadline = None
+      await asyncio.to_thread(profiler.stop)
+      file = await asyncio.to_thread(profiler.write, f"profile-{profiler.started.strftime('%Y%m%d-%H%M%S')}.collapsed")
+      self.client.log.info(f"Wrote {profiler.samples} profile sample(s) to {file}.")
+      self.last_profile = file
+      return file
+
    @commands.hybrid_command(name="slash", description="sync slash commands")
    async def slash_slash(self, ctx: commands.Context):
       if not await self.client.is_owner(ctx.author):
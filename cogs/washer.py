@@ -1,13 +1,20 @@
-from datetime import datetime
 from typing import Optional
+from datetime import datetime, timezone
+from math import inf
+import asyncio
+import time
 
 import discord
 from discord.ext import tasks, commands
 
 from main import Swashbot, SwashbotMessageable
-from utils.flotsam import Deck
+from utils.flotsam import Deck, age_minutes, due_count, due_ids, due_channels
+from utils.memory import Settings
+from utils.purge import bulk_delete_cutoff, split_at_cliff, plan_cliff, format_deadline
 
 _swashbot_pace_seconds = 5
+_cliff_check_minutes = 1
+_cliff_warning_seconds = 24 * 60 * 60 # warn about due messages this close to the bulk delete limit
 
 _permission_to_delete = discord.Permissions(
    manage_messages=True,
@@ -15,18 +22,11 @@ _permission_to_delete = discord.Permissions(
    read_message_history=True,
 )
 
-def age_minutes(deck: Deck, now: Optional[datetime]=None) -> float:
-   if deck.oldest is None: return -1
-
-   now = datetime.utcnow() if now is None else now
-   created_at = deck.oldest.created_at.replace(tzinfo=None)
-   
-   return (now - created_at).total_seconds() / 60
-
 class WasherCog(commands.Cog):
    def __init__(self, client: Swashbot) -> None:
       self.client = client
       self.watcher.start()
+      self.cliff_watch.start()
 
    @tasks.loop(seconds=_swashbot_pace_seconds, reconnect=True)
    async def watcher(self) -> None:
@@ -34,56 +34,167 @@ class WasherCog(commands.Cog):
       """
       if not self.client.ready: return
 
-      task = self.client.new_task()
+      async with self.client.new_task.span("wash") as task:
+         partitions = self.client.channels_by_shard()
+         counts = await asyncio.gather(*(
+            self.wash(task.label, channels)
+            for channels in partitions.values()
+         ))
+         messages = sum(counts)
+         task.set(count=messages)
+
+         if messages:
+            self.client.log.debug(f"{task}: Cleaned {messages} message(s) total...")
+
+   async def wash(self, task: str, channels: list[int]) -> int:
+      """Wash away due messages in some channels, one channel at a time
+
+      Each shard gets its own call, so that one busy shard doesn't hold up the others.
+      Only channels with messages due are visited (see `due_channels`).
+
+      Messages get cheap to delete in bulk until they're 14 days old, and then
+      cost a request each, so the channel with the oldest message goes first,
+      and messages already past that limit wait until every channel's younger
+      messages are taken care of. Deckless channels are swept once their
+      tide comes in, earliest first.
+
+      Returns:
+         int: Number of messages washed away.
+      """
       messages = 0
+      by_deadline = due_channels(channels, self.client.decks, self.client.memo.settings)
+      stragglers: list[tuple[SwashbotMessageable, list[int], list[float]]] = []
 
-      for channel, settings in self.client.memo.settings.items():
+      for channel in by_deadline:
+         settings = self.client.memo.settings.get(channel)
+         if settings is None: continue
          if not channel in self.client.decks: continue
          deck = self.client.decks[channel]
-         discord_channel: Optional[SwashbotMessageable] = None
-
-         insufficient_permissions = False
-         clean_shoreface = False
-         clean_swashzone = False
-
-         while len(deck) > settings.at_most:
-            if discord_channel is None:
-               discord_channel = await self.client.try_channel(channel)
-               if not await self.client.check_permissions(discord_channel, _permission_to_delete):
-                  insufficient_permissions = True
-                  break
+         if len(deck) <= settings.at_least: continue
+         async with self.client.new_task.span("wash.channel", channel=channel) as span:
+            washed = await self.wash_channel(task, channel, deck, settings, stragglers)
+            span.set(count=washed)
+            messages += washed
+
+      now = time.time()
+      tides = self.client.tides
+      for channel in sorted((channel for channel in channels if tides.get(channel, inf) <= now), key=tides.__getitem__):
+         async with self.client.new_task.span("wash.sweep", channel=channel) as span:
+            washed = await self.sweep(channel)
+            span.set(count=washed)
+            messages += washed
+
+      try:
+         for discord_channel, ids, due in stragglers:
+            await self.wash_away(discord_channel, ids, due)
+      finally:
+         for _, ids, _ in stragglers:
+            self.client.washing.difference_update(ids)
+
+      return messages
+
+   async def wash_channel(self, task: str, channel: int, deck: Deck, settings: Settings,
+      stragglers: list[tuple[SwashbotMessageable, list[int], list[float]]],
+   ) -> int:
+      """Wash away due messages in one channel
+
+      Messages too old to bulk delete are added to ``stragglers`` rather than
+      deleted right away.
+
+      Returns:
+         int: Number of messages washed away (or left as stragglers).
+      """
+      discord_channel: Optional[SwashbotMessageable] = None
 
-            if not clean_shoreface:
-               self.client.log.debug(f"{task}: {discord_channel.name!r} ({channel}): Looks like I have about {len(deck) - settings.at_most} message(s) in the shore face...")
-               clean_shoreface = True
+      insufficient_permissions = False
+      washed: list[int] = []
+      due: list[float] = []
+      clean_shoreface = False
+      clean_swashzone = False
 
-            id = deck.pop_oldest()
-            await self.client.try_delete(discord_channel, id)
-            messages += 1
+      while len(deck) > settings.at_most:
+         if discord_channel is None:
+            discord_channel = await self.client.try_channel(channel)
+            if not await self.client.check_permissions(discord_channel, _permission_to_delete):
+               insufficient_permissions = True
+               break
 
-         if insufficient_permissions: continue
+         if not clean_shoreface:
+            self.client.log.debug(f"{task}: {discord_channel.name!r} ({channel}): Looks like I have about {len(deck) - settings.at_most} message(s) in the shore face...")
+            clean_shoreface = True
 
-         if deck.oldest is None: continue
+         washed.append(deck.pop_oldest())
+         due.append(time.time())
 
+      if not insufficient_permissions and deck.oldest is not None:
          while len(deck) > settings.at_least and age_minutes(deck) >= settings.minutes:
             if discord_channel is None:
                discord_channel = await self.client.try_channel(channel)
                if not await self.client.check_permissions(discord_channel, _permission_to_delete):
-                  insufficient_permissions = True
                   break
-            
+
             if not clean_swashzone:
                self.client.log.debug(f"{task}: {discord_channel.name!r} ({channel}): Looks like I have some messages to clean in the swash zone...")
                clean_swashzone = True
 
             id = deck.pop_oldest()
-            await self.client.try_delete(discord_channel, id)
-            messages += 1
-
-         if insufficient_permissions: continue # superfluous
+            washed.append(id)
+            due.append(discord.utils.snowflake_time(id).timestamp() + settings.minutes * 60)
+
+      if not washed: return 0
+
+      assert discord_channel is not None
+      due_at = dict(zip(washed, due))
+      young, old = split_at_cliff(washed, bulk_delete_cutoff())
+      if old:
+         stragglers.append((discord_channel, old, [due_at[id] for id in old]))
+         self.client.washing.update(old)
+      await self.wash_away(discord_channel, young, [due_at[id] for id in young])
+      return len(washed)
+
+   async def wash_away(self, discord_channel: SwashbotMessageable, ids: list[int], due: list[float]) -> None:
+      if not ids: return
+      self.client.busy_level += 1
+      try:
+         await self.client.wash_away(discord_channel, ids, due)
+      finally:
+         self.client.busy_level -= 1
+
+   async def sweep(self, channel: int) -> int:
+      self.client.busy_level += 1
+      try:
+         return await self.client.sweep(channel)
+      finally:
+         self.client.busy_level -= 1
+
+   @tasks.loop(minutes=_cliff_check_minutes, reconnect=True)
+   async def cliff_watch(self) -> None:
+      """Keep track of channels whose backlog is near or past the 14-day bulk delete limit
+      """
+      if not self.client.ready: return
 
-      if messages:
-         self.client.log.debug(f"{task}: Cleaned {messages} message(s) total...")
+      now = datetime.now(timezone.utc)
+      decks = self.client.decks
+      settings = self.client.memo.settings
+      risks = {}
+      for channels in self.client.channels_by_shard().values():
+         backlog = [
+            (channel, due_ids(decks[channel], settings[channel], now))
+            for channel in channels
+            if channel in decks and channel in settings
+         ]
+         for risk in plan_cliff(backlog, now):
+            if risk.late or risk.deadline < _cliff_warning_seconds:
+               risks[risk.channel] = risk
+
+      for channel, risk in risks.items():
+         if channel in self.client.cliff_risks: continue
+         self.client.log.warning((
+            f"Channel {channel} has {risk.young} due message(s) that can still be bulk deleted, "
+            f"the oldest for another {format_deadline(risk.deadline)}, and about {risk.late} of them "
+            f"won't be washed in time ({risk.past} due message(s) are already too old)."
+         ))
+      self.client.cliff_risks = risks
 
 async def setup(client: Swashbot) -> None:
    await client.add_cog(WasherCog(client))
\ No newline at end of file
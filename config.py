@@ -7,22 +7,120 @@ from utils.logging import build_logging_setup
 SWASHBOT_TOKEN = ""
 SWASHBOT_PREFIX = "~"
 SWASHBOT_DATABASE = "swashbot.ltm"
+SWASHBOT_PROFILE = "default"
+SWASHBOT_SHARD_COUNT = "" # leave empty to let Discord recommend a count
+SWASHBOT_SHARD_IDS = "" # e.g. "0-3,8" to run a subset; leave empty to run every shard
+SWASHBOT_DELETION_WORKERS = "0" # worker processes for deletions; 0 deletes in-process
+SWASHBOT_NODE = "" # unique name per instance sharing SWASHBOT_DATABASE; leave empty for a single instance
+SWASHBOT_LEASE_SECONDS = "30"
+SWASHBOT_TRACE = "" # file to record a gateway event trace to; leave empty to not record
+SWASHBOT_METRICS = "" # host:port to serve Prometheus metrics on, e.g. "127.0.0.1:9108"; leave empty to not serve
+SWASHBOT_LAG_THRESHOLD = "0.25" # seconds of event loop lag before capturing what's blocking it; 0 disables
+SWASHBOT_SPANS = "" # JSONL file to export finished task spans to; leave empty to only keep recent ones in memory
+SWASHBOT_ARCHIVE = "" # directory to archive washed messages of `~archive on` channels to; leave empty to disable archiving
+SWASHBOT_ARCHIVE_SEGMENT_MB = "64" # uncompressed size of each archive segment before rotating to a new one
+SWASHBOT_DECKLESS = "0" # "1" to wash time-only channels by paging history instead of tracking their messages
+SWASHBOT_SLASH_ONLY = "0" # "1" to only answer slash commands, without the message content intent
 
 # Note that the environment variable versions take precedence
 SWASHBOT_TOKEN = os.environ.get("SWASHBOT_TOKEN", SWASHBOT_TOKEN)
 SWASHBOT_PREFIX = os.environ.get("SWASHBOT_PREFIX", SWASHBOT_PREFIX)
 SWASHBOT_DATABASE = os.environ.get("SWASHBOT_DATABASE", SWASHBOT_DATABASE)
+SWASHBOT_PROFILE = os.environ.get("SWASHBOT_PROFILE", SWASHBOT_PROFILE)
+SWASHBOT_SHARD_COUNT = os.environ.get("SWASHBOT_SHARD_COUNT", SWASHBOT_SHARD_COUNT)
+SWASHBOT_SHARD_IDS = os.environ.get("SWASHBOT_SHARD_IDS", SWASHBOT_SHARD_IDS)
+SWASHBOT_DELETION_WORKERS = os.environ.get("SWASHBOT_DELETION_WORKERS", SWASHBOT_DELETION_WORKERS)
+SWASHBOT_NODE = os.environ.get("SWASHBOT_NODE", SWASHBOT_NODE)
+SWASHBOT_LEASE_SECONDS = os.environ.get("SWASHBOT_LEASE_SECONDS", SWASHBOT_LEASE_SECONDS)
+SWASHBOT_TRACE = os.environ.get("SWASHBOT_TRACE", SWASHBOT_TRACE)
+SWASHBOT_METRICS = os.environ.get("SWASHBOT_METRICS", SWASHBOT_METRICS)
+SWASHBOT_LAG_THRESHOLD = os.environ.get("SWASHBOT_LAG_THRESHOLD", SWASHBOT_LAG_THRESHOLD)
+SWASHBOT_SPANS = os.environ.get("SWASHBOT_SPANS", SWASHBOT_SPANS)
+SWASHBOT_ARCHIVE = os.environ.get("SWASHBOT_ARCHIVE", SWASHBOT_ARCHIVE)
+SWASHBOT_ARCHIVE_SEGMENT_MB = os.environ.get("SWASHBOT_ARCHIVE_SEGMENT_MB", SWASHBOT_ARCHIVE_SEGMENT_MB)
+SWASHBOT_DECKLESS = os.environ.get("SWASHBOT_DECKLESS", SWASHBOT_DECKLESS)
+SWASHBOT_SLASH_ONLY = os.environ.get("SWASHBOT_SLASH_ONLY", SWASHBOT_SLASH_ONLY)
 
 checks = {
    "SWASHBOT_TOKEN": SWASHBOT_TOKEN,
    "SWASHBOT_PREFIX": SWASHBOT_PREFIX,
    "SWASHBOT_DATABASE": SWASHBOT_DATABASE,
+   "SWASHBOT_PROFILE": SWASHBOT_PROFILE,
 }
 
 for name, value in checks.items():
    if not value:
       raise RuntimeError(f"{name!r} not set")
 
+# Client profiles
+# "lean" only caches what Swashbot actually reads (its own member, channels),
+# and opts into uvloop when it's installed (discord.py already uses orjson
+# on its own whenever that's installed)
+# None means "leave it to discord.py"
+client_profiles = {
+   "default": {
+      "member_cache": None,
+      "chunk_guilds": None,
+      "fast_event_loop": False,
+   },
+   "lean": {
+      "member_cache": False,
+      "chunk_guilds": False,
+      "fast_event_loop": True,
+   },
+}
+
+if SWASHBOT_PROFILE not in client_profiles:
+   raise RuntimeError(f"'SWASHBOT_PROFILE' must be one of {list(client_profiles)} (got {SWASHBOT_PROFILE!r})")
+
+client_profile = client_profiles[SWASHBOT_PROFILE]
+
+def _parse_switch(value: str) -> bool:
+   return value.strip().lower() in ("1", "true", "yes", "on")
+
+# Sharding
+def _parse_shard_ids(value: str) -> list[int]:
+   shard_ids = []
+   for part in value.split(","):
+      part = part.strip()
+      if not part: continue
+      first, _, last = part.partition("-")
+      shard_ids.extend(range(int(first), int(last or first) + 1))
+   return sorted(set(shard_ids))
+
+shard_count = int(SWASHBOT_SHARD_COUNT) if SWASHBOT_SHARD_COUNT else None
+shard_ids = _parse_shard_ids(SWASHBOT_SHARD_IDS) if SWASHBOT_SHARD_IDS else None
+
+if shard_ids is not None:
+   if shard_count is None:
+      raise RuntimeError("'SWASHBOT_SHARD_IDS' requires 'SWASHBOT_SHARD_COUNT' to be set")
+   if any(shard >= shard_count for shard in shard_ids):
+      raise RuntimeError(f"'SWASHBOT_SHARD_IDS' must be below 'SWASHBOT_SHARD_COUNT' ({shard_count})")
+
+# Deletion workers
+deletion_workers = int(SWASHBOT_DELETION_WORKERS or 0)
+
+# Partitioning between instances
+lease_seconds = float(SWASHBOT_LEASE_SECONDS or 30)
+
+# Event loop watchdog
+lag_threshold = float(SWASHBOT_LAG_THRESHOLD or 0)
+
+# Metrics endpoint
+metrics_address = None
+if SWASHBOT_METRICS:
+   _host, _, _port = SWASHBOT_METRICS.rpartition(":")
+   metrics_address = (_host or "127.0.0.1", int(_port))
+
+# Archiving
+archive_segment_bytes = int(float(SWASHBOT_ARCHIVE_SEGMENT_MB or 64) * 1024 * 1024)
+
+# Deckless washing
+deckless = _parse_switch(SWASHBOT_DECKLESS)
+
+# Slash-only mode
+slash_only = _parse_switch(SWASHBOT_SLASH_ONLY)
+
 # Customize logging down here
 # Disable logging by setting SWASHBOT_LOG to an empty string
 SWASHBOT_LOG = "debug.log"
@@ -1,20 +1,34 @@
 from __future__ import annotations
-from typing import Optional, Union
+from typing import Callable, Iterable, Optional, Union
 
 from pathlib import Path
 from datetime import datetime, timedelta
-from math import isinf
+from math import inf, isinf
 import asyncio
 import traceback
 import logging
+import time
 
 import discord
 from discord.ext import commands
 
-from utils.memory import LongTermMemory, Settings
-from utils.flotsam import Deck
-from utils.logging import TaskTracker
-from config import SWASHBOT_PREFIX, SWASHBOT_DATABASE
+from utils.memory import LongTermMemory, Settings, Backfill
+from utils.flotsam import Deck, Gathering
+from utils.logging import TaskTracker, format_duration
+from utils.resources import rss_bytes, format_bytes
+from utils.workers import DeletionPool
+from utils.leases import LeaseTable
+from utils.trace import TraceRecorder
+from utils.metrics import Metrics
+from utils.watchdog import LoopWatchdog
+from utils.archive import Archiver, message_record
+from utils.purge import PurgeFilter, CliffRisk, bulk_delete_cutoff, split_at_cliff, BULK_DELETE_LIMIT
+from utils.flotsam import due_count, due_snowflake
+from config import SWASHBOT_PREFIX, SWASHBOT_DATABASE, SWASHBOT_PROFILE, client_profile
+from config import shard_count, shard_ids, deletion_workers
+from config import SWASHBOT_NODE, lease_seconds, SWASHBOT_TRACE
+from config import metrics_address, lag_threshold, SWASHBOT_SPANS
+from config import SWASHBOT_ARCHIVE, archive_segment_bytes, deckless, slash_only
 
 # TODO: if a message has a thread attached, delete it?
 
@@ -23,7 +37,7 @@ SwashbotMessageable = Union[discord.TextChannel, discord.Thread]
 _swashbot_intents = discord.Intents(
    guilds=True,
    guild_messages=True,
-   message_content=True,
+   message_content=not slash_only,
 )
 _swashbot_color = discord.Colour.from_rgb(46, 137, 139)
 _swashbot_login_activity = discord.Activity(
@@ -31,10 +45,31 @@ _swashbot_login_activity = discord.Activity(
    name="the soft waves"
 )
 _swashbot_throttle_seconds = 0.85
+_swashbot_gather_concurrency = 8
+_swashbot_gather_debounce_seconds = 1.0 # how long to let more asks pile up before gathering a channel again
+_backfill_threshold = 1000 # due messages a gather takes on before leaving the rest of history to a backfill
+_permission_to_wash = discord.Permissions(
+   manage_messages=True,
+   view_channel=True,
+   read_message_history=True,
+)
+
+class NotOurGuild(commands.CheckFailure):
+   """Raised when another Swashbot instance holds the lease for a command's guild
+   """
 
-class Swashbot(commands.Bot):
+class Swashbot(commands.AutoShardedBot):
    """Represents our beloved ocean bot
 
+   Runs every shard by default, or only the shard range given by
+   ``SWASHBOT_SHARD_COUNT`` and ``SWASHBOT_SHARD_IDS`` so that a host can run
+   one shard group per process. Decks, gathers and washing are partitioned by
+   shard, and channels belonging to other shard groups are left alone.
+
+   With ``SWASHBOT_SLASH_ONLY``, Swashbot goes without the message content
+   intent and prefix commands, and new messages skip discord.py's `Message`
+   parsing entirely (see `parse_message_create`).
+
    Attributes:
       color: Bot color theme
       ready: `datetime` of when bot first logged in successfuly
@@ -43,8 +78,24 @@ class Swashbot(commands.Bot):
       errors: errors caught since ready
       busy_level: the number of channels Swashbot is currently performing busywork on
       commands_processed: the number of commands successfully processed
+      messages_ingested: the number of gateway messages handled since ready
+      profile: name of the client profile in use (see `config.py`)
+      startup_seconds: seconds from construction until first ready
+      startup_rss: resident set size in bytes at first ready
+      deletion_pool: worker processes that delete messages, if enabled
+      pending_due: when each message handed to the deletion workers became due, until they report back
+      washing: IDs of messages popped from decks that are being (or waiting to be) deleted here
+      leases: guild ownership shared with other instances, if ``SWASHBOT_NODE`` is set
+      trace: gateway event trace recorder, if ``SWASHBOT_TRACE`` is set
+      metrics: latency histograms, REST call counters and backlog gauges
+      watchdog: event loop stall detector
+      archiver: writes washed messages of archived channels to disk, if ``SWASHBOT_ARCHIVE`` is set
+      pins: cached pinned message IDs per channel, so bulk deletes can leave them be
+      cliff_risks: channels whose backlog is near or past Discord's 14-day bulk delete limit (see `WasherCog.cliff_watch`)
       memo: saved `~utils.memory.Settings` for channels
       decks: records of channels' messages for smart deletion
+      tides: UNIX time of the next sweep for each deckless channel, or inf until a message arrives (see `sweep`)
+      gatherings: channels being gathered, and what's happened in them meanwhile (see `gather_flotsam`)
    """
    color: discord.Colour = _swashbot_color
 
@@ -55,20 +106,103 @@ class Swashbot(commands.Bot):
    errors: int = 0
    busy_level: int = 0
    commands_processed: int = 0
+   messages_ingested: int = 0
+   startup_seconds: Optional[float] = None
+   startup_rss: Optional[int] = None
 
    def __init__(self) -> None:
-      commands.Bot.__init__(self, SWASHBOT_PREFIX,
+      self._constructed = time.monotonic()
+      self.profile = SWASHBOT_PROFILE
+
+      options = {}
+      if client_profile["member_cache"] is False:
+         # our own member is always cached regardless, which is all we need
+         options["member_cache_flags"] = discord.MemberCacheFlags.none()
+      if client_profile["chunk_guilds"] is False:
+         options["chunk_guilds_at_startup"] = False
+      self.metrics = Metrics()
+
+      commands.AutoShardedBot.__init__(self, "/" if slash_only else SWASHBOT_PREFIX,
+         shard_count=shard_count,
+         shard_ids=shard_ids,
          intents=_swashbot_intents,
          max_messages=None,
          activity=_swashbot_login_activity,
          status=discord.Status.online,
+         http_trace=self.metrics.tracer(),
+         **options,
       )
-      self.memo = LongTermMemory(Path(SWASHBOT_DATABASE))
+      # guilds are read in as they become available (see `load_guilds`)
+      self.memo = LongTermMemory(Path(SWASHBOT_DATABASE), lazy=True)
       self.decks: dict[int, Deck] = {}
+      self.tides: dict[int, float] = {}
+      self.gatherings: dict[int, Gathering] = {}
+      self.gathers: dict[int, asyncio.Task[int]] = {}
       self.log = logging.getLogger("swashbot")
-      self.new_task = TaskTracker()
+      self.new_task = TaskTracker(export=SWASHBOT_SPANS or None)
+      self.deletion_pool: Optional[DeletionPool] = None
+      self.leases: Optional[LeaseTable] = None
+      if SWASHBOT_NODE:
+         self.leases = LeaseTable(Path(SWASHBOT_DATABASE), SWASHBOT_NODE, ttl=lease_seconds)
+      self.trace: Optional[TraceRecorder] = None
+      if SWASHBOT_TRACE:
+         self.trace = TraceRecorder(SWASHBOT_TRACE)
+      self.pending_due: dict[int, float] = {}
+      self.washing: set[int] = set()
+      self.archiver: Optional[Archiver] = None
+      if SWASHBOT_ARCHIVE:
+         self.archiver = Archiver(SWASHBOT_ARCHIVE, segment_bytes=archive_segment_bytes)
+         if slash_only: self.log.warning("Without the message content intent, archived messages will have empty contents, attachments and embeds, except ones that mention me.")
+      self.watchdog = LoopWatchdog(lag_threshold, on_lag=self.metrics.loop_lag.observe)
+      self.pins: dict[int, set[int]] = {}
+      self.cliff_risks: dict[int, CliffRisk] = {}
+      if slash_only:
+         self._connection.parsers["MESSAGE_CREATE"] = self.parse_message_create
+
+      registry = self.metrics.registry
+      registry.gauge("deck_size", "Messages tracked per channel",
+         lambda: {(("channel", str(channel)),): len(deck) for channel, deck in self.decks.items()}
+      )
+      registry.gauge("overdue_messages", "Messages due to be washed away per channel", lambda: {
+         (("channel", str(channel)),): due_count(deck, self.memo.settings[channel])
+         for channel, deck in list(self.decks.items())
+         if channel in self.memo.settings
+      })
+      registry.gauge("messages_deleted", "Messages deleted since ready", lambda: {(): self.messages_deleted})
+      registry.gauge("messages_ingested", "Gateway messages handled since ready", lambda: {(): self.messages_ingested})
+      registry.gauge("errors", "Errors caught since ready", lambda: {(): self.errors})
+      registry.gauge("cliff_late_messages", "Due messages expected to pass the 14-day bulk delete limit before they're washed",
+         lambda: {(("channel", str(channel)),): risk.late for channel, risk in self.cliff_risks.items()}
+      )
+      registry.gauge("orphaned_channel_state", "Channels with state in working memory that aren't ours to wash, by kind",
+         lambda: {(("kind", name),): len(channels) for name, channels in self.orphans().items()}
+      )
+      registry.gauge("busy_level", "Channels currently being gathered or washed", lambda: {(): self.busy_level})
+      registry.gauge("shard_latency_seconds", "Gateway heartbeat latency per shard",
+         lambda: {(("shard", str(shard)),): latency for shard, latency in self.latencies}
+      )
 
    async def setup_hook(self) -> None:
+      self.loop.create_task(self.watchdog.run())
+      if metrics_address is not None:
+         host, port = metrics_address
+         await self.metrics.serve(host, port)
+         self.log.info(f"Serving metrics at http://{host}:{port}/metrics.")
+
+      if deletion_workers > 0 and self.http.token:
+         self.deletion_pool = DeletionPool(self.http.token, deletion_workers,
+            throttle=_swashbot_throttle_seconds,
+         )
+         self.deletion_pool.start()
+         self.loop.create_task(self.collect_deletions())
+         self.log.info(f"Started {deletion_workers} deletion worker process(es).")
+
+      if self.leases is not None:
+         self.add_check(self.lease_check)
+         await self.rebalance()
+         for guild in list(self.memo.channels):
+            if guild not in self.leases.held: self.memo.forget_guild(guild)
+
       cogs = []
       for file in Path("./cogs").iterdir():
          if file.suffix == ".py":
@@ -78,15 +212,48 @@ class Swashbot(commands.Bot):
 
       self.log.info(f"Loaded {len(cogs)} cog(s): {cogs}.")
 
+      if slash_only:
+         # there's no prefix left to run ~slash with
+         try:
+            synced = await self.tree.sync()
+            self.log.info(f"Synced {len(synced)} slash command(s).")
+         except discord.HTTPException as e:
+            self.log.warning(f"Couldn't sync slash commands: {e}")
+
+   async def close(self) -> None:
+      if self.deletion_pool is not None:
+         await asyncio.to_thread(self.deletion_pool.close)
+      if self.leases is not None:
+         self.leases.close()
+      if self.trace is not None:
+         self.trace.close()
+      if self.archiver is not None:
+         await asyncio.to_thread(self.archiver.close)
+      self.new_task.close()
+      await super().close()
+
    async def on_ready(self) -> None:
       if self.ready:
          self.disconnects += 1
          return
       
-      for channel in list(self.memo.settings):
-         await self.gather_flotsam(channel)
+      self.load_guilds(self.guilds)
+
+      partitions = self.channels_by_shard()
+      await asyncio.gather(*(
+         self.gather_shard(shard, channels)
+         for shard, channels in partitions.items()
+      ))
       
       self.ready = datetime.utcnow()
+      self.startup_seconds = time.monotonic() - self._constructed
+      self.startup_rss = rss_bytes()
+      self.log.info((
+         f"Ready under the {self.profile!r} profile after {self.startup_seconds:.1f}s "
+         f"using {format_bytes(self.startup_rss)} RSS "
+         f"(orjson: {'on' if discord.utils.HAS_ORJSON else 'off'}, "
+         f"event loop: {type(asyncio.get_running_loop()).__module__})."
+      ))
 
    async def on_error(self, event_method: str, *args, **kwargs) -> None:
      self.errors += 1
@@ -96,6 +263,7 @@ class Swashbot(commands.Bot):
      self.log.error(f"Encountered error:\n{summary}\n{details}")
 
    async def on_command_error(self, ctx: commands.Context, error: commands.errors.CommandError) -> None:
+      if isinstance(error, NotOurGuild): return
       self.log.error(f"Unexpected command error:\n{error}")
       try:
          await ctx.message.add_reaction("👀")
@@ -104,19 +272,62 @@ class Swashbot(commands.Bot):
       return await super().on_command_error(ctx, error)
 
    async def on_message(self, message: discord.Message) -> None:
+      """(Whenever any message is sent anywhere)
+
+      This is the hottest path in the bot, so it does as little as possible:
+      one dict lookup for the deck, and only build a command `Context` when the
+      message could actually be a prefix command.
+      """
+      if not self.ready: return
+      self.messages_ingested += 1
+
+      if self.ingest(message.channel.id, message.id):
+         if self.archiver is not None and message.channel.id in self.memo.archived: self.archiver.remember(message)
+
+      if message.content.startswith(SWASHBOT_PREFIX):
+         await self.process_commands(message)
+
+   def parse_message_create(self, data: dict) -> None:
+      """(Whenever any message is sent anywhere, in slash-only mode)
+
+      Stands in for discord.py's own MESSAGE_CREATE parser, reading just the
+      two IDs the decks need rather than building a `discord.Message`, since
+      there are no commands to look for in the message anyway. Archived
+      channels get a record built from the raw payload.
+      """
       if not self.ready: return
-      channel = message.channel.id
-      if channel in self.memo.settings:
-         self.decks[channel].append_new(message)
+      self.messages_ingested += 1
+      channel = int(data["channel_id"])
+      if self.ingest(channel, int(data["id"])):
+         if self.archiver is not None and channel in self.memo.archived: self.archiver.remember_raw(data)
+
+   def ingest(self, channel: int, id: int) -> bool:
+      """Keep track of a new message in its channel's deck, or tide if it's deckless
 
-      await self.process_commands(message)
+      Returns:
+         bool: Whether the channel has a deck.
+      """
+      gathering = self.gatherings.get(channel)
+      if gathering is not None: gathering.arrived.append(id)
+      deck = self.decks.get(channel)
+      if deck is not None:
+         deck.append_id(id)
+         if self.trace is not None: self.trace.message(channel, id)
+         return True
+      if self.tides.get(channel) == inf:
+         self.tides[channel] = discord.utils.snowflake_time(id).timestamp() + self.memo.settings[channel].minutes * 60
+      return False
 
    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent) -> None:
       """(Whenever a message deletion is detected)
       """
       channel = payload.channel_id
-      if channel not in self.decks: return
       message = payload.message_id
+      gathering = self.gatherings.get(channel)
+      if gathering is not None: gathering.deleted.add(message)
+      if self.archiver is not None: self.archiver.forget(channel, [message])
+      if channel not in self.decks: return
+      if self.trace is not None: self.trace.delete(channel, message)
 
       try:
          self.decks[channel].remove(message)
@@ -127,7 +338,11 @@ class Swashbot(commands.Bot):
       """(Whenever a batch of messages has been detected as deleted)
       """
       channel = payload.channel_id
+      gathering = self.gatherings.get(channel)
+      if gathering is not None: gathering.deleted.update(payload.message_ids)
+      if self.archiver is not None: self.archiver.forget(channel, list(payload.message_ids))
       if channel not in self.decks: return
+      if self.trace is not None: self.trace.bulk_delete(channel, payload.message_ids)
       task = self.new_task()
       self.log.info(f"{task}: Handling bulk delete of {len(payload.message_ids)} message(s) in channel {payload.channel_id} (guild {payload.guild_id}).")
 
@@ -139,25 +354,58 @@ class Swashbot(commands.Bot):
 
       self.log.info(f"{task}: Done.")
 
+   async def on_guild_channel_pins_update(self, channel: Union[discord.abc.GuildChannel, discord.Thread], last_pin: Optional[datetime]) -> None:
+      self.pins.pop(channel.id, None)
+
+   async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent) -> None:
+      """(Whenever a message edit is detected)
+
+      Only matters for archived channels, so the archive gets the latest contents.
+      """
+      if self.archiver is None or payload.channel_id not in self.memo.archived: return
+      self.archiver.edit(payload.channel_id, payload.message_id, payload.data)
+
+   async def on_guild_available(self, guild: discord.Guild) -> None:
+      """(Whenever a guild becomes available, including ones just joined)
+      """
+      if not self.ready: return # on_ready takes care of the first ones
+      await self.regather(self.load_guilds([guild]))
+
+   async def on_guild_join(self, guild: discord.Guild) -> None:
+      await self.on_guild_available(guild)
+
    async def on_guild_remove(self, guild: discord.Guild) -> None:
-      if guild.id not in self.memo.channels: return
+      # its rows may never have been read
+      self.memo.load_guilds([guild.id])
+      if guild.id not in self.memo.channels and guild.id not in self.memo.policy_guilds: return
 
-      channels = self.memo.channels[guild.id]
+      channels = list(self.memo.channels.get(guild.id, set()))
+      if self.trace is not None: self.trace.guild_gone(guild.id)
       task = self.new_task()
       self.log.info(f"{task}: I was removed from a {guild.name!r} ({guild.id}), so I'll remove its {len(channels)} deck(s) from memory.")
 
-      for channel in channels: self.memo.remove(channel)
+      for channel in channels:
+         self.release(channel)
+      self.memo.remove_guild(guild.id)
       self.log.info(f"{task}: Done.")
 
+   async def on_guild_channel_create(self, channel: discord.abc.GuildChannel) -> None:
+      if channel.guild.id not in self.memo.policy_guilds: return
+      await self.regather(self.place_channel(channel))
+
+   async def on_guild_channel_update(self, before: discord.abc.GuildChannel, after: discord.abc.GuildChannel) -> None:
+      if after.guild.id not in self.memo.policy_guilds: return
+      await self.regather(self.place_channel(after))
+
    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel) -> None:
-      if channel in self.memo.settings:
+      if channel.id in self.memo.settings:
          self.log.info(f"The channel {channel.name!r} ({channel.id}) I was watching was deleted, so I'll remove its deck from memory.")
-         self.memo.remove(channel.id)
+      self.channel_gone(channel.id)
 
    async def on_raw_thread_delete(self, payload: discord.RawThreadDeleteEvent) -> None:
       if payload.thread_id in self.memo.settings:
          self.log.info(f"The thread {payload.thread_id} I was watching was deleted, so I'll remove its deck from memory.")
-         self.memo.remove(payload.thread_id)
+      self.channel_gone(payload.thread_id)
 
    async def on_command_completion(self, ctx: commands.Context) -> None:
       self.commands_processed += 1
@@ -203,12 +451,252 @@ class Swashbot(commands.Bot):
 
       return f"1 message every {seconds / self.messages_deleted:.2f}s"
 
+   @property
+   def ingest_rate(self) -> str:
+      """Gateway messages handled per unit time
+      """
+      age = timedelta() if self.ready is None else (datetime.utcnow() - self.ready)
+      seconds = max(0, age.total_seconds())
+
+      if seconds == 0 or self.messages_ingested == 0:
+         return "n/a"
+
+      return f"{self.messages_ingested / seconds:.2f} msg/s"
+
+   @property
+   def local_shards(self) -> list[int]:
+      """IDs of the shards this process runs
+      """
+      if self.shard_ids is not None: return list(self.shard_ids)
+      return list(range(self.shard_count or 1))
+
+   def shard_of(self, guild: int) -> int:
+      """Shard ID responsible for a guild
+
+      Args:
+         guild: Guild ID
+      """
+      return (guild >> 22) % (self.shard_count or 1)
+
+   def holds(self, guild: int) -> bool:
+      """Whether this instance holds the lease for a guild (always true without leases)
+
+      Args:
+         guild: Guild ID
+      """
+      return self.leases is None or guild in self.leases.held
+
+   def channel_state(self) -> dict[str, dict[int, object]]:
+      """Everything kept in working memory per channel, by name
+
+      Any new per-channel ``dict`` belongs here too, so that `release` and
+      `sweep_orphans` look after it.
+      """
+      states: dict[str, dict[int, object]] = {
+         "decks": self.decks,
+         "tides": self.tides,
+         "pins": self.pins,
+         "cliff_risks": self.cliff_risks,
+      }
+      if self.archiver is not None: states["archived_messages"] = self.archiver.held
+      return states
+
+   def release(self, channel: int) -> None:
+      """Drop everything kept in working memory for a channel, e.g. because there's nothing to wash there any more
+      """
+      for state in self.channel_state().values():
+         state.pop(channel, None)
+      if self.archiver is not None: self.archiver.forget(channel)
+
+   def channel_gone(self, channel: int) -> None:
+      """Forget a channel that was deleted, both in working memory and long-term memory
+      """
+      if self.trace is not None and channel in self.memo.settings: self.trace.channel_gone(channel)
+      self.memo.remove(channel)
+      self.release(channel)
+
+   def orphans(self) -> dict[str, list[int]]:
+      """Channels with state in working memory that aren't ours to wash (any more), by kind of state
+      """
+      return {
+         name: [channel for channel in list(state) if not self.owns(channel)]
+         for name, state in self.channel_state().items()
+      }
+
+   def sweep_orphans(self) -> dict[str, int]:
+      """Drop state left behind for channels that aren't ours to wash, e.g. after a missed event
+
+      Returns:
+         dict: Number of channels whose state was dropped, by kind of state.
+      """
+      states = self.channel_state()
+      swept = {}
+      for name, channels in self.orphans().items():
+         # channels being gathered get their state back when it's done anyway
+         channels = [channel for channel in channels if channel not in self.gathers]
+         for channel in channels:
+            states[name].pop(channel, None)
+         if channels: self.metrics.orphans_swept.inc(len(channels), kind=name)
+         swept[name] = len(channels)
+      return swept
+
+   def owns(self, channel: int) -> bool:
+      """Whether a saved channel belongs to one of this process's shards and leases
+
+      Args:
+         channel: Channel ID
+      """
+      guild = self.memo.guilds.get(channel)
+      if guild is None: return False
+      return self.shard_of(guild) in self.local_shards and self.holds(guild)
+
+   def channels_by_shard(self) -> dict[int, list[int]]:
+      """Saved channels, grouped by the local shard they belong to
+      """
+      partitions: dict[int, list[int]] = {shard: [] for shard in self.local_shards}
+      for channel, guild in list(self.memo.guilds.items()):
+         shard = self.shard_of(guild)
+         if shard in partitions and self.holds(guild): partitions[shard].append(channel)
+      return partitions
+
+   async def lease_check(self, ctx: commands.Context) -> bool:
+      """Global command check so that only the instance holding a guild answers there
+      """
+      if self.leases is None or ctx.guild is None: return True
+      held = ctx.guild.id in self.leases.held
+      if not await asyncio.to_thread(self.leases.claim, ctx.guild.id):
+         raise NotOurGuild()
+      if not held:
+         # a previous holder may have left settings behind, or we may have forgotten ours
+         channels = self.take_guild(ctx.guild.id)
+         if self.ready and channels: self.loop.create_task(self.regather(channels))
+      return True
+
+   async def rebalance(self) -> None:
+      """Heartbeat our leases, then pick up or drop guilds accordingly
+      """
+      if self.leases is None: return
+      local_shards = set(self.local_shards)
+      acquired, released = await asyncio.to_thread(self.leases.heartbeat,
+         lambda guild: self.shard_of(guild) in local_shards
+      )
+      if not (acquired or released): return
+
+      task = self.new_task()
+      self.log.info(f"{task}: Lease heartbeat acquired {len(acquired)} and released {len(released)} guild(s).")
+
+      for guild in released:
+         for channel in self.memo.channels.get(guild, set()):
+            self.release(channel)
+         self.memo.forget_guild(guild)
+
+      for guild in acquired:
+         channels = self.take_guild(guild)
+         if self.ready: await self.regather(channels)
+
+      self.log.info(f"{task}: Done.")
+
+   def take_guild(self, guild: int) -> list[int]:
+      """Read in a guild we've just got the lease for
+
+      Returns:
+         list: IDs of its channels with settings, to gather.
+      """
+      self.memo.refresh_guild(guild)
+      discord_guild = self.get_guild(guild)
+      if guild in self.memo.policy_guilds and discord_guild is not None: self.place_guild(discord_guild)
+      return list(self.memo.channels.get(guild, set()))
+
+   def place_channel(self, channel: discord.abc.GuildChannel) -> set[int]:
+      """Let server and category defaults reach a channel, if it's one we can wash
+
+      Returns:
+         set: Channel IDs whose effective settings changed.
+      """
+      if not isinstance(channel, discord.TextChannel): return set()
+      me = channel.guild.me
+      if me is not None and _permission_to_wash <= channel.permissions_for(me):
+         changed = self.memo.place(channel.id, channel.guild.id, channel.category_id)
+      else:
+         changed = self.memo.unplace(channel.id)
+      return {channel.id} if changed else set()
+
+   def load_guilds(self, guilds: Iterable[discord.Guild]) -> list[int]:
+      """Read the settings of guilds we serve into memory, if they aren't already, and place their channels
+
+      Returns:
+         list: IDs of channels newly saved in memory.
+      """
+      guilds = [guild for guild in guilds if self.holds(guild.id)]
+      loaded = self.memo.load_guilds(guild.id for guild in guilds)
+      if not loaded: return []
+      for guild in guilds:
+         if guild.id in loaded and guild.id in self.memo.policy_guilds: self.place_guild(guild)
+      return [channel for guild in loaded for channel in self.memo.channels.get(guild, set())]
+
+   def place_guild(self, guild: discord.Guild) -> set[int]:
+      """`place_channel` for every channel in a guild
+
+      Returns:
+         set: Channel IDs whose effective settings changed.
+      """
+      changed: set[int] = set()
+      for channel in guild.text_channels:
+         changed |= self.place_channel(channel)
+      return changed
+
+   async def regather(self, channels: Iterable[int]) -> int:
+      """Gather channels whose effective settings changed, a few at a time
+
+      Channels that no longer have anything to wash lose their decks instead.
+
+      Returns:
+         int: Number of messages gathered.
+      """
+      semaphore = asyncio.Semaphore(_swashbot_gather_concurrency)
+
+      async def one(channel: int) -> int:
+         if channel not in self.memo.settings:
+            self.release(channel)
+            return 0
+         async with semaphore:
+            return await self.gather_flotsam(channel)
+
+      counts = await asyncio.gather(*(one(channel) for channel in channels))
+      return sum(counts)
+
+   async def gather_shard(self, shard: int, channels: list[int]) -> int:
+      """Gather flotsam for every saved channel on one shard, one at a time
+
+      Args:
+         shard: Shard ID
+         channels: Channel IDs on that shard
+
+      Returns:
+         int: Number of messages gathered.
+      """
+      async with self.new_task.span("gather.shard", shard=shard, channels=len(channels)) as task:
+         self.log.info(f"{task}: Gathering {len(channels)} channel(s) on shard {shard}...")
+         total = 0
+         for channel in channels:
+            total += await self.gather_flotsam(channel)
+         task.set(count=total)
+         self.log.info(f"{task}: Done with shard {shard} ({total} message(s)) after {format_duration(task.elapsed())}.")
+         return total
+
    async def try_channel(self, channel: int) -> SwashbotMessageable:
       """Return full Discord channel object given channel ID
 
+      Uses the gateway cache when it can, so only unknown channels cost a REST call.
+
       Args:
          channel: Channel ID
       """
+      discord_channel = self.get_channel(channel)
+      if discord_channel is not None:
+         assert isinstance(discord_channel, SwashbotMessageable)
+         return discord_channel
+
       task = self.new_task()
       self.log.debug(f"{task}: Trying to fetch channel {channel}...")
       discord_channel = await self.fetch_channel(channel)
@@ -219,82 +707,454 @@ class Swashbot(commands.Bot):
    async def gather_flotsam(self, channel: int) -> int:
       """Keep a record of messages in a channel
 
+      Only one gather runs per channel at a time. Asking while one is under
+      way shares it, and has it gather once more when it's done, since the
+      settings it read may be stale by then; every ask in the meantime shares
+      that one extra gather.
+
       Args:
          channel: Channel ID
 
       Returns:
          int: Number of messages gathered.
       """
-      task = self.new_task()
-      self.log.info(f"{task}: Gathering flotsam for channel {channel}...")
-      start = datetime.utcnow()
+      gather = self.gathers.get(channel)
+      if gather is None:
+         gathering = self.gatherings[channel] = Gathering()
+         gather = self.gathers[channel] = asyncio.create_task(self.gather_rounds(channel, gathering))
+      else:
+         self.gatherings[channel].again = True
+      # a cancelled caller shouldn't cancel the gather for everyone else
+      return await asyncio.shield(gather)
+
+   async def gather_rounds(self, channel: int, gathering: Gathering) -> int:
+      """Gather a channel until nobody's asked for it again, letting asks pile up in between
+      """
+      try:
+         while True:
+            gathering.again = False
+            gathering.clear()
+            count = await self.gather_once(channel, gathering)
+            if not gathering.again: return count
+            await asyncio.sleep(_swashbot_gather_debounce_seconds)
+      finally:
+         del self.gatherings[channel]
+         del self.gathers[channel]
+
+   async def gather_once(self, channel: int, gathering: Gathering) -> int:
+      async with self.new_task.span("gather", channel=channel) as task:
+         self.log.info(f"{task}: Gathering flotsam for channel {channel}...")
 
-      settings = self.memo.settings[channel]
-      if not settings: return 0
+         settings = self.memo.settings.get(channel)
+         if not settings: return 0
+         if not self.owns(channel):
+            self.log.info(f"{task}: Channel {channel} belongs to another shard group or node, so I'll leave it be.")
+            return 0
+         if self.is_deckless(channel):
+            self.decks.pop(channel, None)
+            self.tides[channel] = 0.0
+            self.log.info(f"{task}: Channel {channel} only washes by time, so I'll sweep its history instead of gathering.")
+            return 0
+         self.tides.pop(channel, None)
+
+         try:
+            discord_channel = await self.try_channel(channel)
+         except discord.NotFound:
+            self.channel_gone(channel)
+            return 0
+         deck = Deck()
+         archiver = self.archiver if channel in self.memo.archived else None
+         if archiver is not None: archiver.forget(channel)
+
+         backfill = self.memo.backfills.get(channel)
+         if backfill is not None and backfill.settings != settings:
+            self.memo.end_backfill(channel)
+            backfill = None
+         # with no message count limit, a long history would all land in the
+         # deck at once, so the due part past a point is left to a backfill,
+         # as is anything too old to bulk-delete, which it washes one by one
+         due_before = due_snowflake(settings.minutes) if isinf(settings.at_most) else 0
+         cliff = bulk_delete_cutoff()
+         due = 0
+
+         self.busy_level += 1
+         try:
+            limit = None if isinf(settings.at_most) else int(settings.at_most + 10)
+            async for message in discord_channel.history(limit=limit):
+               if message.pinned: continue
+               if backfill is not None and message.id < backfill.boundary: break
+               if backfill is None and message.id <= due_before and len(deck) >= settings.at_least:
+                  due += 1
+                  if due > _backfill_threshold or message.id <= cliff:
+                     backfill = Backfill(channel, self.memo.guilds[channel], settings, message.id + 1, message.id + 1)
+                     self.memo.save_backfill(backfill)
+                     self.log.info(f"{task}: Channel {channel} has a long history to wash away, so I'll leave what's past {_backfill_threshold} due message(s) or too old to bulk-delete to a backfill.")
+                     break
+               deck.append_old(message)
+               if archiver is not None: archiver.remember(message)
+         finally:
+            self.busy_level -= 1
+
+         # messages sent or deleted while the history was coming in
+         gathering.merge(deck)
+         self.decks[channel] = deck
+         elapsed = task.elapsed()
+         self.metrics.gather_seconds.observe(elapsed)
+         task.set(count=len(deck), api_calls=2 + len(deck) // 100) # the channel, plus pages of history
+         if self.trace is not None:
+            self.trace.settings(channel, self.memo.guilds[channel], settings)
+            self.trace.snapshot(channel, list(reversed(deck.memo)))
+
+         self.log.info(f"{task}: Finished gathering flotsam for {discord_channel.name!r} ({channel}) (about {len(deck)} messages(s) after {format_duration(elapsed)}).")
+         return len(deck)
+
+   def is_deckless(self, channel: int) -> bool:
+      """Whether a channel is washed by `sweep` rather than from a deck
+
+      Only time-only channels can be, since nothing else needs to know how
+      many messages a channel has.
+      """
+      settings = self.memo.settings.get(channel)
+      return deckless and settings is not None and settings.time_only
+
+   async def sweep(self, channel: int) -> int:
+      """Wash away due messages in a deckless channel straight from its history
+
+      Pages through history from when messages became due, then peeks at the
+      oldest message left to know when the next sweep is due. Nothing about
+      the channel's messages is kept in between.
+
+      Like `gather_flotsam`, a sweep only takes on so many due messages, and
+      leaves the rest of a long history to a backfill, along with anything
+      too old to bulk-delete, so that one channel can't hold up the rest of
+      its shard for hours.
+
+      Args:
+         channel: Channel ID
+
+      Returns:
+         int: Number of messages washed away.
+      """
+      settings = self.memo.settings.get(channel)
+      if settings is None:
+         self.release(channel)
+         return 0
+
+      cutoff = due_snowflake(settings.minutes)
+      if not cutoff:
+         # no message is old enough to be due yet
+         self.tides[channel] = inf
+         return 0
 
       try:
          discord_channel = await self.try_channel(channel)
       except discord.NotFound:
-         if channel in self.memo.settings: self.memo.remove(channel)
+         self.channel_gone(channel)
          return 0
-      deck = Deck()
+      if not await self.check_permissions(discord_channel, _permission_to_wash): return 0
 
-      limit = None if isinf(settings.at_most) else int(settings.at_most + 10)
-      async for message in discord_channel.history(limit=limit):
-         if message.pinned: continue
-         deck.append_old(message)
+      backfill = self.memo.backfills.get(channel)
+      if backfill is not None and backfill.settings != settings:
+         self.memo.end_backfill(channel)
+         backfill = None
+      # anything before a backfill's boundary is the backfill's to wash, and
+      # without one yet, so is anything past the bulk delete cliff
+      after = backfill.boundary - 1 if backfill is not None else bulk_delete_cutoff()
+      deleted = await self.delete_messages(channel, limit=_backfill_threshold, before=cutoff + 1, after=after)
 
-      self.decks[channel] = deck
+      # the newest due message left, whether past the limit or the cliff
+      left = None
+      async for message in discord_channel.history(limit=BULK_DELETE_LIMIT, before=discord.Object(cutoff + 1),
+         after=discord.Object(backfill.boundary - 1) if backfill is not None else None,
+      ):
+         if message.pinned: continue
+         left = message
+         break
+      if left is not None:
+         if backfill is None:
+            backfill = Backfill(channel, self.memo.guilds[channel], settings, left.id + 1, left.id + 1)
+            self.memo.save_backfill(backfill)
+            self.log.info(f"Channel {channel} has a long history to wash away, so I'll leave what's past {_backfill_threshold} due message(s) or too old to bulk-delete to a backfill.")
+         else:
+            # more came due since the backfill started than one sweep takes on
+            self.tides[channel] = 0.0
+            return deleted
 
-      minutes, seconds = (int((datetime.utcnow() - start).total_seconds()), 60)
-      if seconds == 60: seconds = 0 # weird divmod bug
-      time = f"{minutes}m {seconds}s" if minutes else f"{seconds}s"
-      self.log.info(f"{task}: Finished gathering flotsam for {discord_channel.name!r} ({channel}) (about {len(deck)} messages(s) after {time}).")
-      return len(deck)
+      # a message arriving while we peek sets the tide itself
+      self.tides[channel] = inf
+      tide = inf
+      async for message in discord_channel.history(limit=BULK_DELETE_LIMIT, after=discord.Object(cutoff), oldest_first=True):
+         if message.pinned: continue
+         tide = message.created_at.timestamp() + settings.minutes * 60
+         break
+      if channel in self.tides: self.tides[channel] = min(self.tides[channel], tide)
+      return deleted
 
-   async def try_delete(self, discord_channel: SwashbotMessageable, id: int) -> None:
+   async def try_delete(self, discord_channel: SwashbotMessageable, id: int) -> bool:
       """Attempt to delete a single message
 
       Args:
          discord_channel: Full Discord channel object
          id: Discord message ID
+
+      Returns:
+         bool: Whether the message was deleted.
       """
       try:
          message = await discord_channel.fetch_message(id)
       except discord.NotFound:
          self.log.debug(f"Message {id} was not found.")
-         return
-      if message.pinned: return
+         return False
+      if message.pinned: return False
       while self.is_ws_ratelimited(): await asyncio.sleep(0)
+      deleted = False
       try:
          await message.delete()
          self.messages_deleted += 1
+         deleted = True
       except discord.Forbidden:
          pass
       await asyncio.sleep(_swashbot_throttle_seconds)
+      return deleted
+
+   async def pinned(self, discord_channel: SwashbotMessageable) -> set[int]:
+      """IDs of a channel's pinned messages, fetched once and then kept until the pins change
+      """
+      pinned = self.pins.get(discord_channel.id)
+      if pinned is None:
+         pinned = {message.id async for message in discord_channel.pins(limit=None)}
+         self.pins[discord_channel.id] = pinned
+      return pinned
+
+   async def wash_away(self, discord_channel: SwashbotMessageable, ids: list[int], due: list[float]) -> None:
+      """Delete some messages that have already been popped from a deck
+
+      Hands the whole batch to the deletion workers if there are any. Otherwise
+      deletes them here, in bulk deletes of up to 100 for messages young
+      enough, and one at a time for the rest.
+
+      Args:
+         discord_channel: Full Discord channel object
+         ids: Discord message IDs
+         due: For each message, the UNIX time it became due to be washed away
+      """
+      async with self.new_task.span("wash.batch", channel=discord_channel.id, count=len(ids)) as span:
+         if self.archiver is not None and discord_channel.id in self.memo.archived:
+            span.set(archived=await self.archiver.archive(discord_channel.id, ids))
+
+         if self.deletion_pool is not None:
+            self.pending_due.update(zip(ids, due))
+            self.deletion_pool.submit(discord_channel.id, ids)
+            span.set(pooled=True)
+            return
+
+         # drift checks mustn't mistake these for messages missing from the deck
+         self.washing.update(ids)
+         try:
+            due_at = dict(zip(ids, due))
+            young, old = split_at_cliff(ids, bulk_delete_cutoff())
+            deleted = 0
+            api_calls = 0
+
+            if young:
+               pinned = await self.pinned(discord_channel)
+               young = [id for id in young if id not in pinned]
+            for start in range(0, len(young), BULK_DELETE_LIMIT):
+               batch = young[start:start + BULK_DELETE_LIMIT]
+               api_calls += 1
+               try:
+                  await discord_channel.delete_messages([discord.Object(id) for id in batch])
+               except discord.Forbidden:
+                  break
+               except discord.HTTPException as e:
+                  # e.g. a message that was already gone; fall back to one at a time
+                  self.log.debug(f"Bulk delete of {len(batch)} message(s) in {discord_channel.id} failed ({e}), deleting them one at a time.")
+                  old = batch + old
+                  continue
+               now = time.time()
+               for id in batch: self.metrics.deletion_lag.observe(max(0.0, now - due_at[id]))
+               self.messages_deleted += len(batch)
+               deleted += len(batch)
+
+            for id in old:
+               if await self.try_delete(discord_channel, id):
+                  self.metrics.deletion_lag.observe(max(0.0, time.time() - due_at[id]))
+                  deleted += 1
+                  api_calls += 2 # a fetch, plus the delete
+               else:
+                  api_calls += 1
+            span.set(deleted=deleted, bulk=len(young), api_calls=api_calls)
+         finally:
+            self.washing.difference_update(ids)
+
+   async def backfill(self, backfill: Backfill, spare: Callable[[], bool]) -> int:
+      """Wash away one page of a backfill's history, then record how far it got
 
-   async def delete_messages(self, channel: int, *, limit: int, beside: Optional[int]=None) -> None:
-      """Delete a number of a channel's most recent messages
+      Messages young enough go in one bulk delete. Older ones are deleted one
+      at a time, stopping as soon as ``spare`` says routine washing needs the
+      rate limit back. Finishes the backfill once history runs out.
+
+      Args:
+         backfill: The backfill to move along
+         spare: Whether there's spare capacity to keep going
+
+      Returns:
+         int: Number of messages deleted.
+      """
+      channel = backfill.channel
+      try:
+         discord_channel = await self.try_channel(channel)
+      except discord.NotFound:
+         self.channel_gone(channel)
+         return 0
+      if not await self.check_permissions(discord_channel, _permission_to_wash): return 0
+
+      messages = [message async for message in discord_channel.history(limit=BULK_DELETE_LIMIT, before=discord.Object(backfill.cursor))]
+      if not messages:
+         self.log.info(f"Finished backfilling channel {channel} after {backfill.deleted} deletion(s) and {format_duration(backfill.seconds)}.")
+         self.memo.end_backfill(channel)
+         return 0
+
+      archiver = self.archiver if channel in self.memo.archived else None
+      cutoff = bulk_delete_cutoff()
+      young = [message for message in messages if message.id > cutoff]
+      old = messages[len(young):] # history is newest first
+      deleted = 0
+
+      batch = [message for message in young if not message.pinned]
+      if archiver is not None:
+         for message in batch: await archiver.put(message_record(message))
+      try:
+         if batch: await discord_channel.delete_messages(batch)
+         deleted += len(batch)
+         if young: backfill.cursor = young[-1].id
+      except discord.Forbidden:
+         return 0
+      except discord.HTTPException:
+         # e.g. a message that was already gone; fall back to one at a time
+         old = batch + old
+
+      for message in old:
+         if not spare(): break
+         if not message.pinned:
+            if archiver is not None: await archiver.put(message_record(message))
+            try:
+               await message.delete()
+               deleted += 1
+            except discord.NotFound:
+               pass
+            except discord.Forbidden:
+               break
+            await asyncio.sleep(_swashbot_throttle_seconds)
+         backfill.cursor = min(backfill.cursor, message.id)
+
+      backfill.deleted += deleted
+      self.messages_deleted += deleted
+      self.memo.save_backfill(backfill)
+      return deleted
+
+   async def collect_deletions(self) -> None:
+      """Tally up deletions reported back by the deletion workers
+      """
+      assert self.deletion_pool is not None
+      async for channel, handled, deleted in self.deletion_pool.results():
+         self.messages_deleted += len(deleted)
+         now = time.time()
+         for id in deleted:
+            due_at = self.pending_due.get(id)
+            if due_at is not None: self.metrics.deletion_lag.observe(max(0.0, now - due_at))
+         for id in handled:
+            self.pending_due.pop(id, None)
+
+   async def delete_messages(self, channel: int, *, limit: Optional[int], beside: Optional[int]=None,
+      include: Optional[int]=None, before: Optional[int]=None, after: Optional[int]=None,
+      filter: PurgeFilter=PurgeFilter(),
+   ) -> int:
+      """Delete matching messages among a channel's most recent ones
+
+      Streams through history a page at a time, bulk-deleting messages young
+      enough in batches of up to 100, and only deleting older ones one by one.
+      In archived channels, only messages actually deleted get archived.
 
       Args:
          channel: Channel ID
 
       Keyword Args:
-         limit: Integer number of messages to delete
-         beside: Message ID of message to avoi deleting
+         limit: Integer number of messages to look through, or None for all of them
+         beside: Message ID of message to avoid deleting
+         include: Message ID to delete along with the rest, whether or not it
+            matches (e.g. the command message), without counting towards ``limit``
+         before: Only look at messages before this message ID
+         after: Only look at messages after this message ID
+         filter: Which messages to delete
+
+      Returns:
+         int: Number of messages deleted.
       """
-      if beside is not None: limit += 1
+      for skipped in (beside, include):
+         if skipped is not None and limit is not None and (before is None or skipped < before): limit += 1
       discord_channel = await self.try_channel(channel)
-      async for message in discord_channel.history(limit=limit):
-         if message.id == beside: continue
+      archiver = self.archiver if channel in self.memo.archived else None
+      cutoff = bulk_delete_cutoff()
+      batch: list[discord.abc.Snowflake] = [discord.Object(include)] if include is not None else []
+      deleted = 0
+      counted = 0 # deletions `try_delete` already counted towards messages_deleted
+      # matched messages, archived only once they're actually deleted
+      matched: dict[int, discord.Message] = {}
+
+      async def archive(ids: list[int]) -> None:
+         if archiver is None: return
+         for id in ids:
+            message = matched.pop(id, None)
+            if message is None: continue # e.g. the command message
+            archiver.forget(channel, [id])
+            await archiver.put(message_record(message))
+
+      async def flush() -> None:
+         nonlocal batch, deleted, counted
+         if not batch: return
+         ids = [message.id for message in batch]
+         try:
+            await discord_channel.delete_messages(batch)
+         except discord.Forbidden:
+            ids = []
+         except discord.HTTPException as e:
+            # e.g. a message that was already gone; fall back to one at a time
+            self.log.debug(f"Bulk delete of {len(batch)} message(s) in {channel} failed ({e}), deleting them one at a time.")
+            ids = [id for id in ids if await self.try_delete(discord_channel, id)]
+            counted += len(ids)
+         deleted += len(ids)
+         await archive(ids)
+         batch = []
+
+      async for message in discord_channel.history(limit=limit, oldest_first=False,
+         before=discord.Object(before) if before is not None else None,
+         after=discord.Object(after) if after is not None else None,
+      ):
+         if message.id in (beside, include): continue
          if message.pinned: continue
+         if not filter.matches(message): continue
+         if archiver is not None: matched[message.id] = message
+
+         if message.id > cutoff:
+            batch.append(message)
+            if len(batch) >= BULK_DELETE_LIMIT: await flush()
+            continue
+
+         # everything from here on is too old for bulk deletes
+         await flush()
          try:
             await message.delete()
-            self.messages_deleted += 1
-         except discord.Forbidden:
-            pass
+            deleted += 1
+            await archive([message.id])
+         except (discord.Forbidden, discord.NotFound):
+            matched.pop(message.id, None)
          await asyncio.sleep(_swashbot_throttle_seconds)
 
+      await flush()
+      self.messages_deleted += deleted - counted
+      return deleted
+
    async def check_permissions(self, channel: SwashbotMessageable, required: discord.Permissions, *,
       inform: Optional[discord.Message]=None
    ) -> bool:
@@ -309,7 +1169,7 @@ class Swashbot(commands.Bot):
          inform: The Message to try to contact if we don't have enough permissions
       """
       if self.user is None: return False
-      self_member = channel.guild.get_member(self.user.id)
+      self_member = channel.guild.me
 
       if self_member is None:
          self.log.warning((
@@ -333,7 +1193,6 @@ class Swashbot(commands.Bot):
          inform_channel_perms = inform.channel.permissions_for(self_member)
          msg = f"I need the following permission(s): {missing} 🙏"
          if inform_channel_perms.send_messages:
-            async with channel.typing(): await asyncio.sleep(1)
             if inform_channel_perms.read_message_history:
                await inform.reply(msg)
             else:
@@ -18,11 +18,14 @@ except ImportError as e:
    raise e
 
 from main import Swashbot
-from config import SWASHBOT_TOKEN, logging_setup
+from config import SWASHBOT_TOKEN, logging_setup, client_profile
+from utils.resources import use_fast_event_loop
 
 if logging_setup:
    setup_logging(**logging_setup)
 
 if __name__ == "__main__":
+   if client_profile["fast_event_loop"]:
+      use_fast_event_loop()
    bot = Swashbot()
    bot.run(SWASHBOT_TOKEN)
\ No newline at end of file
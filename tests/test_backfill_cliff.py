@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from math import inf
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Optional
+
+import discord
+import discord.utils
+
+os.environ.setdefault("SWASHBOT_TOKEN", "test")
+os.environ.setdefault("SWASHBOT_LOG", "")
+
+from main import Swashbot
+from utils.flotsam import Gathering
+from utils.logging import TaskTracker
+from utils.memory import LongTermMemory, Settings
+from utils.metrics import Metrics
+
+class FakeChannel:
+   def __init__(self, ids: list[int]) -> None:
+      self.id = 10
+      self.name = "old"
+      self.ids = sorted(ids)
+
+   async def history(self, *, limit: Optional[int]=100, before: Optional[discord.Object]=None,
+      after: Optional[discord.Object]=None, oldest_first: bool=False,
+   ):
+      ids = [
+         id for id in self.ids
+         if (before is None or id < before.id) and (after is None or id > after.id)
+      ]
+      if not oldest_first: ids.reverse()
+      for id in ids[:limit]:
+         yield SimpleNamespace(id=id, pinned=False, created_at=discord.utils.snowflake_time(id))
+
+def weeks_old(count: int) -> list[int]:
+   """Snowflakes for messages three to four weeks old, well past the bulk delete cliff
+   """
+   now = datetime.now(timezone.utc)
+   return [discord.utils.time_snowflake(now - timedelta(days=21, minutes=i)) for i in range(count)]
+
+def fake_client(tmp_path: Path, ids: list[int]) -> SimpleNamespace:
+   memo = LongTermMemory(tmp_path / "swashbot.ltm")
+   memo.save(10, 1, Settings(0, inf, 60))
+   channel = FakeChannel(ids)
+
+   async def try_channel(id: int) -> FakeChannel:
+      return channel
+
+   async def check_permissions(channel: FakeChannel, required: discord.Permissions) -> bool:
+      return True
+
+   return SimpleNamespace(
+      memo=memo,
+      new_task=TaskTracker(),
+      log=logging.getLogger("test"),
+      metrics=Metrics(),
+      trace=None,
+      archiver=None,
+      busy_level=0,
+      decks={},
+      tides={},
+      owns=lambda channel: True,
+      is_deckless=lambda channel: False,
+      try_channel=try_channel,
+      check_permissions=check_permissions,
+   )
+
+def test_gather_leaves_history_past_cliff_to_backfill(tmp_path: Path) -> None:
+   ids = weeks_old(50)
+   client = fake_client(tmp_path, ids)
+
+   count = asyncio.run(Swashbot.gather_once(client, 10, Gathering()))
+
+   assert count == 0
+   backfill = client.memo.backfills[10]
+   assert backfill.boundary == backfill.cursor == max(ids) + 1
+
+def test_sweep_leaves_history_past_cliff_to_backfill(tmp_path: Path) -> None:
+   ids = weeks_old(50)
+   client = fake_client(tmp_path, ids)
+   asked = []
+
+   async def delete_messages(channel: int, **kwargs) -> int:
+      asked.append(kwargs)
+      return 0
+   client.delete_messages = delete_messages
+
+   deleted = asyncio.run(Swashbot.sweep(client, 10))
+
+   assert deleted == 0
+   # only what's still young enough to bulk-delete is swept
+   assert asked[0]["after"] > max(ids)
+   backfill = client.memo.backfills[10]
+   assert backfill.boundary == max(ids) + 1
+   assert client.tides[10] == inf
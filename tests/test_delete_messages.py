@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Optional
+
+import discord
+import discord.utils
+import pytest
+
+os.environ.setdefault("SWASHBOT_TOKEN", "test")
+os.environ.setdefault("SWASHBOT_LOG", "")
+
+import main
+from main import Swashbot
+
+class FakeMessage:
+   def __init__(self, channel: "FakeChannel", id: int) -> None:
+      self.channel = channel
+      self.id = id
+      self.guild = None
+      self.author = SimpleNamespace(id=7)
+      self.created_at = discord.utils.snowflake_time(id)
+      self.edited_at = None
+      self.content = f"message {id}"
+      self.attachments = []
+      self.embeds = []
+      self.pinned = False
+
+   async def delete(self) -> None:
+      if self.id not in self.channel.messages: raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "Unknown Message")
+      del self.channel.messages[self.id]
+
+class FakeChannel:
+   """A channel whose bulk deletes always fail, like when one of the messages is already gone
+   """
+   def __init__(self, ids: list[int]) -> None:
+      self.id = 10
+      self.messages = {id: FakeMessage(self, id) for id in ids}
+      self.listed = list(self.messages.values())
+
+   async def history(self, *, limit: Optional[int], before: Optional[discord.Object]=None,
+      after: Optional[discord.Object]=None, oldest_first: bool=False,
+   ):
+      for message in sorted(self.listed, key=lambda message: message.id, reverse=True)[:limit]:
+         yield message
+
+   async def delete_messages(self, messages: list[discord.abc.Snowflake]) -> None:
+      raise discord.HTTPException(SimpleNamespace(status=400, reason="Bad Request"), "Unknown Message")
+
+   async def fetch_message(self, id: int) -> FakeMessage:
+      if id not in self.messages: raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "Unknown Message")
+      return self.messages[id]
+
+def test_failed_bulk_delete_falls_back_and_archives_only_deleted(monkeypatch: pytest.MonkeyPatch) -> None:
+   monkeypatch.setattr(main, "_swashbot_throttle_seconds", 0)
+   now = datetime.now(timezone.utc)
+   ids = [discord.utils.time_snowflake(now) + i for i in range(5)]
+   channel = FakeChannel(ids)
+   gone = ids[2]
+   del channel.messages[gone] # deleted by someone else meanwhile
+
+   archived = []
+   async def put(record: dict) -> None:
+      archived.append(record["id"])
+
+   async def try_channel(id: int) -> FakeChannel:
+      return channel
+
+   client = SimpleNamespace(
+      log=logging.getLogger("test"),
+      messages_deleted=0,
+      memo=SimpleNamespace(archived={10: 1}),
+      archiver=SimpleNamespace(forget=lambda channel, ids=None: None, put=put),
+      try_channel=try_channel,
+      is_ws_ratelimited=lambda: False,
+   )
+   client.try_delete = lambda discord_channel, id: Swashbot.try_delete(client, discord_channel, id)
+
+   deleted = asyncio.run(Swashbot.delete_messages(client, 10, limit=None))
+
+   assert deleted == 4
+   assert client.messages_deleted == 4
+   assert not channel.messages
+   assert sorted(archived) == sorted(id for id in ids if id != gone)
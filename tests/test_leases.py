@@ -0,0 +1,33 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from utils.leases import LeaseTable
+from utils.memory import LongTermMemory, Settings
+
+def test_heartbeat_keeps_policy_only_guild(tmp_path: Path) -> None:
+   file = tmp_path / "swashbot.ltm"
+   memo = LongTermMemory(file)
+   memo.set_policy(42, 42, Settings(0, float("inf"), 60))
+
+   now = [1000.0]
+   leases = LeaseTable(file, "a", ttl=30, clock=lambda: now[0])
+   assert leases.heartbeat() == ({42}, set())
+   now[0] += 10
+   assert leases.heartbeat() == (set(), set())
+   assert leases.held == {42}
+   leases.close()
+
+def test_heartbeat_and_claim_from_threads(tmp_path: Path) -> None:
+   file = tmp_path / "swashbot.ltm"
+   memo = LongTermMemory(file)
+   for guild in range(1, 21):
+      memo.set_policy(guild, guild, Settings(0, float("inf"), 60))
+
+   leases = LeaseTable(file, "a", ttl=30)
+   with ThreadPoolExecutor(max_workers=8) as pool:
+      # unconfigured guilds, so every claim opens a transaction of its own
+      futures = [pool.submit(leases.claim, guild) for guild in range(100, 500)]
+      futures += [pool.submit(leases.heartbeat) for _ in range(200)]
+      for future in futures: future.result()
+   assert leases.held >= set(range(1, 21))
+   leases.close()
@@ -0,0 +1,26 @@
+from math import inf
+from pathlib import Path
+
+from utils.memory import LongTermMemory, Settings, Backfill
+
+def test_forget_guild_drops_only_its_archives_and_backfills(tmp_path: Path) -> None:
+   memo = LongTermMemory(tmp_path / "swashbot.ltm")
+   settings = Settings(0, inf, 60)
+   for channel, guild in ((10, 1), (11, 1), (20, 2)):
+      memo.save(channel, guild, settings)
+      memo.set_archive(channel, guild, True)
+      memo.save_backfill(Backfill(channel, guild, settings, 100, 100))
+   memo.set_archive(11, 1, False)
+   memo.end_backfill(11)
+   assert memo.archived_guilds == {1: {10}, 2: {20}}
+   assert memo.backfill_guilds == {1: {10}, 2: {20}}
+
+   memo.forget_guild(1)
+   assert memo.archived == {20: 2}
+   assert set(memo.backfills) == {20}
+   assert memo.archived_guilds == {2: {20}}
+   assert memo.backfill_guilds == {2: {20}}
+
+   memo.refresh_guild(1)
+   assert memo.archived == {10: 1, 20: 2}
+   assert memo.backfill_guilds == {1: {10}, 2: {20}}
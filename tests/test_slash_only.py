@@ -0,0 +1,39 @@
+import os
+from pathlib import Path
+from types import SimpleNamespace
+
+os.environ.setdefault("SWASHBOT_TOKEN", "test")
+os.environ.setdefault("SWASHBOT_LOG", "")
+
+from main import Swashbot
+from utils.archive import Archiver
+from utils.flotsam import Deck
+
+def test_raw_message_create_is_archived(tmp_path: Path) -> None:
+   archiver = Archiver(tmp_path)
+   deck = Deck()
+   client = SimpleNamespace(
+      ready=True,
+      messages_ingested=0,
+      decks={10: deck},
+      tides={},
+      gatherings={},
+      trace=None,
+      memo=SimpleNamespace(archived={10: 1}),
+      archiver=archiver,
+   )
+   client.ingest = lambda channel, id: Swashbot.ingest(client, channel, id)
+
+   Swashbot.parse_message_create(client, {
+      "id": "123",
+      "channel_id": "10",
+      "guild_id": "1",
+      "author": {"id": "7", "username": "someone"},
+      "timestamp": "2024-01-01T00:00:00+00:00",
+      "content": "",
+   })
+   archiver.close()
+
+   assert 123 in deck.memo
+   record = archiver.held[10][123]
+   assert (record["id"], record["author"], record["created_at"]) == (123, 7, "2024-01-01T00:00:00+00:00")
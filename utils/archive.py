@@ -0,0 +1,160 @@
+from __future__ import annotations
+from typing import Any, Optional, Union
+
+from datetime import datetime
+from pathlib import Path
+import asyncio
+import gzip
+import json
+import logging
+import queue
+import threading
+
+import discord
+
+Record = dict[str, Any]
+
+def message_record(message: discord.Message) -> Record:
+   """What gets archived about a message, taken from the message object we already have
+   """
+   return {
+      "id": message.id,
+      "channel": message.channel.id,
+      "guild": message.guild.id if message.guild is not None else None,
+      "author": message.author.id,
+      "author_name": str(message.author),
+      "created_at": message.created_at.isoformat(),
+      "edited_at": message.edited_at.isoformat() if message.edited_at else None,
+      "content": message.content,
+      "attachments": [attachment.url for attachment in message.attachments],
+      "embeds": [embed.to_dict() for embed in message.embeds],
+   }
+
+def raw_message_record(data: dict) -> Record:
+   """`message_record`, taken straight from a MESSAGE_CREATE payload instead (see slash-only mode)
+   """
+   author = data.get("author", {})
+   return {
+      "id": int(data["id"]),
+      "channel": int(data["channel_id"]),
+      "guild": int(data["guild_id"]) if data.get("guild_id") else None,
+      "author": int(author["id"]) if "id" in author else None,
+      "author_name": author.get("username"),
+      "created_at": data.get("timestamp"),
+      "edited_at": data.get("edited_timestamp"),
+      "content": data.get("content", ""),
+      "attachments": [attachment["url"] for attachment in data.get("attachments", []) if "url" in attachment],
+      "embeds": data.get("embeds", []),
+   }
+
+class Archiver:
+   """Writes washed-away messages to compressed, rotated JSONL segments
+
+   Contents are remembered for archived channels as messages are gathered or
+   arrive, so archiving a batch never needs a REST call. Batches go through a
+   bounded queue to a writer thread, so the washer never waits on disk unless
+   the writer has fallen ``buffer`` records behind, in which case the washer
+   waits for room (backpressure) rather than memory growing without bound.
+
+   Args:
+      directory: Where to write segments
+      segment_bytes: Uncompressed bytes per segment before starting a new one
+      buffer: Records that may be queued for the writer at once
+
+   Attributes:
+      held: Contents of messages in archived channels, by channel then message ID
+      written: Number of records written so far
+      stalls: Number of times the washer had to wait for the writer
+   """
+   def __init__(self, directory: Union[str, Path], *, segment_bytes: int=64 * 1024 * 1024, buffer: int=10_000) -> None:
+      self.directory = Path(directory)
+      self.directory.mkdir(parents=True, exist_ok=True)
+      self.segment_bytes = segment_bytes
+      self.held: dict[int, dict[int, Record]] = {}
+      self.queue: queue.Queue[Optional[Record]] = queue.Queue(maxsize=buffer)
+      self.written = 0
+      self.stalls = 0
+      self.log = logging.getLogger("swashbot.archive")
+      self.thread = threading.Thread(target=self._write, name="swashbot-archive", daemon=True)
+      self.thread.start()
+
+   def remember(self, message: discord.Message) -> None:
+      self.held.setdefault(message.channel.id, {})[message.id] = message_record(message)
+
+   def remember_raw(self, data: dict) -> None:
+      record = raw_message_record(data)
+      self.held.setdefault(record["channel"], {})[record["id"]] = record
+
+   def edit(self, channel: int, id: int, data: dict) -> None:
+      record = self.held.get(channel, {}).get(id)
+      if record is None: return
+      if "content" in data: record["content"] = data["content"]
+      if data.get("edited_timestamp"): record["edited_at"] = data["edited_timestamp"]
+
+   def forget(self, channel: int, ids: Optional[list[int]]=None) -> None:
+      """Drop remembered contents, for a whole channel or some messages
+      """
+      if ids is None:
+         self.held.pop(channel, None)
+         return
+      records = self.held.get(channel)
+      if records is None: return
+      for id in ids: records.pop(id, None)
+
+   async def archive(self, channel: int, ids: list[int]) -> int:
+      """Queue the remembered contents of some messages about to be washed away
+
+      Returns:
+         int: Number of messages archived (those whose contents were remembered).
+      """
+      records = self.held.get(channel, {})
+      archived = 0
+      for id in ids:
+         record = records.pop(id, None)
+         if record is None: continue
+         await self.put(record)
+         archived += 1
+      return archived
+
+   async def put(self, record: Record) -> None:
+      try:
+         self.queue.put_nowait(record)
+      except queue.Full:
+         self.stalls += 1
+         await asyncio.to_thread(self.queue.put, record)
+
+   def close(self) -> None:
+      """Write out everything queued, then stop the writer
+      """
+      self.queue.put(None)
+      self.thread.join()
+
+   def _segment(self) -> Path:
+      stamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+      file = self.directory / f"archive-{stamp}.jsonl.gz"
+      n = 1
+      while file.exists():
+         file = self.directory / f"archive-{stamp}-{n}.jsonl.gz"
+         n += 1
+      return file
+
+   def _write(self) -> None:
+      stream: Optional[gzip.GzipFile] = None
+      size = 0
+      try:
+         while True:
+            record = self.queue.get()
+            if record is None: break
+            if stream is None or size >= self.segment_bytes:
+               if stream is not None: stream.close()
+               file = self._segment()
+               self.log.info(f"Archiving to {file}.")
+               stream = gzip.open(file, "ab", compresslevel=6)
+               size = 0
+            line = (json.dumps(record, ensure_ascii=False, default=str) + "\n").encode()
+            stream.write(line)
+            size += len(line)
+            self.written += 1
+            if self.queue.empty(): stream.flush()
+      finally:
+         if stream is not None: stream.close()
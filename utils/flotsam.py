@@ -1,20 +1,30 @@
 from __future__ import annotations
-from dataclasses import dataclass
-from typing import Optional, Generic, TypeVar
+from dataclasses import dataclass, field
+from typing import Iterable, Optional, Generic, TypeVar
 
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from math import isinf
 
 import discord
+from discord.utils import snowflake_time
 
-@dataclass
+from utils.memory import Settings
+
+@dataclass(slots=True)
 class Message:
    """Simple node class for Deck
+
+   Only the ID is stored; the creation time is already encoded in the
+   snowflake, so it's derived on demand rather than kept per node.
    """
    id: int
-   created_at: datetime
    next: Optional[Message] = None
    prev: Optional[Message] = None
 
+   @property
+   def created_at(self) -> datetime:
+      return snowflake_time(self.id)
+
 class Deck:
    """Double-ended queue (deque) of Discord messages
    
@@ -37,7 +47,12 @@ class Deck:
    def append_new(self, message: discord.Message) -> None:
       """Add a new _recent_ message to the deque
       """
-      node = Message(message.id, message.created_at)
+      self.append_id(message.id)
+
+   def append_id(self, id: int) -> None:
+      """Add a new _recent_ message to the deque, given only its ID
+      """
+      node = Message(id)
 
       if self.newest is not None:
          node.prev = self.newest
@@ -48,12 +63,12 @@ class Deck:
       if self.oldest is None:
          self.oldest = node
 
-      self.memo[message.id] = node
+      self.memo[id] = node
 
    def append_old(self, message: discord.Message) -> None:
       """Add a new _old_ message to the deque
       """
-      node = Message(message.id, message.created_at)
+      node = Message(message.id)
 
       if self.oldest is not None:
          node.next = self.oldest
@@ -126,4 +141,174 @@ class Deck:
    def clear(self) -> None:
       self.oldest = None
       self.newest = None
-      self.memo = {}
\ No newline at end of file
+      self.memo = {}
+
+   def reconcile(self, low: int, high: int, ids: Iterable[int]) -> tuple[int, int]:
+      """Make the part of the deck between two snowflakes (inclusive) hold exactly the given message IDs
+
+      Only that part of the list is walked and relinked, starting from any of
+      ``ids`` the deck already has, so a window that mostly matches is cheap.
+
+      Args:
+         low: Oldest snowflake of the range
+         high: Newest snowflake of the range
+         ids: Every message ID in the range that should be in the deck
+
+      Returns:
+         tuple: (messages added, messages removed)
+      """
+      wanted = sorted(set(ids))
+      node = next((self.memo[id] for id in wanted if id in self.memo), None)
+      if node is not None:
+         while node.prev is not None and node.prev.id >= low: node = node.prev
+      else:
+         node = self.oldest
+         while node is not None and node.id < low: node = node.next
+
+      before = node.prev if node is not None else self.newest
+      inside: list[Message] = []
+      while node is not None and node.id <= high:
+         inside.append(node)
+         node = node.next
+      after = node
+
+      if [node.id for node in inside] == wanted: return 0, 0
+
+      # a message the deck has somewhere else (i.e. out of order) stays where it is
+      inside_ids = {node.id for node in inside}
+      wanted = [id for id in wanted if id not in self.memo or id in inside_ids]
+      keep = set(wanted)
+      removed = 0
+      for node in inside:
+         if node.id not in keep:
+            del self.memo[node.id]
+            removed += 1
+      added = 0
+      for id in wanted:
+         if id not in self.memo:
+            self.memo[id] = Message(id)
+            added += 1
+
+      previous = before
+      for id in wanted:
+         node = self.memo[id]
+         node.prev = previous
+         if previous is None: self.oldest = node
+         else: previous.next = node
+         previous = node
+      if previous is None: self.oldest = after
+      else: previous.next = after
+      if after is None: self.newest = previous
+      else: after.prev = previous
+
+      return added, removed
+
+@dataclass
+class Gathering:
+   """What happens in a channel while its history is being gathered
+
+   History pages can't see messages sent or deleted once they've been
+   fetched, so these are noted down here and merged into the new deck once
+   it's done.
+
+   Attributes:
+      arrived: IDs of messages sent meanwhile
+      deleted: IDs of messages deleted meanwhile
+      again: Whether another gather was asked for meanwhile
+   """
+   arrived: list[int] = field(default_factory=list)
+   deleted: set[int] = field(default_factory=set)
+   again: bool = False
+
+   def merge(self, deck: Deck) -> None:
+      """Bring a freshly gathered deck up to date
+      """
+      for id in self.deleted:
+         if id in deck.memo: deck.remove(id)
+      for id in sorted(self.arrived):
+         if id in deck.memo or id in self.deleted: continue
+         # anything older was already in reach of the history pages
+         if deck.newest is not None and id < deck.newest.id: continue
+         deck.append_id(id)
+
+   def clear(self) -> None:
+      self.arrived = []
+      self.deleted = set()
+
+def age_minutes(deck: Deck, now: Optional[datetime]=None) -> float:
+   if deck.oldest is None: return -1
+
+   now = datetime.utcnow() if now is None else now
+   created_at = deck.oldest.created_at.replace(tzinfo=None)
+   
+   return (now - created_at).total_seconds() / 60
+
+def due_count(deck: Deck, settings: Settings, now: Optional[datetime]=None) -> int:
+   """Number of messages in a deck that are due to be washed away
+
+   Walks only the messages that are due, starting from the oldest.
+   """
+   if not deck: return 0
+
+   over = int(max(0, len(deck) - settings.at_most))
+   if isinf(settings.minutes): return over
+
+   now = datetime.now(timezone.utc) if now is None else now.replace(tzinfo=timezone.utc)
+   cutoff = discord.utils.time_snowflake(now - timedelta(minutes=settings.minutes), high=True)
+
+   due = 0
+   remaining = len(deck)
+   node = deck.oldest
+   while node is not None and remaining > settings.at_least:
+      if due >= over and node.id > cutoff: break
+      due += 1
+      remaining -= 1
+      node = node.next
+
+   return due
+
+def due_ids(deck: Deck, settings: Settings, now: Optional[datetime]=None) -> list[int]:
+   """IDs of the messages counted by `due_count`, oldest first
+   """
+   due = due_count(deck, settings, now)
+   ids = []
+   node = deck.oldest
+   while node is not None and len(ids) < due:
+      ids.append(node.id)
+      node = node.next
+   return ids
+
+def due_snowflake(minutes: float, now: Optional[datetime]=None) -> int:
+   """Newest snowflake a message can have and already be ``minutes`` old, or 0 if none can be yet
+   """
+   now = datetime.now(timezone.utc) if now is None else now.replace(tzinfo=timezone.utc)
+   elapsed = now.timestamp() * 1000 - discord.utils.DISCORD_EPOCH - minutes * 60_000
+   if elapsed <= 0: return 0
+   return (int(elapsed) << 22) + (1 << 22) - 1
+
+def due_channels(channels: Iterable[int], decks: dict[int, Deck], settings: dict[int, Settings],
+   now: Optional[datetime]=None,
+) -> list[int]:
+   """Channels with any messages due to be washed away, oldest message first
+
+   A channel has messages due when it's over ``at_least`` and either over
+   ``at_most`` or has its oldest message older than ``minutes``, so this only
+   looks at each deck's length and oldest ID, never the messages in between.
+   """
+   now = datetime.now(timezone.utc) if now is None else now.replace(tzinfo=timezone.utc)
+   # milliseconds since the Discord epoch, the unit snowflakes count in
+   elapsed = now.timestamp() * 1000 - discord.utils.DISCORD_EPOCH
+
+   due: list[tuple[int, int]] = []
+   for channel in channels:
+      deck = decks.get(channel)
+      s = settings.get(channel)
+      if deck is None or deck.oldest is None or s is None: continue
+      length = len(deck.memo)
+      if length <= s.at_least: continue
+      oldest = deck.oldest.id
+      if length > s.at_most or elapsed - (oldest >> 22) >= s.minutes * 60_000:
+         due.append((oldest, channel))
+
+   due.sort()
+   return [channel for _, channel in due]
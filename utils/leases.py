@@ -0,0 +1,196 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Callable, Set, Tuple
+
+from pathlib import Path
+from math import ceil
+import sqlite3
+import threading
+import time
+
+@dataclass
+class LeaseTable:
+   """Guild ownership leases shared by Swashbot instances on one database
+
+   Every instance (node) heartbeats into the same SQLite file. On each
+   heartbeat a node renews its leases, gives up any above its fair share of
+   the configured guilds, and claims unowned or expired guilds up to that
+   share. A node that dies stops renewing, so its leases expire and the
+   surviving nodes take them over.
+
+   Args:
+      file: Path to the SQLite database (normally the same as `LongTermMemory`)
+      node: Unique name of this instance
+      ttl: Seconds a lease stays valid without a heartbeat
+      clock: Returns the current time in seconds (wall clock, shared between processes)
+
+   Attributes:
+      held: IDs of guilds this node currently holds
+      lock: Held around every use of the connection, since heartbeats and
+         claims run on different threads and SQLite transactions can't nest
+   """
+   file: Path
+   node: str
+   ttl: float = 30
+   clock: Callable[[], float] = time.time
+   held: Set[int] = field(default_factory=set)
+
+   def __post_init__(self):
+      # autocommit mode, so that transactions are only what we BEGIN ourselves
+      self.conn = sqlite3.connect(self.file, timeout=10, isolation_level=None, check_same_thread=False)
+      self.lock = threading.Lock()
+      cursor = self.conn.cursor()
+
+      cursor.execute("""
+         CREATE TABLE IF NOT EXISTS lease (
+            guild INTEGER PRIMARY KEY,
+            node TEXT NOT NULL,
+            expires REAL NOT NULL
+         );
+      """)
+      cursor.execute("""
+         CREATE TABLE IF NOT EXISTS node (
+            name TEXT PRIMARY KEY,
+            expires REAL NOT NULL
+         );
+      """)
+      cursor.execute("""
+         CREATE TABLE IF NOT EXISTS memo (
+            channel INTEGER PRIMARY KEY,
+            guild INTEGER,
+            at_least INTEGER,
+            at_most INTEGER,
+            minutes INTEGER
+         );
+      """)
+      cursor.execute("""
+         CREATE TABLE IF NOT EXISTS policy (
+            scope INTEGER PRIMARY KEY,
+            guild INTEGER,
+            at_least INTEGER,
+            at_most INTEGER,
+            minutes INTEGER
+         );
+      """)
+
+   def heartbeat(self, accept: Callable[[int], bool]=lambda guild: True) -> Tuple[Set[int], Set[int]]:
+      """Renew, rebalance and take over leases
+
+      Args:
+         accept: Whether this node is able to serve a guild at all (e.g. it's on one of our shards)
+
+      Returns:
+         tuple: Sets of guild IDs newly acquired and released by this heartbeat.
+      """
+      with self.lock:
+         now = self.clock()
+         expires = now + self.ttl
+         cursor = self.conn.cursor()
+
+         cursor.execute("BEGIN IMMEDIATE;")
+         try:
+            cursor.execute("""
+               INSERT OR REPLACE INTO node (name, expires)
+               VALUES (?, ?);
+            """, (self.node, expires))
+            cursor.execute("""
+               DELETE FROM node
+               WHERE expires <= ?;
+            """, (now,))
+            cursor.execute("SELECT COUNT(*) FROM node;")
+            live, = cursor.fetchone()
+
+            # guilds configured per channel, or only through server or category defaults
+            cursor.execute("SELECT guild FROM memo UNION SELECT guild FROM policy;")
+            candidates = set(guild for guild, in cursor.fetchall() if accept(guild))
+
+            cursor.execute("SELECT guild, node, expires FROM lease;")
+            leases = {guild: (node, until) for guild, node, until in cursor.fetchall()}
+
+            mine = sorted(guild for guild, (node, _) in leases.items() if node == self.node)
+            share = ceil(len(candidates) / max(1, live))
+
+            # give up guilds we can't serve anymore, then anything above our share
+            keep = [guild for guild in mine if guild in candidates][:share]
+            release = set(mine) - set(keep)
+
+            free = sorted(
+               guild for guild in candidates
+               if guild not in leases or (leases[guild][1] <= now and leases[guild][0] != self.node)
+            )
+            claim = free[:max(0, share - len(keep))]
+
+            cursor.executemany("""
+               DELETE FROM lease
+               WHERE guild = ? AND node = ?;
+            """, [(guild, self.node) for guild in release])
+            cursor.executemany("""
+               INSERT OR REPLACE INTO lease (guild, node, expires)
+               VALUES (?, ?, ?);
+            """, [(guild, self.node, expires) for guild in claim])
+            cursor.execute("""
+               UPDATE lease
+               SET expires = ?
+               WHERE node = ?;
+            """, (expires, self.node))
+
+            cursor.execute("COMMIT;")
+         except:
+            cursor.execute("ROLLBACK;")
+            raise
+
+         held = set(keep) | set(claim)
+         acquired = held - self.held
+         released = self.held - held
+         self.held = held
+
+         return acquired, released
+
+
+   def claim(self, guild: int) -> bool:
+      """Claim a single guild right away if nobody else holds it
+
+      Used for guilds that aren't configured yet (e.g. someone's first command there).
+
+      Returns:
+         bool: Whether this node holds the guild.
+      """
+      with self.lock:
+         if guild in self.held: return True
+
+         now = self.clock()
+         cursor = self.conn.cursor()
+
+         cursor.execute("BEGIN IMMEDIATE;")
+         try:
+            cursor.execute("""
+               SELECT node, expires
+               FROM lease
+               WHERE guild = ?;
+            """, (guild,))
+            row = cursor.fetchone()
+            mine = row is None or row[0] == self.node or row[1] <= now
+            if mine:
+               cursor.execute("""
+                  INSERT OR REPLACE INTO lease (guild, node, expires)
+                  VALUES (?, ?, ?);
+               """, (guild, self.node, now + self.ttl))
+            cursor.execute("COMMIT;")
+         except:
+            cursor.execute("ROLLBACK;")
+            raise
+
+         if mine: self.held.add(guild)
+         return mine
+
+
+   def close(self) -> None:
+      """Hand back all leases so other nodes can take over immediately
+      """
+      with self.lock:
+         cursor = self.conn.cursor()
+         cursor.execute("DELETE FROM lease WHERE node = ?;", (self.node,))
+         cursor.execute("DELETE FROM node WHERE name = ?;", (self.node,))
+         self.held = set()
+         self.conn.close()
+
@@ -1,27 +1,133 @@
+from __future__ import annotations
 import logging
 import logging.handlers
 from pathlib import Path
 from typing import Optional, Union, Dict, Any
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+import json
+import queue
+import threading
+import time
 
 import discord
 import discord.utils
 
+_current_span: ContextVar[Optional[Span]] = ContextVar("swashbot_span", default=None)
+
+def format_duration(seconds: float) -> str:
+   """Human-readable duration, e.g. ``2m 5s`` or ``0.42s``
+   """
+   if seconds < 10: return f"{seconds:.2f}s"
+   minutes, seconds = divmod(int(seconds), 60)
+   return f"{minutes}m {seconds}s" if minutes else f"{seconds}s"
+
+class Span:
+   """A timed, labelled piece of work, nested under whichever span was active
+
+   Use as ``async with tracker.span("name", key=value) as span:``. The
+   label (e.g. ``@0001f``) is what log lines are prefixed with.
+
+   Attributes:
+      name: What kind of work this is
+      label: Task label for logging
+      parent: Label of the enclosing span, if any
+      attributes: Extra details, e.g. channel or message count
+      started: UNIX time the span started
+      duration: Seconds the span took (monotonic), once finished
+   """
+   __slots__ = ("tracker", "name", "label", "parent", "attributes", "started", "start", "duration", "token")
+
+   def __init__(self, tracker: TaskTracker, name: str, attributes: Dict[str, Any]) -> None:
+      self.tracker = tracker
+      self.name = name
+      self.label = tracker()
+      parent = _current_span.get()
+      self.parent = parent.label if parent is not None else None
+      self.attributes = attributes
+      self.started = 0.0
+      self.start = 0.0
+      self.duration: Optional[float] = None
+
+   def __str__(self) -> str:
+      return self.label
+
+   def set(self, **attributes: Any) -> None:
+      self.attributes.update(attributes)
+
+   def elapsed(self) -> float:
+      return time.monotonic() - self.start
+
+   async def __aenter__(self) -> Span:
+      self.started = time.time()
+      self.start = time.monotonic()
+      self.token = _current_span.set(self)
+      return self
+
+   async def __aexit__(self, exc_type, exc, tb) -> None:
+      self.duration = self.elapsed()
+      _current_span.reset(self.token)
+      if exc_type is not None: self.attributes["error"] = exc_type.__name__
+      self.tracker.finish(self)
+
+   def as_dict(self) -> Dict[str, Any]:
+      return {
+         "name": self.name,
+         "label": self.label,
+         "parent": self.parent,
+         "started": datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+         "duration": self.duration,
+         "attributes": self.attributes,
+      }
+
 class TaskTracker:
-   """Generates labels for tasks, to help with logging
+   """Generates labels for tasks, to help with logging, and traces spans of work
 
-   Todo:
-      Potential ``async with`` syntax?
+   Calling the tracker gives a fresh label. ``tracker.span(...)`` also times
+   the work and remembers it once finished, in a ring buffer of recent spans
+   and, optionally, a JSONL file written from a background thread.
+
+   Args:
+      digits: Hex digits in each label
+      keep: Number of finished spans to remember
+      export: JSONL file to append finished spans to
    """
    task: int = 0
 
-   def __init__(self, digits: int=5):
+   def __init__(self, digits: int=5, *, keep: int=1000, export: Optional[Union[str, Path]]=None):
       self.digits = digits
       self.format = f"@{{:0{digits}x}}"
+      self.recent: deque[Span] = deque(maxlen=keep)
+      self.exports: Optional[queue.SimpleQueue[Optional[str]]] = None
+      if export:
+         self.exports = queue.SimpleQueue()
+         threading.Thread(target=self._export, args=(Path(export),), name="swashbot-spans", daemon=True).start()
 
    def __call__(self) -> str:
       self.task += 1
       return self.format.format(self.task)
 
+   def span(self, name: str, **attributes: Any) -> Span:
+      return Span(self, name, attributes)
+
+   def finish(self, span: Span) -> None:
+      self.recent.append(span)
+      if self.exports is not None:
+         self.exports.put(json.dumps(span.as_dict(), default=str))
+
+   def close(self) -> None:
+      if self.exports is not None: self.exports.put(None)
+
+   def _export(self, file: Path) -> None:
+      assert self.exports is not None
+      with open(file, "a", encoding="utf-8") as f:
+         while True:
+            line = self.exports.get()
+            if line is None: break
+            f.write(line + "\n")
+            if self.exports.empty(): f.flush()
+
 def build_logging_setup(filename: Union[str, Path],
    file_count: int=7,
    when: str="midnight",
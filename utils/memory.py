@@ -1,6 +1,6 @@
 from __future__ import annotations
 from dataclasses import dataclass, field
-from typing import Optional, Dict, Set, Union
+from typing import Iterable, Optional, Dict, Set, Tuple, Union
 
 from pathlib import Path
 import sqlite3
@@ -8,7 +8,7 @@ from math import inf, isinf
 import shutil
 from datetime import datetime
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Settings:
    at_least: float = inf
    at_most: float = inf
@@ -28,6 +28,12 @@ class Settings:
          self.minutes is inf
       )
 
+   @property
+   def time_only(self) -> bool:
+      """Whether only ``minutes`` matters, i.e. ``~atleast 0`` with no ``~atmost``
+      """
+      return self.at_least == 0 and isinf(self.at_most) and not isinf(self.minutes)
+
    def replace(self, *,
       at_least: Optional[float]=None,
       at_most: Optional[float]=None,
@@ -67,25 +73,138 @@ class Settings:
 
       return "\n".join(status)
 
+# every channel with the same settings shares one object, since there are
+# only ever a handful of distinct settings but there can be millions of rows
+_interned: Dict[Settings, Settings] = {}
+_interned_rows: Dict[tuple, Settings] = {}
+
+def intern(settings: Settings) -> Settings:
+   """The one shared `Settings` object equal to these
+   """
+   return _interned.setdefault(settings, settings)
+
+def _settings_from_row(row) -> Settings:
+   row = tuple(row)
+   settings = _interned_rows.get(row)
+   if settings is None:
+      settings = _interned_rows[row] = intern(Settings(*(
+         inf if piece is None else piece
+         for piece in row
+      )))
+   return settings
+
+def _row_from_settings(settings: Settings) -> tuple:
+   return tuple(
+      None if isinf(piece) else int(piece)
+      for piece in settings
+   )
+
+def _link(index: Dict[int, Set[int]], guild: int, channel: int) -> None:
+   index.setdefault(guild, set()).add(channel)
+
+def _unlink(index: Dict[int, Set[int]], guild: int, channel: int) -> None:
+   channels = index.get(guild)
+   if channels is None: return
+   channels.discard(channel)
+   if not channels: del index[guild]
+
+@dataclass
+class Backfill:
+   """A resumable cleanup of the part of a channel's history its deck doesn't cover
+
+   Every message before ``boundary`` was already due when the backfill
+   started, and the backfill works backwards from there, oldest snowflake
+   last, until history runs out.
+
+   Attributes:
+      channel: Channel ID
+      guild: Guild ID
+      settings: Settings the backfill started under; it's dropped if they change
+      boundary: Snowflake the backfill started from
+      cursor: Oldest snowflake gone through so far
+      deleted: Number of messages deleted so far
+      seconds: Time spent running so far, including waiting for spare capacity
+   """
+   channel: int
+   guild: int
+   settings: Settings
+   boundary: int
+   cursor: int
+   deleted: int = 0
+   seconds: float = 0.0
+
+   @property
+   def progress(self) -> float:
+      """Fraction of history gone through, by time (the channel ID marks when history starts)
+      """
+      span = (self.boundary >> 22) - (self.channel >> 22)
+      if span <= 0: return 1.0
+      return min(1.0, max(0.0, ((self.boundary >> 22) - (self.cursor >> 22)) / span))
+
+   @property
+   def eta(self) -> Optional[float]:
+      """Estimated seconds left, going by the pace so far
+      """
+      progress = self.progress
+      if progress <= 0 or self.seconds <= 0: return None
+      return self.seconds * (1 - progress) / progress
+
+_guilds_per_read = 500 # stays well under SQLite's limit on query parameters
+
 @dataclass
 class LongTermMemory:
    """Represents Swashbot's saved channel settings
 
+   Settings come from three levels: a server default, a category default, and
+   a per-channel override, where the most specific one that's set wins as a
+   whole. ``settings``, ``guilds`` and ``channels`` hold the result for every
+   channel that ends up with something to do, and are updated incrementally
+   whenever a level changes, so lookups never have to walk the levels.
+
+   Defaults can only reach a channel once the bot has told memory where it is,
+   with `place`.
+
+   A lazy memory reads nothing up front, and only reads guilds' rows as it's
+   asked to with `load_guilds`, e.g. as they become available on the gateway,
+   so an instance only pays for the guilds it serves.
+
    Args:
       file: Path to the SQLite database
+      lazy: Whether to wait for `load_guilds` rather than read everything now
 
    Attributes:
       file: Path to the SQLite database
       conn: sqlite3 connection
       guilds: Maps channel IDs to respective guild IDs
       channels: Maps guild IDs to a set of channel IDs
-      settings: Maps channel IDs to respective `Settings` objects
+      settings: Maps channel IDs to respective effective `Settings` objects
+      overrides: Maps channel IDs to the `Settings` saved for that channel
+      policies: Maps guild or category IDs to their default `Settings`
+      policy_guilds: Maps guild IDs to the set of guild and category IDs with defaults there
+      placement: Maps channel IDs to their (guild ID, category ID or None)
+      members: Maps guild and category IDs to the set of channel IDs placed in them
+      archived: Maps IDs of channels whose washed messages are archived to their guild IDs
+      archived_guilds: Maps guild IDs to the set of archived channel IDs there
+      backfills: Maps channel IDs to their unfinished `Backfill`
+      backfill_guilds: Maps guild IDs to the set of channel IDs with a backfill there
+      loaded: IDs of guilds read so far, if lazy
    """
    file: Path
    conn: sqlite3.Connection = field(default_factory=lambda: sqlite3.connect(":memory:"))
    guilds: Dict[int, int] = field(default_factory=dict)
    channels: Dict[int, Set[int]] = field(default_factory=dict)
    settings: Dict[int, Settings] = field(default_factory=dict)
+   overrides: Dict[int, Settings] = field(default_factory=dict)
+   policies: Dict[int, Settings] = field(default_factory=dict)
+   policy_guilds: Dict[int, Set[int]] = field(default_factory=dict)
+   placement: Dict[int, Tuple[int, Optional[int]]] = field(default_factory=dict)
+   members: Dict[int, Set[int]] = field(default_factory=dict)
+   archived: Dict[int, int] = field(default_factory=dict)
+   archived_guilds: Dict[int, Set[int]] = field(default_factory=dict)
+   backfills: Dict[int, Backfill] = field(default_factory=dict)
+   backfill_guilds: Dict[int, Set[int]] = field(default_factory=dict)
+   lazy: bool = False
+   loaded: Set[int] = field(default_factory=set)
 
    def __post_init__(self):
       self.conn = sqlite3.connect(self.file)
@@ -101,110 +220,384 @@ class LongTermMemory:
          );
       """)
 
-      self.conn.commit()
+      cursor.execute("""
+         CREATE TABLE IF NOT EXISTS policy (
+            scope INTEGER PRIMARY KEY,
+            guild INTEGER,
+            at_least INTEGER,
+            at_most INTEGER,
+            minutes INTEGER
+         );
+      """)
 
       cursor.execute("""
-         SELECT channel, guild, at_least, at_most, minutes
-         FROM memo;
+         CREATE TABLE IF NOT EXISTS archive (
+            channel INTEGER PRIMARY KEY,
+            guild INTEGER
+         );
+      """)
+
+      cursor.execute("""
+         CREATE TABLE IF NOT EXISTS backfill (
+            channel INTEGER PRIMARY KEY,
+            guild INTEGER,
+            at_least INTEGER,
+            at_most INTEGER,
+            minutes INTEGER,
+            boundary INTEGER,
+            cursor INTEGER,
+            deleted INTEGER,
+            seconds REAL
+         );
       """)
 
-      rows = cursor.fetchall()
-      for channel, guild, *row in rows:
-         row = (
-            inf if piece is None else piece
-            for piece in row
-         )
-         settings = Settings(*row)
-         if settings:
-            self.settings[channel] = settings
-            self.guilds[channel] = guild
-            if not guild in self.channels:
-               self.channels[guild] = set()
-            self.channels[guild].add(channel)
-
-   def load(self, channel: int) -> Settings:
+      for table in ("memo", "policy", "archive", "backfill"):
+         cursor.execute(f"CREATE INDEX IF NOT EXISTS {table}_guild ON {table} (guild);")
+
+      self.conn.commit()
+
+      if not self.lazy: self._read("", ())
+
+   def _read(self, where: str, args: tuple) -> None:
+      """Read overrides and defaults from SQLite into working memory
+      """
       cursor = self.conn.cursor()
 
-      cursor.execute("""
-         SELECT guild, at_least, at_most, minutes
-         FROM memo
-         WHERE channel = ?;
-      """, (channel,))
+      cursor.execute(f"""
+         SELECT scope, guild, at_least, at_most, minutes
+         FROM policy {where};
+      """, args)
+      for scope, guild, *row in cursor.fetchall():
+         self.policies[scope] = _settings_from_row(row)
+         self.policy_guilds.setdefault(guild, set()).add(scope)
 
-      row = cursor.fetchone()
-      if row is None: return Settings()
-      guild, *row = row
+      cursor.execute(f"""
+         SELECT channel, guild, at_least, at_most, minutes
+         FROM memo {where};
+      """, args)
+      for channel, guild, *row in cursor.fetchall():
+         self.overrides[channel] = _settings_from_row(row)
+         if channel not in self.placement: self._place(channel, guild, None)
+         self._update(channel)
+
+      cursor.execute(f"""
+         SELECT channel, guild
+         FROM archive {where};
+      """, args)
+      for channel, guild in cursor.fetchall():
+         self.archived[channel] = guild
+         _link(self.archived_guilds, guild, channel)
+
+      cursor.execute(f"""
+         SELECT channel, guild, at_least, at_most, minutes, boundary, cursor, deleted, seconds
+         FROM backfill {where};
+      """, args)
+      for channel, guild, at_least, at_most, minutes, *progress in cursor.fetchall():
+         settings = _settings_from_row((at_least, at_most, minutes))
+         self.backfills[channel] = Backfill(channel, guild, settings, *progress)
+         _link(self.backfill_guilds, guild, channel)
+
+   def _place(self, channel: int, guild: int, category: Optional[int]) -> None:
+      old = self.placement.get(channel)
+      if old is not None:
+         for scope in old:
+            if scope is not None: self.members.get(scope, set()).discard(channel)
+      self.placement[channel] = (guild, category)
+      self.members.setdefault(guild, set()).add(channel)
+      if category is not None: self.members.setdefault(category, set()).add(channel)
+
+   def _unplace(self, channel: int) -> None:
+      for scope in self.placement.pop(channel, ()):
+         if scope is None or scope not in self.members: continue
+         self.members[scope].discard(channel)
+         if not self.members[scope]: del self.members[scope]
+
+   def resolve(self, channel: int, guild: Optional[int]=None) -> Tuple[Settings, Optional[str]]:
+      """Work out a channel's effective settings from the three levels
+
+      Args:
+         channel: Channel ID
+         guild: Guild ID of the channel, so that a lazy memory can read it first if need be
+
+      Returns:
+         tuple: The settings, and which level they came from (``"channel"``,
+         ``"category"`` or ``"server"``), or None if no level is set.
+      """
+      self._ensure(guild)
+      if channel in self.overrides: return self.overrides[channel], "channel"
+      guild, category = self.placement.get(channel, (None, None))
+      if category is not None and category in self.policies: return self.policies[category], "category"
+      if guild is not None and guild in self.policies: return self.policies[guild], "server"
+      return Settings(), None
+
+   def _update(self, channel: int) -> bool:
+      """Bring the effective index up to date for one channel
+
+      Returns:
+         bool: Whether the channel's effective settings changed.
+      """
+      settings, _ = self.resolve(channel)
+      old = self.settings.get(channel)
 
-      row = (
-         inf if piece is None else piece
-         for piece in row
-      )
-      settings = Settings(*row)
       if settings:
+         guild = self.placement[channel][0]
          self.settings[channel] = settings
          self.guilds[channel] = guild
-         if not guild in self.channels:
-            self.channels[guild] = set()
-         self.channels[guild].add(channel)
+         self.channels.setdefault(guild, set()).add(channel)
+      elif old is not None:
+         del self.settings[channel]
+         guild = self.guilds.pop(channel)
+         self.channels[guild].discard(channel)
+         if not self.channels[guild]: del self.channels[guild]
 
-      return settings
+      return old != (settings or None)
+
+   def load(self, channel: int, guild: Optional[int]=None) -> Settings:
+      """Effective settings for a channel (see `resolve`)
+      """
+      return self.resolve(channel, guild)[0]
 
    def save(self, channel: int, guild: int, settings: Settings) -> None:
+      """Save settings for a channel, overriding any defaults
+      """
+      self._ensure(guild)
+      if not settings and not self._inherits(channel, guild):
+         # nothing to override, so don't keep a row around
+         self.clear(channel)
+         return
+
       cursor = self.conn.cursor()
+      cursor.execute("""
+         INSERT OR REPLACE INTO memo (channel, guild, at_least, at_most, minutes)
+         VALUES (?, ?, ?, ?, ?);
+      """, (channel, guild) + _row_from_settings(settings))
+      self.conn.commit()
 
-      if settings:
-         # update to SQLite memory
-         row = tuple(
-            None if isinf(piece) else int(piece)
-            for piece in settings
-         )
-         row = (channel, guild) + row
+      self.overrides[channel] = intern(settings)
+      if channel not in self.placement: self._place(channel, guild, None)
+      self._update(channel)
 
-         cursor.execute("""
-            INSERT OR REPLACE INTO memo (channel, guild, at_least, at_most, minutes)
-            VALUES (?, ?, ?, ?, ?);
-         """, row)
+   def _inherits(self, channel: int, guild: int) -> bool:
+      category = self.placement.get(channel, (guild, None))[1]
+      return guild in self.policies or (category is not None and category in self.policies)
 
-         self.conn.commit()
+   def clear(self, channel: int, guild: Optional[int]=None) -> bool:
+      """Drop a channel's own settings, so that it goes back to the defaults
 
-         # update to working memory
-         self.settings[channel] = settings
-         self.guilds[channel] = guild
-         if not guild in self.channels:
-            self.channels[guild] = set()
-         self.channels[guild].add(channel)
+      Returns:
+         bool: Whether the channel's effective settings changed.
+      """
+      self._ensure(guild)
+      if channel not in self.overrides: return False
 
-      elif channel in self.settings:
-         # remove from SQLite memory
-         self.remove(channel)
+      cursor = self.conn.cursor()
+      cursor.execute("""
+         DELETE FROM memo
+         WHERE channel = ?;
+      """, (channel,))
+      self.conn.commit()
 
-   def remove(self, channel: int) -> None:
-      """Erase settings for channel
+      del self.overrides[channel]
+      return self._update(channel)
+
+   def set_archive(self, channel: int, guild: int, archive: bool) -> None:
+      """Turn archiving of washed messages on or off for a channel
       """
+      self._ensure(guild)
       cursor = self.conn.cursor()
+      home = self.archived.pop(channel, None)
+      if home is not None: _unlink(self.archived_guilds, home, channel)
+      if archive:
+         cursor.execute("""
+            INSERT OR REPLACE INTO archive (channel, guild)
+            VALUES (?, ?);
+         """, (channel, guild))
+         self.archived[channel] = guild
+         _link(self.archived_guilds, guild, channel)
+      else:
+         cursor.execute("""
+            DELETE FROM archive
+            WHERE channel = ?;
+         """, (channel,))
+      self.conn.commit()
 
+   def save_backfill(self, backfill: Backfill) -> None:
+      """Start a backfill, or record how far it's got
+      """
+      cursor = self.conn.cursor()
       cursor.execute("""
-         SELECT guild
-         FROM memo
-         WHERE channel = ?;
-      """, (channel,))
-      result = cursor.fetchone()
-      if result is None: return
-      guild, = result
+         INSERT OR REPLACE INTO backfill (channel, guild, at_least, at_most, minutes, boundary, cursor, deleted, seconds)
+         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);
+      """, (backfill.channel, backfill.guild) + _row_from_settings(backfill.settings) + (
+         backfill.boundary, backfill.cursor, backfill.deleted, backfill.seconds,
+      ))
+      self.conn.commit()
+      old = self.backfills.get(backfill.channel)
+      if old is not None: _unlink(self.backfill_guilds, old.guild, backfill.channel)
+      self.backfills[backfill.channel] = backfill
+      _link(self.backfill_guilds, backfill.guild, backfill.channel)
 
+   def end_backfill(self, channel: int) -> None:
+      """Drop a channel's backfill, whether it's finished or not
+      """
+      if channel not in self.backfills: return
+      cursor = self.conn.cursor()
       cursor.execute("""
-         DELETE FROM memo
+         DELETE FROM backfill
          WHERE channel = ?;
       """, (channel,))
-
       self.conn.commit()
+      backfill = self.backfills.pop(channel)
+      _unlink(self.backfill_guilds, backfill.guild, channel)
 
-      # remove from working memory
+   def remove(self, channel: int) -> None:
+      """Erase settings for channel, e.g. because it was deleted
+      """
+      self.clear(channel)
+      if channel in self.archived: self.set_archive(channel, self.archived[channel], False)
+      self.end_backfill(channel)
+      self._unplace(channel)
+      self._update_gone(channel)
+
+   def _update_gone(self, channel: int) -> None:
+      if channel not in self.settings: return
       del self.settings[channel]
-      del self.guilds[channel]
+      guild = self.guilds.pop(channel)
       self.channels[guild].discard(channel)
       if not self.channels[guild]: del self.channels[guild]
 
+   def place(self, channel: int, guild: int, category: Optional[int]) -> bool:
+      """Tell memory where a channel is, so that defaults can reach it
+
+      Returns:
+         bool: Whether the channel's effective settings changed.
+      """
+      if self.placement.get(channel) == (guild, category): return False
+      self._place(channel, guild, category)
+      return self._update(channel)
+
+   def unplace(self, channel: int) -> bool:
+      """Stop defaults from reaching a channel, e.g. because it can't be washed any more
+
+      Channels with their own settings keep them.
+
+      Returns:
+         bool: Whether the channel's effective settings changed.
+      """
+      if channel not in self.placement: return False
+      if channel in self.overrides:
+         guild, _ = self.placement[channel]
+         return self.place(channel, guild, None)
+      self._unplace(channel)
+      changed = channel in self.settings
+      self._update_gone(channel)
+      return changed
+
+   def set_policy(self, scope: int, guild: int, settings: Optional[Settings]) -> Set[int]:
+      """Set or clear the default settings for a server or category
+
+      Args:
+         scope: Guild ID for a server default, or category ID for a category default
+         guild: Guild ID
+         settings: The new default, or None to clear it
+
+      Returns:
+         set: Channel IDs whose effective settings changed.
+      """
+      self._ensure(guild)
+      cursor = self.conn.cursor()
+      if settings is None:
+         cursor.execute("""
+            DELETE FROM policy
+            WHERE scope = ?;
+         """, (scope,))
+         self.policies.pop(scope, None)
+         scopes = self.policy_guilds.get(guild, set())
+         scopes.discard(scope)
+         if not scopes: self.policy_guilds.pop(guild, None)
+      else:
+         cursor.execute("""
+            INSERT OR REPLACE INTO policy (scope, guild, at_least, at_most, minutes)
+            VALUES (?, ?, ?, ?, ?);
+         """, (scope, guild) + _row_from_settings(settings))
+         self.policies[scope] = intern(settings)
+         self.policy_guilds.setdefault(guild, set()).add(scope)
+      self.conn.commit()
+
+      return {
+         channel
+         for channel in list(self.members.get(scope, set()))
+         if self._update(channel)
+      }
+
+   def remove_guild(self, guild: int) -> None:
+      """Erase all settings and defaults for a guild, e.g. because the bot left it
+      """
+      cursor = self.conn.cursor()
+      cursor.execute("DELETE FROM memo WHERE guild = ?;", (guild,))
+      cursor.execute("DELETE FROM policy WHERE guild = ?;", (guild,))
+      cursor.execute("DELETE FROM archive WHERE guild = ?;", (guild,))
+      cursor.execute("DELETE FROM backfill WHERE guild = ?;", (guild,))
+      self.conn.commit()
+
+      self.forget_guild(guild)
+      for channel in list(self.members.get(guild, set())):
+         self._unplace(channel)
+
+   def load_guilds(self, guilds: Iterable[int]) -> Set[int]:
+      """Read guilds' settings from SQLite into working memory, if they haven't been already
+
+      Does nothing unless memory is lazy, since otherwise everything's read up front.
+
+      Returns:
+         set: IDs of the guilds newly read.
+      """
+      if not self.lazy: return set()
+      new = list(set(guilds) - self.loaded)
+      for start in range(0, len(new), _guilds_per_read):
+         chunk = new[start:start + _guilds_per_read]
+         self._read(f"WHERE guild IN ({', '.join('?' * len(chunk))})", tuple(chunk))
+      self.loaded.update(new)
+      for guild in new:
+         for channel in list(self.members.get(guild, set())):
+            self._update(channel)
+      return set(new)
+
+   def _ensure(self, guild: Optional[int]) -> None:
+      """Read a guild before touching its settings, if memory is lazy and hasn't yet
+
+      Otherwise a change would be built on, and saved over, defaults rather
+      than what's stored.
+      """
+      if self.lazy and guild is not None and guild not in self.loaded: self.load_guilds([guild])
+
+   def refresh_guild(self, guild: int) -> None:
+      """Re-read a guild's settings from SQLite into working memory
+
+      Another instance sharing the database may have changed them.
+      """
+      self.forget_guild(guild)
+      self._read("WHERE guild = ?", (guild,))
+      if self.lazy: self.loaded.add(guild)
+      for channel in list(self.members.get(guild, set())):
+         self._update(channel)
+
+   def forget_guild(self, guild: int) -> None:
+      """Drop a guild's settings from working memory, but not from SQLite
+      """
+      self.loaded.discard(guild)
+      for scope in self.policy_guilds.pop(guild, set()):
+         self.policies.pop(scope, None)
+      for channel in self.archived_guilds.pop(guild, set()):
+         self.archived.pop(channel, None)
+      for channel in self.backfill_guilds.pop(guild, set()):
+         self.backfills.pop(channel, None)
+      for channel in list(self.members.get(guild, set())):
+         self.overrides.pop(channel, None)
+      for channel in self.channels.pop(guild, set()):
+         self.settings.pop(channel, None)
+         self.guilds.pop(channel, None)
+
    def backup(self, tag: Optional[str]=None) -> str:
       """Make a backup in the same directory as the database
 
@@ -217,4 +610,4 @@ class LongTermMemory:
       
       shutil.copy2(self.file, parent / backup_file)
       
-      return backup_file
\ No newline at end of file
+      return backup_file
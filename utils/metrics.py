@@ -0,0 +1,236 @@
+from __future__ import annotations
+from typing import Callable, Iterable, Optional, Union
+
+from bisect import bisect_left
+from math import inf, isinf
+import re
+
+from aiohttp import web, TraceConfig
+
+Labels = tuple[tuple[str, str], ...]
+
+def _labels(labels: dict[str, object]) -> Labels:
+   return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _format_labels(labels: Labels, extra: Labels=()) -> str:
+   pairs = labels + extra
+   if not pairs: return ""
+   inside = ",".join(f'{key}="{value}"' for key, value in pairs)
+   return f"{{{inside}}}"
+
+def _format_value(value: float) -> str:
+   if isinf(value): return "+Inf" if value > 0 else "-Inf"
+   return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Counter:
+   """Monotonically increasing count, optionally split by labels
+   """
+   kind = "counter"
+
+   def __init__(self, name: str, help: str) -> None:
+      self.name = name
+      self.help = help
+      self.values: dict[Labels, float] = {}
+
+   def inc(self, amount: float=1, **labels: object) -> None:
+      key = _labels(labels)
+      self.values[key] = self.values.get(key, 0) + amount
+
+   def get(self, **labels: object) -> float:
+      return self.values.get(_labels(labels), 0)
+
+   def samples(self) -> Iterable[str]:
+      for labels, value in self.values.items():
+         yield f"{self.name}{_format_labels(labels)} {_format_value(value)}"
+
+class Gauge:
+   """Value that goes up and down, either set directly or read from a callback
+
+   Args:
+      collect: Called at scrape time, returning {labels: value} pairs
+   """
+   kind = "gauge"
+
+   def __init__(self, name: str, help: str, collect: Optional[Callable[[], dict[Labels, float]]]=None) -> None:
+      self.name = name
+      self.help = help
+      self.collect = collect
+      self.values: dict[Labels, float] = {}
+
+   def set(self, value: float, **labels: object) -> None:
+      self.values[_labels(labels)] = value
+
+   def get(self, **labels: object) -> float:
+      return self.values.get(_labels(labels), 0)
+
+   def samples(self) -> Iterable[str]:
+      values = self.collect() if self.collect is not None else self.values
+      for labels, value in values.items():
+         yield f"{self.name}{_format_labels(labels)} {_format_value(value)}"
+
+class Histogram:
+   """Distribution of observations in cumulative buckets, Prometheus style
+
+   Percentiles are estimated from the buckets, so `~stats` and the metrics
+   endpoint always agree.
+   """
+   kind = "histogram"
+
+   def __init__(self, name: str, help: str, buckets: Iterable[float]) -> None:
+      self.name = name
+      self.help = help
+      self.bounds = sorted(buckets) + [inf]
+      self.counts = [0] * len(self.bounds)
+      self.sum = 0.0
+      self.count = 0
+
+   def observe(self, value: float) -> None:
+      self.counts[bisect_left(self.bounds, value)] += 1
+      self.sum += value
+      self.count += 1
+
+   def percentile(self, p: float) -> Optional[float]:
+      """Estimate the p-th percentile (0-100) by linear interpolation within a bucket
+      """
+      if not self.count: return None
+      rank = p / 100 * self.count
+      seen = 0
+      lower = 0.0
+      for bound, count in zip(self.bounds, self.counts):
+         if count and seen + count >= rank:
+            if isinf(bound): return lower
+            return lower + (bound - lower) * (rank - seen) / count
+         seen += count
+         if not isinf(bound): lower = bound
+      return lower
+
+   def samples(self) -> Iterable[str]:
+      cumulative = 0
+      for bound, count in zip(self.bounds, self.counts):
+         cumulative += count
+         yield f"{self.name}_bucket{_format_labels((), (('le', _format_value(bound)),))} {cumulative}"
+      yield f"{self.name}_sum {_format_value(self.sum)}"
+      yield f"{self.name}_count {self.count}"
+
+Metric = Union[Counter, Gauge, Histogram]
+
+class Registry:
+   """Collection of metrics that renders to the Prometheus text format
+   """
+   def __init__(self, prefix: str="swashbot_") -> None:
+      self.prefix = prefix
+      self.metrics: list[Metric] = []
+
+   def counter(self, name: str, help: str) -> Counter:
+      return self._add(Counter(self.prefix + name, help))
+
+   def gauge(self, name: str, help: str, collect: Optional[Callable[[], dict[Labels, float]]]=None) -> Gauge:
+      return self._add(Gauge(self.prefix + name, help, collect))
+
+   def histogram(self, name: str, help: str, buckets: Iterable[float]) -> Histogram:
+      return self._add(Histogram(self.prefix + name, help, buckets))
+
+   def _add(self, metric):
+      self.metrics.append(metric)
+      return metric
+
+   def render(self) -> str:
+      lines = []
+      for metric in self.metrics:
+         lines.append(f"# HELP {metric.name} {metric.help}")
+         lines.append(f"# TYPE {metric.name} {metric.kind}")
+         lines.extend(metric.samples())
+      return "\n".join(lines) + "\n"
+
+_snowflake = re.compile(r"/\d{15,21}")
+_reaction = re.compile(r"/reactions/[^/]+")
+
+def route_of(method: str, path: str) -> str:
+   """Collapse IDs out of a REST path so it can be used as a label
+   """
+   path = path.split("/api/v", 1)[-1].partition("/")[2]
+   path = _reaction.sub("/reactions/{emoji}", path)
+   return f"{method} /{_snowflake.sub('/{id}', path)}"
+
+class Metrics:
+   """Swashbot's metrics
+
+   Attributes:
+      registry: All metrics, for rendering
+      deletion_lag: Seconds from when a message was due until it was deleted
+      gather_seconds: How long each `gather_flotsam` took
+      loop_lag: How late the event loop woke up a sleeping task, in seconds (fed by `utils.watchdog.LoopWatchdog`)
+      http_requests: REST calls, by route and status
+      http_429s: Rate-limited REST calls, by route
+      deck_drift: Messages decks had wrong, found by sampling history (see `cogs.drift`), by kind
+      drift_windows: History windows sampled for drift
+      orphans_swept: Channels whose leftover state was dropped by the lifecycle sweep, by kind of state
+   """
+   def __init__(self) -> None:
+      self.registry = Registry()
+      self.deletion_lag = self.registry.histogram("deletion_lag_seconds",
+         "Seconds from when a message was due to be washed away until it was deleted",
+         [0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 4 * 3600, 24 * 3600],
+      )
+      self.gather_seconds = self.registry.histogram("gather_seconds",
+         "Time taken by each flotsam gather",
+         [0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600],
+      )
+      self.loop_lag = self.registry.histogram("event_loop_lag_seconds",
+         "How late the event loop ran a task that asked to be woken up",
+         [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5],
+      )
+      self.http_requests = self.registry.counter("http_requests_total",
+         "REST calls made, by route and status",
+      )
+      self.http_429s = self.registry.counter("http_rate_limited_total",
+         "REST calls that got a 429, by route",
+      )
+      self.deck_drift = self.registry.counter("deck_drift_total",
+         "Messages found missing from or left over in decks, by kind",
+      )
+      self.drift_windows = self.registry.counter("drift_windows_total",
+         "History windows sampled to check decks for drift",
+      )
+      self.orphans_swept = self.registry.counter("orphans_swept_total",
+         "Channels whose leftover state in working memory was dropped, by kind",
+      )
+
+   def tracer(self) -> TraceConfig:
+      """aiohttp trace hooks that count REST calls, for ``http_trace=``
+      """
+      trace = TraceConfig()
+
+      async def on_request_end(session, context, params) -> None:
+         route = route_of(params.method, params.url.path)
+         status = params.response.status
+         self.http_requests.inc(route=route, status=status)
+         if status == 429: self.http_429s.inc(route=route)
+
+      trace.on_request_end.append(on_request_end)
+      return trace
+
+   async def serve(self, host: str, port: int) -> web.AppRunner:
+      """Serve ``/metrics`` over HTTP
+      """
+      async def handler(request: web.Request) -> web.Response:
+         return web.Response(text=self.registry.render(), content_type="text/plain", charset="utf-8",
+            headers={"X-Content-Type-Options": "nosniff"},
+         )
+
+      app = web.Application()
+      app.add_routes([web.get("/metrics", handler)])
+      runner = web.AppRunner(app)
+      await runner.setup()
+      await web.TCPSite(runner, host, port).start()
+      return runner
+
+def percentiles(histogram: Histogram, unit: str="s", scale: float=1) -> str:
+   """Human-readable p50/p95/p99 of a histogram
+   """
+   if not histogram.count: return "n/a"
+   parts = []
+   for p in (50, 95, 99):
+      value = histogram.percentile(p)
+      parts.append(f"p{p} {value * scale:.1f}{unit}" if value is not None else f"p{p} n/a")
+   return ", ".join(parts)
@@ -0,0 +1,97 @@
+from __future__ import annotations
+from typing import Optional, Union
+
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from types import FrameType
+import logging
+import sys
+import threading
+import time
+
+def _collapse(frame: Optional[FrameType]) -> str:
+   """One stack, root first, in the ``a;b;c`` form flame graph tools read
+   """
+   names = []
+   while frame is not None:
+      code = frame.f_code
+      names.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+      frame = frame.f_back
+   return ";".join(reversed(names))
+
+class SamplingProfiler:
+   """Samples a thread's stack on a timer, for profiling a live process
+
+   A background thread wakes up every ``interval`` seconds and records the
+   target thread's current stack, so the profiled code isn't slowed down by
+   tracing hooks. Sampling stops by itself after ``limit`` seconds.
+
+   The result is written in the collapsed-stack format (one ``stack count``
+   line per distinct stack), which ``flamegraph.pl`` and speedscope read.
+
+   Args:
+      interval: Seconds between samples
+      limit: Seconds after which sampling stops, even if nobody calls `stop`
+      thread: Ident of the thread to sample; defaults to the calling thread
+
+   Attributes:
+      stacks: How many times each collapsed stack was sampled
+      samples: Total number of samples taken
+      started: When sampling started (UTC)
+   """
+   def __init__(self, *, interval: float=0.005, limit: float=60, thread: Optional[int]=None) -> None:
+      self.interval = interval
+      self.limit = limit
+      self.target = thread if thread is not None else threading.get_ident()
+      self.stacks: Counter[str] = Counter()
+      self.samples = 0
+      self.started: Optional[datetime] = None
+      self.elapsed = 0.0
+      self.log = logging.getLogger("swashbot.profiler")
+      self.stopped = threading.Event()
+      self.thread: Optional[threading.Thread] = None
+
+   @property
+   def running(self) -> bool:
+      return self.thread is not None and self.thread.is_alive()
+
+   def start(self) -> None:
+      self.started = datetime.utcnow()
+      self.thread = threading.Thread(target=self._sample, name="swashbot-profiler", daemon=True)
+      self.thread.start()
+
+   def stop(self) -> None:
+      self.stopped.set()
+      if self.thread is not None: self.thread.join()
+
+   def _sample(self) -> None:
+      start = time.monotonic()
+      deadline = start + self.limit
+      while not self.stopped.wait(self.interval):
+         frame = sys._current_frames().get(self.target)
+         if frame is not None:
+            self.stacks[_collapse(frame)] += 1
+            self.samples += 1
+         del frame
+         if time.monotonic() >= deadline:
+            self.log.warning(f"Profiler hit its {self.limit:g}s limit, so it stopped sampling.")
+            break
+      self.elapsed = time.monotonic() - start
+
+   def write(self, file: Union[str, Path]) -> Path:
+      """Write the samples in the collapsed-stack format, most frequent first
+      """
+      file = Path(file)
+      with open(file, "w", encoding="utf-8") as f:
+         for stack, count in self.stacks.most_common():
+            f.write(f"{stack} {count}\n")
+      return file
+
+   def top(self, n: int=5) -> list[tuple[str, float]]:
+      """The ``n`` innermost frames seen most often, with their share of samples
+      """
+      leaves: Counter[str] = Counter()
+      for stack, count in self.stacks.items():
+         leaves[stack.rpartition(";")[2]] += count
+      return [(leaf, count / self.samples) for leaf, count in leaves.most_common(n)] if self.samples else []
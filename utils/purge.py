@@ -0,0 +1,137 @@
+from __future__ import annotations
+from typing import Iterable, Optional
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+import discord
+import discord.utils
+
+# Discord only bulk-deletes messages younger than this
+BULK_DELETE_MAX_AGE = timedelta(days=14)
+# leave a little room for clock skew and time spent in flight
+BULK_DELETE_MARGIN = timedelta(minutes=1)
+# and at most this many at a time
+BULK_DELETE_LIMIT = 100
+# rough seconds per bulk delete under the per-channel rate limit, for estimates
+BULK_DELETE_SECONDS = 1.0
+
+def bulk_delete_cutoff(now: Optional[datetime]=None) -> int:
+   """Snowflake of the oldest moment a message can still be bulk-deleted
+
+   Messages with IDs above this can go in a bulk delete.
+   """
+   if now is None: now = datetime.now(timezone.utc)
+   return discord.utils.time_snowflake(now - BULK_DELETE_MAX_AGE + BULK_DELETE_MARGIN)
+
+def split_at_cliff(ids: Iterable[int], cutoff: int) -> tuple[list[int], list[int]]:
+   """Split message IDs into those that can still be bulk-deleted and those that can't
+
+   Returns:
+      tuple: (young IDs, old IDs), each in the order given.
+   """
+   young: list[int] = []
+   old: list[int] = []
+   for id in ids:
+      (young if id > cutoff else old).append(id)
+   return young, old
+
+def cliff_deadline(id: int, now: Optional[datetime]=None) -> float:
+   """Seconds until a message can no longer be bulk-deleted (negative once it's too late)
+   """
+   if now is None: now = datetime.now(timezone.utc)
+   cliff = discord.utils.snowflake_time(id) + BULK_DELETE_MAX_AGE - BULK_DELETE_MARGIN
+   return (cliff - now).total_seconds()
+
+@dataclass
+class CliffRisk:
+   """How a channel's backlog stands against the 14-day bulk delete limit
+
+   Attributes:
+      channel: Channel ID
+      young: Due messages that can still be bulk-deleted
+      past: Due messages already too old to bulk delete
+      deadline: Seconds until the oldest young due message becomes too old
+      late: Young due messages expected to become too old before they're washed
+      eta: Estimated seconds until the young due messages are washed
+   """
+   channel: int
+   young: int = 0
+   past: int = 0
+   deadline: float = float("inf")
+   late: int = 0
+   eta: float = 0.0
+
+def plan_cliff(backlog: Iterable[tuple[int, list[int]]], now: Optional[datetime]=None, *,
+   bulk_seconds: float=BULK_DELETE_SECONDS,
+) -> list[CliffRisk]:
+   """Estimate which due messages will be washed before they're too old to bulk delete
+
+   Models one washer working through channels earliest deadline first, bulk
+   deleting young messages 100 at a time and leaving messages already past
+   the limit until last, since they've nothing left to lose.
+
+   Args:
+      backlog: (channel ID, due message IDs oldest first) for each channel one washer handles
+      bulk_seconds: Estimated seconds per bulk delete
+
+   Returns:
+      list: A `CliffRisk` for every channel with due messages, in the order they'd be washed.
+   """
+   if now is None: now = datetime.now(timezone.utc)
+   cutoff = bulk_delete_cutoff(now)
+
+   risks = []
+   for channel, ids in backlog:
+      young, old = split_at_cliff(ids, cutoff)
+      if not (young or old): continue
+      risk = CliffRisk(channel, len(young), len(old))
+      if young: risk.deadline = cliff_deadline(young[0], now)
+      risks.append((risk, young))
+   risks.sort(key=lambda pair: pair[0].deadline)
+
+   elapsed = 0.0
+   for risk, young in risks:
+      for start in range(0, len(young), BULK_DELETE_LIMIT):
+         # the oldest message in each batch has the earliest deadline
+         if cliff_deadline(young[start], now) < elapsed:
+            risk.late += len(young[start:start + BULK_DELETE_LIMIT])
+         elapsed += bulk_seconds
+      risk.eta = elapsed
+
+   return [risk for risk, _ in risks]
+
+def format_deadline(seconds: float) -> str:
+   """Human-readable time left until a deadline, e.g. ``3h 20m``
+   """
+   if seconds == float("inf"): return "ever"
+   if seconds <= 0: return "no time"
+   hours, minutes = divmod(int(seconds) // 60, 60)
+   return f"{hours}h {minutes}m" if hours else f"{minutes}m"
+
+def washes_after_cliff(minutes: float) -> bool:
+   """Whether settings with this many minutes only wash messages once they're too old to bulk delete
+   """
+   return minutes * 60 >= (BULK_DELETE_MAX_AGE - BULK_DELETE_MARGIN).total_seconds()
+
+@dataclass(frozen=True)
+class PurgeFilter:
+   """Which messages a purge should wash away, checked as history streams in
+
+   Attributes:
+      author: Only messages by this user ID
+      bots: Only messages by bots
+      attachments: Only messages with attachments
+   """
+   author: Optional[int] = None
+   bots: bool = False
+   attachments: bool = False
+
+   def __bool__(self) -> bool:
+      return self.author is not None or self.bots or self.attachments
+
+   def matches(self, message: discord.Message) -> bool:
+      if self.author is not None and message.author.id != self.author: return False
+      if self.bots and not message.author.bot: return False
+      if self.attachments and not message.attachments: return False
+      return True
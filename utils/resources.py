@@ -0,0 +1,43 @@
+import sys
+import resource
+import asyncio
+from typing import Optional
+
+_page_size = resource.getpagesize()
+
+def rss_bytes() -> int:
+   """Current resident set size of this process, in bytes
+
+   Reads ``/proc/self/statm`` where available (Linux), otherwise falls back to
+   the peak RSS reported by ``getrusage``.
+   """
+   try:
+      with open("/proc/self/statm", "r") as f:
+         return int(f.read().split()[1]) * _page_size
+   except (OSError, IndexError, ValueError):
+      peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+      # macOS reports bytes, Linux reports kilobytes
+      return peak if sys.platform == "darwin" else peak * 1024
+
+def format_bytes(n: float) -> str:
+   """Human-readable byte count
+   """
+   for unit in ("B", "KiB", "MiB", "GiB"):
+      if n < 1024 or unit == "GiB": break
+      n /= 1024
+   return f"{n:.1f} {unit}" if unit != "B" else f"{int(n)} B"
+
+def use_fast_event_loop() -> Optional[str]:
+   """Install uvloop's event loop policy, if installed
+
+   Must be called before the event loop is created (i.e. before `Client.run`).
+
+   Returns:
+      str: Name of the event loop implementation installed, otherwise None.
+   """
+   try:
+      import uvloop # type: ignore
+   except ImportError:
+      return None
+   asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+   return "uvloop"
@@ -0,0 +1,108 @@
+from __future__ import annotations
+from typing import Iterator, Optional, Union, NamedTuple
+
+from pathlib import Path
+import gzip
+import struct
+import time
+
+from utils.memory import Settings
+
+# Record kinds
+MESSAGE = ord("M")     # channel, message ID
+DELETE = ord("D")      # channel, message ID
+BULK_DELETE = ord("B") # channel, message IDs
+SNAPSHOT = ord("N")    # channel, message IDs of a freshly gathered deck (oldest first)
+SETTINGS = ord("S")    # channel, guild, at_least, at_most, minutes
+CHANNEL_GONE = ord("C") # channel (or thread)
+GUILD_GONE = ord("G")  # guild
+
+# every record starts with its kind, time in milliseconds, and a channel/guild ID
+_head = struct.Struct("<BQQ")
+_count = struct.Struct("<I")
+_id = struct.Struct("<Q")
+_settings = struct.Struct("<Qddd")
+
+class TraceRecord(NamedTuple):
+   kind: int
+   time: float # seconds since the epoch
+   target: int # channel ID, or guild ID for GUILD_GONE
+   ids: tuple[int, ...] = ()
+   guild: Optional[int] = None
+   settings: Optional[Settings] = None
+
+class TraceRecorder:
+   """Records the events Swashbot consumes into a compact gzipped binary trace
+
+   Only IDs and timestamps are kept, never message contents. Replay a trace
+   with ``python -m benchmarks.replay``.
+
+   Args:
+      file: Where to write the trace
+   """
+   def __init__(self, file: Union[str, Path]) -> None:
+      self.file = Path(file)
+      self.stream = gzip.open(self.file, "ab", compresslevel=6)
+      self.records = 0
+
+   def _write(self, kind: int, target: int, payload: bytes=b"") -> None:
+      self.stream.write(_head.pack(kind, int(time.time() * 1000), target) + payload)
+      self.records += 1
+
+   def _ids(self, ids: Union[list[int], set[int], tuple[int, ...]]) -> bytes:
+      return _count.pack(len(ids)) + struct.pack(f"<{len(ids)}Q", *ids)
+
+   def message(self, channel: int, id: int) -> None:
+      self._write(MESSAGE, channel, _id.pack(id))
+
+   def delete(self, channel: int, id: int) -> None:
+      self._write(DELETE, channel, _id.pack(id))
+
+   def bulk_delete(self, channel: int, ids: Union[list[int], set[int]]) -> None:
+      self._write(BULK_DELETE, channel, self._ids(list(ids)))
+
+   def snapshot(self, channel: int, ids: list[int]) -> None:
+      self._write(SNAPSHOT, channel, self._ids(ids))
+
+   def settings(self, channel: int, guild: int, settings: Settings) -> None:
+      self._write(SETTINGS, channel, _settings.pack(guild, *settings))
+
+   def channel_gone(self, channel: int) -> None:
+      self._write(CHANNEL_GONE, channel)
+
+   def guild_gone(self, guild: int) -> None:
+      self._write(GUILD_GONE, guild)
+
+   def close(self) -> None:
+      self.stream.close()
+
+def read_trace(file: Union[str, Path]) -> Iterator[TraceRecord]:
+   """Yield the records of a trace written by `TraceRecorder`, in order
+   """
+   with gzip.open(file, "rb") as stream:
+      data = stream.read()
+
+   offset = 0
+   while offset < len(data):
+      kind, ms, target = _head.unpack_from(data, offset)
+      offset += _head.size
+      when = ms / 1000
+
+      if kind in (MESSAGE, DELETE):
+         id, = _id.unpack_from(data, offset)
+         offset += _id.size
+         yield TraceRecord(kind, when, target, (id,))
+      elif kind in (BULK_DELETE, SNAPSHOT):
+         count, = _count.unpack_from(data, offset)
+         offset += _count.size
+         ids = struct.unpack_from(f"<{count}Q", data, offset)
+         offset += count * _id.size
+         yield TraceRecord(kind, when, target, ids)
+      elif kind == SETTINGS:
+         guild, *values = _settings.unpack_from(data, offset)
+         offset += _settings.size
+         yield TraceRecord(kind, when, target, guild=guild, settings=Settings(*values))
+      elif kind in (CHANNEL_GONE, GUILD_GONE):
+         yield TraceRecord(kind, when, target)
+      else:
+         raise ValueError(f"unknown trace record kind {kind!r} at byte {offset - _head.size}")
@@ -0,0 +1,94 @@
+from __future__ import annotations
+from typing import Callable, Optional
+
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+
+@dataclass
+class Stall:
+   """One stretch of time where the event loop was blocked
+
+   Attributes:
+      started: When the stall was first noticed (UTC)
+      lag: Seconds the loop was blocked for (grows until the loop recovers)
+      stack: Stack of the event loop thread while it was blocked
+   """
+   started: datetime
+   lag: float
+   stack: str
+
+class LoopWatchdog:
+   """Detects event loop stalls and captures what was blocking it
+
+   A tiny task on the loop beats every ``interval`` seconds. A monitor thread
+   checks the beat, and when it's more than ``threshold`` seconds late, takes
+   the loop thread's current stack (i.e. the blocking callback or coroutine)
+   and logs it.
+
+   Args:
+      threshold: Seconds of lag before a stall is captured; 0 disables the monitor thread
+      interval: Seconds between beats
+      on_lag: Called with the measured lag after every beat
+      keep: Number of recent stalls to remember
+
+   Attributes:
+      stalls: Recent stalls, newest last
+   """
+   def __init__(self, threshold: float=0.25, *, interval: float=0.1,
+      on_lag: Optional[Callable[[float], None]]=None, keep: int=20,
+   ) -> None:
+      self.threshold = threshold
+      self.interval = interval
+      self.on_lag = on_lag
+      self.stalls: deque[Stall] = deque(maxlen=keep)
+      self.log = logging.getLogger("swashbot.watchdog")
+      self.beat = time.monotonic()
+      self.loop_thread: Optional[int] = None
+      self.current: Optional[Stall] = None
+      self.stopped = threading.Event()
+      self.thread: Optional[threading.Thread] = None
+
+   async def run(self) -> None:
+      """Beat until cancelled, starting the monitor thread if enabled
+      """
+      self.loop_thread = threading.get_ident()
+      self.beat = time.monotonic()
+      if self.threshold > 0 and self.thread is None:
+         self.thread = threading.Thread(target=self.monitor, name="swashbot-watchdog", daemon=True)
+         self.thread.start()
+
+      try:
+         while True:
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - self.beat - self.interval)
+            self.beat = now
+            if self.on_lag is not None: self.on_lag(lag)
+            if self.current is not None:
+               self.current.lag = max(self.current.lag, lag)
+               self.log.warning(f"Event loop recovered after being blocked for {lag:.2f}s.")
+               self.current = None
+      finally:
+         self.stopped.set()
+
+   def monitor(self) -> None:
+      while not self.stopped.wait(self.threshold / 2):
+         late = time.monotonic() - self.beat - self.interval
+         if late < self.threshold: continue
+
+         if self.current is not None:
+            self.current.lag = max(self.current.lag, late)
+            continue
+
+         frame = sys._current_frames().get(self.loop_thread or 0)
+         stack = "".join(traceback.format_stack(frame)) if frame is not None else "(no stack)"
+         self.current = Stall(datetime.utcnow(), late, stack)
+         self.stalls.append(self.current)
+         self.log.warning(f"Event loop blocked for {late:.2f}s so far, here:\n{stack}")
@@ -0,0 +1,166 @@
+from __future__ import annotations
+from typing import Optional, AsyncIterator
+
+import asyncio
+import logging
+import multiprocessing
+import struct
+
+import discord
+
+from utils.purge import bulk_delete_cutoff, split_at_cliff, BULK_DELETE_LIMIT
+
+# batch format: little-endian channel ID, message count, then message IDs,
+# all unsigned 64-bit (snowflakes) except the 32-bit count
+_header = struct.Struct("<QI")
+
+def encode_batch(channel: int, ids: list[int]) -> bytes:
+   """Pack a channel ID and message IDs into a compact batch
+   """
+   return _header.pack(channel, len(ids)) + struct.pack(f"<{len(ids)}Q", *ids)
+
+def decode_batch(batch: bytes) -> tuple[int, list[int]]:
+   """Unpack a batch made by `encode_batch`
+
+   Returns:
+      tuple: Channel ID and list of message IDs.
+   """
+   channel, count = _header.unpack_from(batch)
+   ids = list(struct.unpack_from(f"<{count}Q", batch, _header.size))
+   return channel, ids
+
+def _worker_main(token: str, inbox: multiprocessing.Queue, outbox: multiprocessing.Queue, throttle: float) -> None:
+   asyncio.run(_work(token, inbox, outbox, throttle))
+
+async def _work(token: str, inbox: multiprocessing.Queue, outbox: multiprocessing.Queue, throttle: float) -> None:
+   """Delete messages from incoming batches until told to stop
+
+   Uses a REST-only client (no gateway connection), and sends back the
+   batch it handled along with a batch of the IDs actually deleted. Messages
+   young enough go out in bulk deletes, skipping pins (fetched once per
+   batch, since workers don't see pin events); the rest are deleted one by one.
+   """
+   log = logging.getLogger("swashbot.worker")
+   client = discord.Client(intents=discord.Intents.none())
+   await client.login(token)
+   loop = asyncio.get_running_loop()
+
+   try:
+      while True:
+         batch = await loop.run_in_executor(None, inbox.get)
+         if batch is None: break
+         channel, ids = decode_batch(batch)
+
+         deleted = []
+         young, old = split_at_cliff(ids, bulk_delete_cutoff())
+         if young:
+            try:
+               pinned = await _pinned(client, channel)
+            except discord.HTTPException as e:
+               log.warning(f"Couldn't fetch pins in channel {channel}, so I'll delete one at a time: {e}")
+               young, old = [], ids
+            else:
+               young = [id for id in young if id not in pinned]
+
+         for start in range(0, len(young), BULK_DELETE_LIMIT):
+            chunk = young[start:start + BULK_DELETE_LIMIT]
+            try:
+               if len(chunk) == 1:
+                  await client.http.delete_message(channel, chunk[0])
+               else:
+                  await client.http.delete_messages(channel, chunk)
+               deleted.extend(chunk)
+            except discord.Forbidden:
+               pass
+            except discord.HTTPException:
+               old = chunk + old
+
+         for id in old:
+            try:
+               message = await client.http.get_message(channel, id)
+               if message.get("pinned"): continue
+               await client.http.delete_message(channel, id)
+               deleted.append(id)
+            except (discord.NotFound, discord.Forbidden):
+               pass
+            except discord.HTTPException as e:
+               log.warning(f"Couldn't delete message {id} in channel {channel}: {e}")
+            await asyncio.sleep(throttle)
+
+         outbox.put((batch, encode_batch(channel, deleted)))
+   finally:
+      await client.close()
+
+async def _pinned(client: discord.Client, channel: int) -> set[int]:
+   pinned: set[int] = set()
+   before = None
+   while True:
+      page = await client.http.pins_from(channel, limit=50, before=before)
+      items = page.get("items", [])
+      pinned.update(int(item["message"]["id"]) for item in items)
+      if not page.get("has_more") or not items: return pinned
+      before = items[-1]["pinned_at"]
+
+class DeletionPool:
+   """Pool of worker processes that delete messages over REST
+
+   Keeps REST-heavy deletion backlogs out of the gateway process, so they
+   never delay heartbeats or event handling. Each channel always goes to the
+   same worker, which keeps its per-route rate limit in one place.
+
+   Args:
+      token: Bot token for the workers' REST clients
+      size: Number of worker processes
+      throttle: Seconds to wait between deletions, per worker
+
+   Attributes:
+      pending: Number of message IDs submitted but not yet reported back
+   """
+   def __init__(self, token: str, size: int, *, throttle: float) -> None:
+      context = multiprocessing.get_context("spawn")
+      self.inboxes = [context.Queue() for _ in range(size)]
+      self.outbox = context.Queue()
+      self.processes = [
+         context.Process(
+            target=_worker_main,
+            args=(token, inbox, self.outbox, throttle),
+            name=f"swashbot-deleter-{i}",
+            daemon=True,
+         )
+         for i, inbox in enumerate(self.inboxes)
+      ]
+      self.pending = 0
+
+   def __len__(self) -> int:
+      return len(self.processes)
+
+   def start(self) -> None:
+      for process in self.processes: process.start()
+
+   def submit(self, channel: int, ids: list[int]) -> None:
+      """Queue a batch of messages in one channel for deletion
+      """
+      if not ids: return
+      self.inboxes[channel % len(self.inboxes)].put(encode_batch(channel, ids))
+      self.pending += len(ids)
+
+   async def results(self) -> AsyncIterator[tuple[int, list[int], list[int]]]:
+      """Yield (channel ID, handled message IDs, deleted message IDs) as workers report back
+      """
+      loop = asyncio.get_running_loop()
+      while True:
+         result: Optional[tuple[bytes, bytes]] = await loop.run_in_executor(None, self.outbox.get)
+         if result is None: return
+         channel, handled = decode_batch(result[0])
+         _, deleted = decode_batch(result[1])
+         self.pending = max(0, self.pending - len(handled))
+         yield channel, handled, deleted
+
+   def close(self, timeout: float=5) -> None:
+      """Stop the workers and the `results` iterator
+      """
+      for inbox in self.inboxes: inbox.put(None)
+      for process in self.processes:
+         process.join(timeout)
+         if process.is_alive(): process.terminate()
+      self.outbox.put(None)